@@ -0,0 +1,81 @@
+-- Memory allocated by paxos:read() and paxos:get() on a cached record. Run it
+-- with:
+--
+--      luajit -e 'package.path="lib/?.lua;"..package.path' ben_alloc.lua
+--
+-- "dup" mode mimics a cache returning a deep copy on every hit, which was
+-- required before records are treated as copy-on-write. "shared" mode returns
+-- the cached table itself.
+
+local paxos = require( "acid.paxos" )
+local tableutil = require( "acid.tableutil" )
+
+local members = {}
+for i = 1, 5 do
+    members[ tostring( i ) ] = { ip='127.0.0.' .. i, port=9080 + i }
+end
+
+local cached = {
+    committed = {
+        ver = 1024,
+        val = {
+            view = { members },
+            leader = { ident='1', __expire=os.time() + 10 },
+            ec_meta = {
+                ec_name = 'x',
+                ec_policy = { nr_data=6, nr_parity=3 },
+            },
+        },
+        __tag = '1/1024',
+    },
+    paxos_round = { rnd={ 1025, '1' }, vrnd={ 0, '' } },
+}
+
+local function make_impl(dup)
+    return {
+        load = function( self, pobj )
+            if dup then
+                return tableutil.dup( cached, true )
+            end
+            return cached
+        end,
+        store = function() end,
+        lock = function() return {} end,
+        unlock = function() end,
+        time = function() return os.time() end,
+    }
+end
+
+local function ben(name, f, times)
+
+    collectgarbage( "collect" )
+    collectgarbage( "stop" )
+
+    local m0 = collectgarbage( "count" )
+    local t0 = os.clock()
+    for i = 1, times do
+        f()
+    end
+    local t1 = os.clock()
+    local m1 = collectgarbage( "count" )
+
+    collectgarbage( "restart" )
+
+    print( string.format( "%-12s %8.2f KB/op %10d op/s",
+                          name, ( m1 - m0 ) / times,
+                          math.floor( times / math.max( t1 - t0, 1e-9 ) ) ) )
+end
+
+local times = 10000
+
+for _, mode in ipairs( { 'dup', 'shared' } ) do
+
+    local p = paxos.new( { cluster_id='x', ident='1' }, make_impl( mode == 'dup' ) )
+
+    ben( mode .. ' read', function() p:read() end, times )
+    ben( mode .. ' get', function() p:local_get( 'leader' ) end, times )
+end
+
+-- shared record must be untouched
+assert( cached.committed.val.leader.__lease == nil )
+assert( cached.committed.val.leader.__expire ~= nil )
@@ -0,0 +1,72 @@
+-- Benchmark of codecs on paxos records and messages. Run it with:
+--
+--      resty -I lib ben_codec.lua
+--
+-- or with luajit and lua-cjson installed:
+--
+--      luajit -e 'package.path="lib/?.lua;"..package.path' ben_codec.lua
+
+local codec = require( "acid.codec" )
+
+local records = {
+    phase1 = { rnd={ 3, '1' }, ver_end=19 },
+    phase2 = {
+        rnd = { 3, '1' },
+        val = {
+            view = { { ['1']=1, ['2']=1, ['3']=1 } },
+            leader = { ident='1', __lease=10 },
+        },
+    },
+    record = {
+        committed = {
+            ver = 1024,
+            val = {
+                view = {
+                    { ['1']=1, ['2']=1, ['3']=1 },
+                    { ['1']=1, ['2']=1, ['4']=1 },
+                },
+                leader = { ident='1', __expire=1430000000.125 },
+                ec_meta = {
+                    ec_name = 'cluster-x',
+                    ec_policy = { nr_data=6, nr_parity=3 },
+                    ts = 1430000000,
+                },
+            },
+            __tag = '1/1024',
+        },
+        paxos_round = { rnd={ 1025, '1' }, vrnd={ 1025, '1' } },
+    },
+}
+
+function _ben(f, times)
+    local t0 = os.clock()
+    for i = 1, times do
+        f()
+    end
+    local t1 = os.clock()
+
+    return t1-t0
+end
+
+function ben(name, f)
+    local times = 100
+    local spent = 0
+    while spent < 1 do
+        times = times * 2
+        spent = _ben(f, times)
+    end
+
+    print( name, "spent:", spent, "times:", times, "rps:", math.floor(times/spent) )
+end
+
+for rname, rec in pairs( records ) do
+    for _, cname in ipairs( { 'json', 'msgpack' } ) do
+        local c = codec.get( cname )
+        local s = c.encode( rec )
+
+        print( rname, cname, "bytes:", #s )
+
+        ben( rname .. ' ' .. cname .. ' encode', function() c.encode( rec ) end )
+        ben( rname .. ' ' .. cname .. ' decode', function() c.decode( s ) end )
+    end
+end
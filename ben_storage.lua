@@ -0,0 +1,70 @@
+-- Benchmark of storage backends. Run it with resty:
+--
+--      resty --shdict 'paxos_shared_dict 10m' -I lib ben_storage.lua
+--
+-- It writes records to /tmp/paxos_ben.
+
+local tableutil = require( "acid.tableutil" )
+
+local backends = {
+    fs = require( "acid.impl.storage_ngx_fs" ),
+    wal = require( "acid.impl.storage_ngx_wal" ),
+}
+
+function _ben(f, times)
+    ngx.update_time()
+    local t0 = ngx.now()
+    for i = 1, times do
+        f(i)
+    end
+    ngx.update_time()
+    local t1 = ngx.now()
+
+    return t1-t0
+end
+
+function ben(name, f)
+    local times = 100
+    local spent = 0
+    while spent < 2 do
+        times = times * 2
+        spent = _ben(f, times)
+    end
+
+    print( name, " spent: ", spent, " times: ", times, " rps: ", math.floor(times/spent) )
+end
+
+os.execute( 'mkdir -p /tmp/paxos_ben' )
+
+for name, mod in pairs( backends ) do
+
+    local impl = mod.new( { sto_base_path='/tmp/paxos_ben' } )
+    local pobj = { cluster_id='ben_' .. name, ident='1' }
+
+    -- a round changes twice(promise and accept) for each commit
+    local val = { view={ { ['1']=1, ['2']=1, ['3']=1 } }, data=string.rep( 'x', 1024 ) }
+
+    ben( name .. ' store', function(i)
+        local committed = { ver=i, val=val }
+        local r = { committed=committed, paxos_round={ rnd={ i, '1' } } }
+
+        pobj.record = r
+        impl:store( pobj )
+
+        r = tableutil.dup( r, true )
+        r.paxos_round.vrnd = { i, '1' }
+        r.paxos_round.val = val
+        pobj.record = r
+        impl:store( pobj )
+
+        pobj.record = { committed={ ver=i + 1, val=val } }
+        impl:store( pobj )
+    end )
+
+    ben( name .. ' load', function(i)
+        impl:load( pobj, true )
+    end )
+
+    pobj.record = nil
+    impl:store( pobj )
+end
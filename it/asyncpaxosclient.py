@@ -0,0 +1,250 @@
+# Python 3 only, built on asyncio streams.
+#
+# The same commands as it.paxosclient, without a thread for each request:
+#
+#   async def main():
+#       cli = AsyncPaxosClient( '127.0.0.1', 9081, 'x', '1' )
+#       b = await cli.get( 'leader' )
+#       b = await cli.set( 'foo', 1 )
+#       cli.close()
+#
+# A command returns the response body and raises PaxosError if the body is
+# an error. Connections to a member are kept alive and reused.
+#
+# To query all members at once:
+#
+#   clis = [ AsyncPaxosClient( ip, port, 'x', ident ) for ... ]
+#   view = await latest( clis, 'view' )
+#
+# To run many operations, at most `concurrency` at a time:
+#
+#   rsts = await run_many( [ cli.get( 'i' ) for cli in clis ], concurrency=100 )
+
+import asyncio
+import json
+import urllib.parse
+
+from it.paxosclient import PaxosError
+
+class AsyncPaxosClient( object ):
+
+    api_uri_prefix = '/api'
+
+    def __init__( self, ip, port, cluster_id, ident, timeout=3, max_idle_conns=16 ):
+        self.ip = ip
+        self.port = port
+        self.cluster_id = cluster_id
+        self.ident = ident
+
+        # seconds to wait for a response, unless specified for a command.
+        self.timeout = timeout
+
+        self.max_idle_conns = max_idle_conns
+
+        # idle keep-alive connections: [ (reader, writer), ... ]
+        self.idle = []
+
+    async def send_cmd( self, cmd, reqbody=None, timeout=None ):
+
+        # returns { 'status':, 'headers':, 'body': } the same as
+        # it.paxosclient.PaxosClient.send_cmd
+
+        req = { 'cmd': cmd }
+        if reqbody is not None:
+            req.update( reqbody )
+
+        uri = self.make_uri( req )
+
+        body = b''
+        if reqbody is not None:
+            body = json.dumps( reqbody ).encode( 'utf-8' )
+
+        if timeout is None:
+            timeout = self.timeout
+
+        return await asyncio.wait_for( self.http( uri, body ), timeout )
+
+    async def request_ex( self, cmd, reqbody=None, timeout=None ):
+
+        rst = await self.send_cmd( cmd, reqbody=reqbody, timeout=timeout )
+
+        b = rst[ 'body' ]
+        if isinstance( b, dict ) and 'err' in b:
+            raise PaxosError( **b[ 'err' ] )
+
+        return b
+
+    async def get( self, key, ver=None ):
+        return await self.request_ex( 'get', _body( key=key, ver=ver ) )
+
+    async def set( self, key, val, ver=None ):
+        return await self.request_ex( 'set', _body( key=key, val=val, ver=ver ) )
+
+    async def read( self, ver=None ):
+        return await self.request_ex( 'read', _body( ver=ver ) )
+
+    async def get_or_elect_leader( self ):
+        return await self.request_ex( 'get_or_elect_leader', {} )
+
+    async def change_view( self, add=None, delete=None, merge=None ):
+        return await self.request_ex( 'change_view',
+                                      _body( add=add, merge=merge, **{ 'del': delete } ) )
+
+    async def phase3( self, ver, val ):
+        return await self.request_ex( 'phase3', { 'ver': ver, 'val': val } )
+
+    async def http( self, uri, body ):
+
+        for ii in range( 2 ):
+
+            reused = len( self.idle ) > 0
+            if reused:
+                reader, writer = self.idle.pop()
+            else:
+                reader, writer = await asyncio.open_connection( self.ip, self.port )
+
+            try:
+                head = ( 'GET {uri} HTTP/1.1\r\n'
+                         'Host: {ip}\r\n'
+                         'Content-Length: {l}\r\n'
+                         '\r\n' ).format( uri=uri, ip=self.ip, l=len( body ) )
+
+                writer.write( head.encode( 'utf-8' ) + body )
+                await writer.drain()
+
+                rst, keepalive = await _read_resp( reader )
+
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                # a pooled connection might have been closed by peer while idle.
+                if not reused or ii == 1:
+                    raise
+                continue
+
+            except BaseException:
+                # including cancellation by timeout
+                writer.close()
+                raise
+
+            if keepalive and len( self.idle ) < self.max_idle_conns:
+                self.idle.append( ( reader, writer ) )
+            else:
+                writer.close()
+
+            return rst
+
+    def close( self ):
+
+        for reader, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+    def make_uri( self, req ):
+
+        uri = self.api_uri_prefix \
+                + ('/{cluster_id}/{ident}/{cmd}'.format(
+                        cluster_id=self.cluster_id,
+                        ident=self.ident,
+                        cmd=req[ 'cmd' ],
+                ))
+
+        query_keys = [ 'ver' ]
+        q = {}
+        for k in query_keys:
+            if k in req:
+                q[ k ] = req[ k ]
+
+        uri += '?' + urllib.parse.urlencode( q )
+        return uri
+
+async def query_all( clients, cmd, reqbody=None, timeout=None ):
+
+    # send the same command to every client concurrently.
+    # returns { ident: body or exception }
+
+    rsts = await asyncio.gather(
+            *[ c.request_ex( cmd, reqbody=reqbody, timeout=timeout ) for c in clients ],
+            return_exceptions=True )
+
+    return dict( [ ( c.ident, r ) for c, r in zip( clients, rsts ) ] )
+
+async def latest( clients, key, timeout=None ):
+
+    # "get" key from every client, returns the body with the highest ver, or
+    # None if no member responded.
+
+    rsts = await query_all( clients, 'get', { 'key': key }, timeout=timeout )
+
+    best = None
+    for r in rsts.values():
+        if isinstance( r, BaseException ):
+            continue
+        if best is None or r.get( 'ver', 0 ) > best.get( 'ver', 0 ):
+            best = r
+
+    return best
+
+async def run_many( coros, concurrency=100 ):
+
+    # run coroutines with at most concurrency of them at a time. Results or
+    # exceptions are returned in the same order as coros.
+
+    sem = asyncio.Semaphore( concurrency )
+
+    async def _run( coro ):
+        async with sem:
+            return await coro
+
+    return await asyncio.gather( *[ _run( c ) for c in coros ],
+                                 return_exceptions=True )
+
+def _body( **kwargs ):
+    return dict( [ ( k, v ) for k, v in kwargs.items() if v is not None ] )
+
+async def _read_resp( reader ):
+
+    # returns response and if the connection can be reused.
+
+    line = await reader.readline()
+    if line == b'':
+        raise ConnectionError( 'connection closed before response' )
+
+    version, status = line.decode( 'latin-1' ).split( None, 2 )[ :2 ]
+    status = int( status )
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in ( b'\r\n', b'\n', b'' ):
+            break
+        k, v = line.decode( 'latin-1' ).split( ':', 1 )
+        headers[ k.strip().lower() ] = v.strip()
+
+    if headers.get( 'transfer-encoding', '' ).lower() == 'chunked':
+        bufs = []
+        while True:
+            size = await reader.readline()
+            size = int( size.split( b';', 1 )[ 0 ], 16 )
+            if size == 0:
+                # discard trailer
+                while ( await reader.readline() ) not in ( b'\r\n', b'\n', b'' ):
+                    pass
+                break
+            bufs.append( await reader.readexactly( size ) )
+            await reader.readexactly( 2 )
+        body = b''.join( bufs )
+    else:
+        body = await reader.readexactly( int( headers.get( 'content-length', 0 ) ) )
+
+    body = body.decode( 'utf-8' )
+    try:
+        body = json.loads( body )
+    except ValueError:
+        pass
+
+    keepalive = ( version == 'HTTP/1.1'
+                  and headers.get( 'connection', '' ).lower() != 'close' )
+
+    return { 'status': status,
+             'headers': headers,
+             'body': body, }, keepalive
@@ -1,6 +1,8 @@
 import errno
 import socket
 import select
+import threading
+import time
 
 class S2HttpError(Exception): pass
 class BadStatus(S2HttpError): pass
@@ -30,16 +32,113 @@ SEND_BLOCK_SIZE = 8192
 #   status = http.status
 #   headers = http.headers
 #   buf = http.read_body(50*MB)
+#
+#with a pool, the connection is put back to pool for next request once the
+#entire body is read:
+#   pool = ConnectionPool()
+#   http = Http('127.0.0.1', 6003, pool=pool)
+#
+#pipelined, requests are sent without waiting for responses, which are read
+#in the same order:
+#   http = Http('127.0.0.1', 6003)
+#   http.pipeline_request('/file/aa')
+#   http.pipeline_request('/file/bb')
+#   http.finish_request()
+#   buf = http.read_body(50*MB)   # of /file/aa
+#   http.finish_request()
+#   buf = http.read_body(50*MB)   # of /file/bb
+
+class ConnectionPool(object):
+
+    # Idle keep-alive connections by (ip, port), shared by threads.
+    # At most max_size idle connections are kept for one (ip, port), and a
+    # connection idle for more than max_idle seconds is closed.
+
+    def __init__(self, max_size=16, max_idle=30):
+
+        self.max_size = max_size
+        self.max_idle = max_idle
+
+        self.lock = threading.Lock()
+
+        # (ip, port): [ (sock, time_put), ... ], the latest at the end
+        self.conns = {}
+
+    def get(self, ip, port, timeout):
+
+        # returns a connected socket and if it is reused from pool.
+
+        key = (ip, port)
+
+        while True:
+
+            with self.lock:
+                conns = self.conns.get( key )
+                if not conns:
+                    break
+                sock, ts = conns.pop()
+
+            if time.time() - ts > self.max_idle or not _is_idle_alive( sock ):
+                _close( sock )
+                continue
+
+            sock.settimeout( timeout )
+            return sock, True
+
+        return _connect( ip, port, timeout ), False
+
+    def put(self, ip, port, sock):
+
+        now = time.time()
+        key = (ip, port)
+
+        with self.lock:
+            conns = self.conns.setdefault( key, [] )
+            expired = self._evict( conns, now )
+            if len( conns ) < self.max_size:
+                conns.append( ( sock, now ) )
+                sock = None
+
+        for s in expired:
+            _close( s )
+
+        if sock is not None:
+            _close( sock )
+
+    def clear(self):
+
+        with self.lock:
+            conns = self.conns
+            self.conns = {}
+
+        for cs in conns.values():
+            for sock, ts in cs:
+                _close( sock )
+
+    def _evict(self, conns, now):
+
+        expired = []
+        while len( conns ) > 0 and now - conns[ 0 ][ 1 ] > self.max_idle:
+            expired.append( conns.pop( 0 )[ 0 ] )
+
+        return expired
 
 class Http(object):
 
-    def __init__(self, ip, port, timeout = 60):
+    def __init__(self, ip, port, timeout = 60, pool = None):
 
         self.ip = ip
         self.port = port
         self.timeout = timeout
         self.sock = None
 
+        self.pool = pool
+        # if the current connection is reused from pool
+        self.reused = False
+
+        # number of requests sent and their responses not yet read
+        self.nr_pending = 0
+
         self.chunked = False
         self.chunk_left = None
         self.content_len = None
@@ -48,22 +147,18 @@ class Http(object):
         self.status = None
         self.headers = {}
 
-        self.recv_iter = None
+        # data received and not yet consumed, see _Recv
+        self.recv = None
 
     def __del__( self ):
+        self.close()
 
-        if self.recv_iter is not None:
-            try:
-                self.recv_iter.close()
-            except:
-                pass
-        self.recv_iter = None
+    def close( self ):
+
+        self.recv = None
 
         if self.sock is not None:
-            try:
-                self.sock.close()
-            except:
-                pass
+            _close( self.sock )
         self.sock = None
 
     def request(self, uri, method = 'GET', headers = {}):
@@ -76,17 +171,45 @@ class Http(object):
 
         self._reset_request()
 
+        # connection of the last request not entirely read
+        self.close()
+        self._connect()
+
+        self.sock.sendall( self._request_head( uri, method, headers ) )
+        self.nr_pending = 1
+
+    def pipeline_request( self, uri, method = 'GET', headers = {}, body = '' ):
+
+        # Send a request on the current connection without waiting for
+        # responses to the requests sent before. Responses are read in order
+        # by finish_request() and read_body(). A body must be entirely read
+        # before finish_request() for the next response.
+
+        if self.sock is None:
+            self._reset_request()
+            self._connect()
+
+        headers = dict( headers )
+        headers[ 'Content-Length' ] = len( body )
+
+        self.sock.sendall( self._request_head( uri, method, headers ) + body )
+        self.nr_pending += 1
+
+    def _connect( self ):
+
+        if self.pool is not None:
+            self.sock, self.reused = self.pool.get( self.ip, self.port, self.timeout )
+        else:
+            self.sock = _connect( self.ip, self.port, self.timeout )
+            self.reused = False
+
+    def _request_head( self, uri, method, headers ):
+
         sbuf = [ '{method} {uri} HTTP/1.1'.format( method=method, uri=uri ), ]
         sbuf += self._norm_headers(headers)
 
-        self.sock = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
-        self.sock.settimeout( self.timeout )
-        self.sock.connect( (self.ip, self.port) )
-
         sbuf.extend(['', ''])
-        msg = "\r\n".join( sbuf )
-
-        self.sock.sendall( msg )
+        return "\r\n".join( sbuf )
 
     def send_body( self, body ):
         if self.sock is None:
@@ -96,12 +219,19 @@ class Http(object):
 
     def finish_request( self ):
 
-        if self.status is not None:
+        if self.nr_pending == 0:
             raise ResponseNotReady()
 
-        self.recv_iter = _recv_loop( self.sock, self.timeout )
-        # swollow the first yield and let recv_iter wait for argument
-        self.recv_iter.next()
+        if self.status is not None and not self._is_body_done():
+            raise ResponseNotReady()
+
+        # responses of pipelined requests share one buffer of data already
+        # received.
+        if self.recv is None:
+            self.recv = _Recv( self.sock, self.timeout )
+
+        self._reset_response()
+        self.nr_pending -= 1
 
         self._load_resp_status()
         self._load_resp_headers()
@@ -111,9 +241,15 @@ class Http(object):
         if size is None or size < 0:
             raise ValueError('size error!')
 
+        # connection might have been put back to pool
+        if self._is_body_done():
+            return ''
+
         if self.chunked:
             buf = self._read_chunked(size)
             self.has_read += len(buf)
+            if self._is_body_done():
+                self._release()
             return buf
 
         if size > self.content_len - self.has_read:
@@ -122,10 +258,88 @@ class Http(object):
         buf = self._read(size)
         self.has_read += size
 
+        if self._is_body_done():
+            self._release()
+
         return buf
 
+    def read_body_into(self, buf):
+
+        # Read body into a writable buffer such as bytearray, as much as buf
+        # can hold. Data is received directly into buf if it is not yet
+        # buffered. Returns the number of bytes read, 0 if the entire body
+        # has been read.
+
+        # connection might have been put back to pool
+        if self._is_body_done():
+            return 0
+
+        mv = memoryview( buf )
+        size = len( mv )
+
+        if self.chunked:
+            n = 0
+            while n < size:
+                toread = self._chunk_avail( size - n )
+                if toread == 0:
+                    break
+                self.recv.read_into( mv[ n:n+toread ] )
+                self._chunk_consumed( toread )
+                n += toread
+        else:
+            n = min( size, self.content_len - self.has_read )
+            self.recv.read_into( mv[ :n ] )
+
+        self.has_read += n
+
+        if self._is_body_done():
+            self._release()
+
+        return n
+
+    def iter_body(self, block_size=1024*64):
+
+        # Yield body block by block. A block is a memoryview of a buffer
+        # reused by the next block thus it must be consumed before the next
+        # iteration:
+        #   for block in http.iter_body():
+        #       f.write( block )
+
+        buf = bytearray( block_size )
+        mv = memoryview( buf )
+
+        while not self._is_body_done():
+            n = self.read_body_into( mv )
+            if n == 0:
+                break
+            yield mv[ :n ]
+
+    def _is_body_done(self):
+        if self.chunked:
+            return self.chunk_left == 0
+        return self.has_read == self.content_len
+
+    def _release(self):
+
+        # put connection back to pool after the entire response is read.
+
+        if self.pool is None or self.sock is None or self.nr_pending > 0:
+            return
+
+        if self.headers.get( 'connection', '' ).lower() == 'close':
+            return
+
+        self.recv = None
+        self.pool.put( self.ip, self.port, self.sock )
+        self.sock = None
+
     def _reset_request(self):
 
+        self.nr_pending = 0
+        self._reset_response()
+
+    def _reset_response(self):
+
         self.chunked = False
         self.chunk_left = None
         self.content_len = None
@@ -149,10 +363,10 @@ class Http(object):
         return hs
 
     def _read(self, size):
-        return self.recv_iter.send( ( 'block', size ) )
+        return self.recv.read( size )
 
     def _readline(self):
-        return self.recv_iter.send( ( 'line', None ) )
+        return self.recv.readline()
 
     def _read_status(self):
 
@@ -233,87 +447,173 @@ class Http(object):
 
         return chunk_size
 
-    def _read_chunked(self, size):
+    def _chunk_avail(self, size):
 
-        buf = []
+        # Returns the number of bytes, at most size, that can be read from
+        # the current chunk. 0 means the entire body has been read.
 
         if self.chunk_left == 0:
-            return ''
+            return 0
 
-        while size > 0:
-
-            if self.chunk_left is None:
-                self.chunk_left = self._get_chunk_size()
+        if self.chunk_left is None:
+            self.chunk_left = self._get_chunk_size()
 
             if self.chunk_left == 0:
+                # discard trailer
+                while True:
+                    line = self._readline()
+                    if line == '':
+                        break
+                return 0
+
+        return min(size, self.chunk_left)
+
+    def _chunk_consumed(self, n):
+
+        self.chunk_left -= n
+
+        if self.chunk_left == 0:
+            self.recv.skip( len('\r\n') )
+            self.chunk_left = None
+
+    def _read_chunked(self, size):
+
+        buf = []
+
+        while size > 0:
+
+            toread = self._chunk_avail(size)
+            if toread == 0:
                 break
 
-            toread = min(size, self.chunk_left)
             buf.append( self._read(toread) )
+            self._chunk_consumed(toread)
 
             size -= toread
-            self.chunk_left -= toread
 
-            if self.chunk_left == 0:
-                self._read( len('\r\n') )
-                self.chunk_left = None
+        return ''.join(buf)
+
+def _connect( ip, port, timeout ):
+
+    sock = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+    sock.settimeout( timeout )
+    sock.connect( (ip, port) )
+    return sock
+
+def _close( sock ):
+    try:
+        sock.close()
+    except:
+        pass
+
+def _is_idle_alive( sock ):
+
+    # An idle keep-alive connection is readable only if peer closed it or
+    # sent something unexpected. Either way it can not be used.
 
-        if self.chunk_left != 0:
-            return ''.join(buf)
+    try:
+        evin, evout, everr = select.select( [ sock.fileno() ], [], [], 0 )
+    except (socket.error, select.error, ValueError):
+        return False
+
+    return len( evin ) == 0
+
+class _Recv(object):
+
+    # Receive buffer of a connection. Data received but not yet consumed is
+    # buf[start:end]. Lines are searched in buf in place, and a block larger
+    # than what is buffered is received directly into the caller's buffer.
+
+    def __init__(self, sock, timeout, size=LINE_RECV_LENGTH):
+
+        self.sock = sock
+        self.timeout = timeout
+
+        self.buf = bytearray( size )
+        self.view = memoryview( self.buf )
+        self.start = 0
+        self.end = 0
+
+    def readline(self):
 
-        # discard trailer
         while True:
-            line = self._readline()
-            if line == '':
-                break
 
-        self.chunk_left = 0
+            i = self.buf.find( '\r\n', self.start, self.end )
+            if i >= 0:
+                line = self.view[ self.start:i ].tobytes()
+                self.start = i + 2
+                return line
 
-        return ''.join(buf)
+            if self.end - self.start >= _MAXLINESIZE:
+                raise LineTooLong()
 
-def _recv_loop( sock, timeout ):
+            self._fill()
 
-    bufs = ['']
-    mode, size = yield
+    def read(self, size):
 
-    while True:
+        if self.end - self.start >= size:
+            rst = self.view[ self.start:self.start+size ].tobytes()
+            self.start += size
+            return rst
 
-        if mode == 'line':
+        buf = bytearray( size )
+        self.read_into( memoryview( buf ) )
+        return str( buf )
 
-            buf = bufs[ 0 ]
-            if '\r\n' in buf:
-                rst, buf = buf.split( '\r\n', 1 )
-                bufs[ 0 ] = buf
-                mode, size = yield rst
-                continue
-            else:
-                if len( buf ) >= _MAXLINESIZE:
-                    raise LineTooLong()
-                else:
-                    buf += _recv_raise( sock, timeout, LINE_RECV_LENGTH )[ 'buf' ]
-                    bufs[ 0 ] = buf
-                    continue
-        else:
-            total = len( bufs[ 0 ] )
-            while total < size:
-                bufs.append( _recv_raise( sock, timeout, size-total )[ 'buf' ] )
-                total += len(bufs[ -1 ])
-
-            rst = ''.join( bufs )
-            if size < len( rst ):
-                bufs = [ rst[ size: ] ]
-                rst = rst[ :size ]
+    def read_into(self, mv):
+
+        # fill memoryview mv entirely.
+
+        size = len( mv )
+
+        n = min( size, self.end - self.start )
+        if n > 0:
+            mv[ :n ] = self.view[ self.start:self.start+n ]
+            self.start += n
+
+        while n < size:
+            n += _recv_into_raise( self.sock, self.timeout, mv[ n: ] )
+
+    def skip(self, size):
+
+        while self.end - self.start < size:
+            self._fill()
+
+        self.start += size
+
+    def _fill(self):
+
+        # receive more data after buf[end], making room for it by moving
+        # buffered data to the head or by growing buf.
+
+        n = self.end - self.start
+
+        if n == 0:
+            self.start = self.end = 0
+
+        elif self.end == len( self.buf ):
+
+            if self.start > 0:
+                # regions might overlap
+                self.buf[ :n ] = self.view[ self.start:self.end ].tobytes()
             else:
-                bufs = [ '' ]
-            mode, size = yield rst
+                # a memoryview prevents bytearray from being resized.
+                self.view = None
+                self.buf.extend( bytearray( len( self.buf ) ) )
+                self.view = memoryview( self.buf )
 
-def _recv_raise( sock, timeout, size ):
+            self.start, self.end = 0, n
 
-    o = { 'buf':None }
+        self.end += _recv_into_raise( self.sock, self.timeout, self.view[ self.end: ] )
+
+def _recv_into_raise( sock, timeout, mv ):
+
+    size = len( mv )
+    n = 0
 
     for ii in range( 2 ):
         try:
-            o['buf'] = sock.recv( size )
+            n = sock.recv_into( mv, size )
             break
         except socket.error as e:
             if len(e.args) > 0 and e.args[ 0 ] == errno.EAGAIN:
@@ -327,9 +627,7 @@ def _recv_raise( sock, timeout, size ):
             else:
                 raise
 
-    if o['buf'] == '':
+    if n == 0:
         raise socket.error('want to read %d bytes, but read empty !' % size)
 
-    return o
-
-
+    return n
@@ -11,9 +11,23 @@ class PaxosClient( it.paxosclient.PaxosClient ):
 
     api_uri_prefix = '/api'
 
-    def __init__( self, ident ):
+    def __init__( self, ident, timeout=3 ):
         ip, port, cluster_id = ip_port_cid(ident)
-        super(PaxosClient, self).__init__(ip, port, cluster_id, ident)
+        super(PaxosClient, self).__init__(ip, port, cluster_id, ident, timeout=timeout)
+
+def enable_cache( view_ttl=5, inst_of=None ):
+    # serve get_leader and get_view of all PaxosClient from a shared cache.
+    it.paxosclient.PaxosClient.cache = it.paxosclient.ViewCache( view_ttl=view_ttl,
+                                                                 inst_of=inst_of )
+
+def disable_cache():
+    it.paxosclient.PaxosClient.cache = None
+
+def cache_stats():
+    cache = it.paxosclient.PaxosClient.cache
+    if cache is None:
+        return None
+    return cache.stats()
 
 def ip_port_cid(ident):
     ip = '127.0.0.1'
@@ -38,7 +52,22 @@ def init_view( ident, view_ids, ver=1 ):
                               'view': view,
                       } } )
 
-def request( cmd, ident, body=None ):
+def mset( ident, fields, ver=None ):
+    return PaxosClient( ident ).mset( fields, ver=ver )
+
+def read_history( ident, ver, key=None ):
+    return PaxosClient( ident ).read_history( ver, key=key )
+
+def changes_since( ident, ver ):
+    return PaxosClient( ident ).changes_since( ver )
+
+def watch( ident, key=None, ver=None, timeout=30 ):
+    return PaxosClient( ident ).watch( key=key, ver=ver, timeout=timeout )
+
+def send_many( ident, cmds, window=64 ):
+    return PaxosClient( ident ).send_many( cmds, window=window )
+
+def request( cmd, ident, body=None, timeout=3 ):
     if cmd == 'get_leader':
         cmd, body = 'get', {"key":"leader"}
 
@@ -46,8 +75,10 @@ def request( cmd, ident, body=None ):
         cmd, body = 'get', {"key":"view"}
 
     ip, port, cluster_id = ip_port_cid(ident)
-    return it.paxosclient.request(ip, port, cluster_id, ident, cmd, body=body)
+    return it.paxosclient.request(ip, port, cluster_id, ident, cmd, body=body,
+                                  timeout=timeout)
 
-def request_ex( cmd, to_ident, body=None ):
+def request_ex( cmd, to_ident, body=None, timeout=3 ):
     ip, port, cluster_id = ip_port_cid(to_ident)
-    return it.paxosclient.request_ex(ip, port, cluster_id, to_ident, cmd, body=body)
+    return it.paxosclient.request_ex(ip, port, cluster_id, to_ident, cmd, body=body,
+                                     timeout=timeout)
@@ -1,6 +1,10 @@
 
 import sys
+import copy
 import json
+import socket
+import threading
+import time
 import urllib
 
 import it.http
@@ -12,17 +16,270 @@ class PaxosError( Exception ):
         self.Code = argkv.get( 'Code' )
         self.Message = argkv.get( 'Message' )
 
+class ViewCache( object ):
+
+    # Cache of "get" of view and leader by (cluster_id, key), shared by
+    # threads. It is disabled by default, to enable it:
+    #   PaxosClient.cache = ViewCache()
+    #
+    # leader is served until its __lease passes and view for view_ttl
+    # seconds. Entries of a cluster are dropped once a response of the main
+    # instance shows a newer ver, or an error VerNotExist or DuringChange.
+    #
+    # inst_of must be the same function as inst_of of paxosserver if the
+    # server has it. Without it, every key is in the main instance.
+
+    keys = ( 'view', 'leader' )
+    invalidating_errors = ( 'VerNotExist', 'DuringChange' )
+
+    def __init__( self, view_ttl=5, lease_margin=1, inst_of=None ):
+
+        self.view_ttl = view_ttl
+
+        # function(key) returns the paxos instance name of a user key, or
+        # None for the main instance.
+        self.inst_of = inst_of
+
+        # seconds before a leader lease expires to stop serving it.
+        self.lease_margin = lease_margin
+
+        self.lock = threading.Lock()
+
+        # (cluster_id, key): { 'body':, 'expire': }
+        self.entries = {}
+
+        self.nr_hit = 0
+        self.nr_miss = 0
+        self.nr_invalidated = 0
+
+    def get_rst( self, cluster_id, cmd, reqbody ):
+
+        # returns the same as PaxosClient.send_cmd(), or None if not cached.
+
+        key = self._cacheable_key( cmd, reqbody )
+        if key is None:
+            return None
+
+        now = time.time()
+
+        with self.lock:
+            e = self.entries.get( ( cluster_id, key ) )
+            if e is None or e[ 'expire' ] <= now:
+                self.nr_miss += 1
+                return None
+            self.nr_hit += 1
+
+        body = copy.deepcopy( e[ 'body' ] )
+        if key == 'leader':
+            body[ 'val' ][ '__lease' ] = int( e[ 'expire' ] - now + self.lease_margin )
+
+        return { 'status': 200,
+                 'headers': {},
+                 'body': body, }
+
+    def update( self, cluster_id, cmd, reqbody, body ):
+
+        # update cache with a response body of any command to cluster_id.
+
+        if not isinstance( body, dict ):
+            return
+
+        err = body.get( 'err' )
+        if err is not None:
+            if isinstance( err, dict ) and err.get( 'Code' ) in self.invalidating_errors:
+                self.invalidate( cluster_id )
+            return
+
+        # ver of a key in another instance has nothing to do with ver of view
+        # and leader. See inst_of of paxosserver.
+        if self._in_main_inst( cmd, reqbody ) and isinstance( body.get( 'ver' ), int ):
+            self.invalidate( cluster_id, body[ 'ver' ] )
+
+        key = self._cacheable_key( cmd, reqbody )
+        if key is None or body.get( 'val' ) is None:
+            return
+
+        now = time.time()
+
+        if key == 'leader':
+            lease = None
+            if isinstance( body[ 'val' ], dict ):
+                lease = body[ 'val' ].get( '__lease' )
+            if not lease:
+                return
+            expire = now + lease - self.lease_margin
+        else:
+            expire = now + self.view_ttl
+
+        body = copy.deepcopy( body )
+
+        with self.lock:
+            e = self.entries.get( ( cluster_id, key ) )
+            if e is None or e[ 'body' ][ 'ver' ] <= body[ 'ver' ]:
+                self.entries[ ( cluster_id, key ) ] = { 'body': body, 'expire': expire }
+
+    def invalidate( self, cluster_id, ver=None ):
+
+        # drop entries of cluster_id, or only those older than ver.
+
+        with self.lock:
+            for k, e in list( self.entries.items() ):
+                if k[ 0 ] != cluster_id:
+                    continue
+                if ver is None or e[ 'body' ][ 'ver' ] < ver:
+                    del self.entries[ k ]
+                    self.nr_invalidated += 1
+
+    def clear( self ):
+        with self.lock:
+            self.entries = {}
+
+    def stats( self ):
+
+        with self.lock:
+            total = self.nr_hit + self.nr_miss
+            rate = 0.0
+            if total > 0:
+                rate = float( self.nr_hit ) / total
+
+            return { 'hit': self.nr_hit,
+                     'miss': self.nr_miss,
+                     'invalidated': self.nr_invalidated,
+                     'hit_rate': rate, }
+
+    def _cacheable_key( self, cmd, reqbody ):
+
+        # reading a specified ver is not served from cache.
+
+        if cmd != 'get' or reqbody is None or 'ver' in reqbody:
+            return None
+
+        key = reqbody.get( 'key' )
+        if key in self.keys:
+            return key
+
+        return None
+
+    def _in_main_inst( self, cmd, reqbody ):
+
+        if self.inst_of is None:
+            return True
+
+        reqbody = reqbody or {}
+
+        if cmd == 'mset':
+            keys = ( reqbody.get( 'fields' ) or {} ).keys()
+        else:
+            keys = [ reqbody.get( 'key' ) ]
+
+        for k in keys:
+            if k is not None and k not in self.keys and self.inst_of( k ) is not None:
+                return False
+
+        return True
+
+# keep-alive connections shared by all PaxosClient by default.
+default_pool = _http.ConnectionPool()
+
 class PaxosClient( object ):
 
     api_uri_prefix = '/api'
 
-    def __init__( self, ip, port, cluster_id, ident ):
+    # set to None to use a new connection for every command.
+    pool = default_pool
+
+    # a ViewCache to serve reading view and leader, None disables it.
+    cache = None
+
+    def __init__( self, ip, port, cluster_id, ident, timeout=3, pool=None ):
         self.ip = ip
         self.port = port
         self.cluster_id = cluster_id
         self.ident = ident
 
-    def send_cmd( self, cmd, reqbody=None ):
+        # seconds to wait for a response, unless specified for a command.
+        self.timeout = timeout
+
+        if pool is not None:
+            self.pool = pool
+
+    def send_cmd( self, cmd, reqbody=None, timeout=None ):
+
+        cache = self.cache
+
+        if cache is not None:
+            rst = cache.get_rst( self.cluster_id, cmd, reqbody )
+            if rst is not None:
+                return rst
+
+        uri, body = self.make_req( cmd, reqbody )
+
+        rst = self.http( uri, reqbody=body, timeout=timeout )
+
+        if cache is not None:
+            cache.update( self.cluster_id, cmd, reqbody, rst[ 'body' ] )
+
+        return rst
+
+    def send_many( self, cmds, timeout=None, window=64 ):
+
+        # send [ (cmd, reqbody), ... ] back-to-back on one connection and
+        # yield the result of each in the same order, the same as send_cmd()
+        # returns. At most window requests are sent ahead of the response
+        # being read.
+
+        cmds = list( cmds )
+
+        if timeout is None:
+            timeout = self.timeout
+
+        h = None
+        retried = False
+
+        # index of the next request to send and the next response to read
+        sent = 0
+        i = 0
+
+        while i < len( cmds ):
+
+            if h is None:
+                h = _http.Http( self.ip, self.port, timeout=timeout, pool=self.pool )
+
+            try:
+                while sent < len( cmds ) and sent - i < window:
+                    cmd, reqbody = cmds[ sent ]
+                    uri, reqbody = self.make_req( cmd, reqbody )
+                    h.pipeline_request( uri, body=reqbody or '' )
+                    sent += 1
+
+                h.finish_request()
+                body = h.read_body( 1024*1024 )
+
+            except socket.timeout:
+                h.close()
+                raise
+
+            except (socket.error, _http.S2HttpError):
+                h.close()
+                # a pooled connection might have been closed by peer while
+                # idle. Start again only if nothing has been returned.
+                if i > 0 or not h.reused or retried:
+                    raise
+                retried = True
+                h = None
+                sent = 0
+                continue
+
+            rst = self._make_rst( h, body )
+
+            if self.cache is not None:
+                cmd, reqbody = cmds[ i ]
+                self.cache.update( self.cluster_id, cmd, reqbody, rst[ 'body' ] )
+
+            i += 1
+            yield rst
+
+    def make_req( self, cmd, reqbody=None ):
 
         req = { 'cmd':cmd }
 
@@ -34,18 +291,97 @@ class PaxosClient( object ):
         if reqbody is not None:
             reqbody = json.dumps(reqbody)
 
-        return self.http( uri, reqbody=reqbody )
+        return uri, reqbody
 
-    def http( self, uri, reqbody=None ):
+    def mset( self, fields, ver=None ):
+
+        # update several fields of val in one paxos version.
+        # ver is the expected version to update from.
+
+        reqbody = { 'fields': fields }
+        if ver is not None:
+            reqbody[ 'ver' ] = ver
+
+        return self.send_cmd( 'mset', reqbody=reqbody )
+
+    def read_history( self, ver, key=None ):
+
+        # read a version retained in history of this member.
+
+        reqbody = { 'ver': ver }
+        if key is not None:
+            reqbody[ 'key' ] = key
+
+        return self.send_cmd( 'read_history', reqbody=reqbody )
+
+    def changes_since( self, ver ):
+
+        # changes from version ver to the latest in history of this member,
+        # oldest first:
+        #   { "ver": 5, "changes": [ { "ver": 4, "set": {}, "del": [] }, .. ] }
+
+        return self.send_cmd( 'changes_since', reqbody={ 'ver': ver } )
+
+    def watch( self, key=None, ver=None, timeout=30 ):
+
+        # iterate over versions committed on this member:
+        #   for rst in cli.watch( 'leader' ):
+        #       print rst[ 'ver' ], rst[ 'val' ]
+        #
+        # Each request blocks on server until a version newer than ver is
+        # committed or timeout seconds pass. The first one returns at once
+        # if ver is None.
+
+        while True:
+
+            reqbody = { 'timeout': timeout }
+            if key is not None:
+                reqbody[ 'key' ] = key
+            if ver is not None:
+                reqbody[ 'ver' ] = ver
+
+            rst = self.send_cmd( 'watch', reqbody=reqbody, timeout=timeout + 3 )
+            b = rst[ 'body' ]
+            if 'err' in b:
+                e = b[ 'err' ]
+                raise PaxosError( **e )
+
+            if ver is None or b[ 'ver' ] > ver:
+                ver = b[ 'ver' ]
+                yield b
+
+    def http( self, uri, reqbody=None, timeout=None ):
 
         reqbody = reqbody or ''
 
-        h = _http.Http( self.ip, self.port, timeout=3 )
-        h.send_request( uri, headers={ 'Content-Length': len( reqbody ) } )
-        h.send_body( reqbody )
-        h.finish_request()
+        if timeout is None:
+            timeout = self.timeout
+
+        for ii in range( 2 ):
+
+            h = _http.Http( self.ip, self.port, timeout=timeout, pool=self.pool )
+            try:
+                h.send_request( uri, headers={ 'Content-Length': len( reqbody ) } )
+                h.send_body( reqbody )
+                h.finish_request()
+
+                body = h.read_body( 1024*1024 )
+                break
+
+            except socket.timeout:
+                h.close()
+                raise
+
+            except (socket.error, _http.S2HttpError):
+                h.close()
+                # a pooled connection might have been closed by peer while idle.
+                if not h.reused or ii == 1:
+                    raise
+
+        return self._make_rst( h, body )
+
+    def _make_rst( self, h, body ):
 
-        body = h.read_body( 1024*1024 )
         try:
             body = json.loads( body )
         except:
@@ -83,15 +419,15 @@ def init_view( ip, port, cluster_id, ident, members ):
             }
     } )
 
-def request( ip, port, cluster_id, ident, cmd, body=None ):
+def request( ip, port, cluster_id, ident, cmd, body=None, timeout=3 ):
 
-    p = PaxosClient( ip, port, cluster_id, ident )
+    p = PaxosClient( ip, port, cluster_id, ident, timeout=timeout )
     rst = p.send_cmd(cmd, reqbody=body)
     return rst
 
-def request_ex( ip, port, cluster_id, ident, cmd, body=None ):
+def request_ex( ip, port, cluster_id, ident, cmd, body=None, timeout=3 ):
 
-    rst = request( ip, port, cluster_id, ident, cmd, body=body )
+    rst = request( ip, port, cluster_id, ident, cmd, body=body, timeout=timeout )
     b = rst[ 'body' ]
     if 'err' in b:
         e = b[ 'err' ]
@@ -1,4 +1,4 @@
-local json = require('cjson')
+local codec = require('acid.codec')
 local resty_lock = require("resty.lock")
 local tableutil = require("acid.tableutil")
 local strutil = require("acid.strutil")
@@ -13,6 +13,9 @@ local _M = { _VERSION  = '1.0' }
 -- use cache must be declare shared dict 'shared_dict_lock'
 -- in nginx configuration
 
+-- opts.codec is the codec(see acid.codec) to serialize value in shared dict,
+-- json by default.
+
 _M.shared_dict_lock = 'shared_dict_lock'
 
 _M.accessor = {
@@ -65,7 +68,7 @@ _M.accessor = {
             ngx.log(ngx.DEBUG, "get [", key, "] value from shdict cache: ", to_str(val))
             if val ~= nil then
 
-                val = json.decode( val )
+                val = ( opts.codec or codec.default ).decode( val )
 
                 return val
             end
@@ -82,7 +85,7 @@ _M.accessor = {
             end
 
             if val ~= nil then
-                val = json.encode(val)
+                val = ( opts.codec or codec.default ).encode(val)
             end
 
             dict:set( key, val, opts.exptime or 60 )
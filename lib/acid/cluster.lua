@@ -15,9 +15,16 @@ local _M = {
 
     max_dead = 4,
 
+    -- seconds an unreachable node is taken as down without probing it again
+    node_down_ttl = 5,
+
     _check = {},
     _longer = {},
     _dead = {},
+
+    -- { ["<ip>:<port>"]={ expire=, err=, errmes= } }, shared by all clusters
+    -- on the same node.
+    _node_down = {},
 }
 local _mt = { __index = _M }
 
@@ -33,6 +40,7 @@ function _M.new(impl, opt)
         admin_lease = opt.admin_lease,
 
         max_dead = opt.max_dead,
+        node_down_ttl = opt.node_down_ttl,
     }
     setmetatable( cluster, _mt )
     assert( cluster.admin_lease > 4, "lease must be long enough: > 4" )
@@ -115,6 +123,20 @@ function _M:is_check_needed( check_type, member_id )
     return false
 end
 
+function _M:next_check_time( member_id, t )
+    -- The earliest of t and the time any check of the cluster is due.
+    -- Expired ones are ignored: leader_check and cluster_check are not
+    -- reset any more once this member is no longer leader.
+    local now = self.impl:time()
+    for _, c in pairs( self._check ) do
+        local exptime = c[member_id.cluster_id]
+        if exptime ~= nil and exptime < t and exptime > now then
+            t = exptime
+        end
+    end
+    return t
+end
+
 function _M:reset_check_exptime( check_type, member_id, exptime )
     self._check[check_type] = self._check[check_type] or {}
 
@@ -368,13 +390,36 @@ function _M:find_down(paxos)
         return nil, err, errmes
     end
 
+    -- probe all members at once, thus dead members cost only one timeout.
+    local fs = {}
+    for ident, member in pairs(_members.val) do
+        fs[ident] = function()
+            local status, ts, mes = self:confirmed_status(paxos, ident, member)
+            return { status=status, ts=ts, mes=mes }
+        end
+    end
+
+    local rsts
+    if paxos.impl.run_all ~= nil then
+        rsts = paxos.impl:run_all( fs )
+    else
+        rsts = {}
+        for ident, f in pairs(fs) do
+            rsts[ident] = f()
+        end
+    end
+
     local down_members = {}
 
     for ident, member in pairs(_members.val) do
-        local status, ts, mes = self:confirmed_status(paxos, ident, member)
-        if status ~= 'alive' then
-            down_members[status] = down_members[status] or {}
-            table.insert( down_members[status], { ident, member, ts, mes } )
+
+        -- A probe that failed or was killed does not confirm the member is
+        -- alive. It is counted as down, but not taken as dead.
+        local r = rsts[ident] or { status='unknown', mes='probe failed' }
+
+        if r.status ~= 'alive' then
+            down_members[r.status] = down_members[r.status] or {}
+            table.insert( down_members[r.status], { ident, member, r.ts, r.mes } )
         end
     end
 
@@ -386,12 +431,13 @@ function _M:find_down(paxos)
     return down_members, nil, nil
 end
 
--- status: alive, die_away, restore, migrating, dead
+-- status: alive, die_away, restore, migrating, dead. find_down adds unknown
+-- for a member whose probe failed.
 function _M:confirmed_status(paxos, ident, member)
 
     local cluster_id = paxos.member_id.cluster_id
 
-    local rst, err, errmes = self:send_member_alive(paxos, ident)
+    local rst, err, errmes = self:send_member_alive(paxos, ident, member)
     if err == nil then
         self:record_down(cluster_id, ident, nil, nil)
         return 'alive', nil, nil
@@ -478,14 +524,54 @@ function _M:record_down(cluster_id, ident, time, status)
 
     return d[ident]
 end
-function _M:send_member_alive(paxos, ident)
+function _M:node_of(paxos, ident, member)
+
+    if self.impl.get_addrs == nil then
+        return nil
+    end
+
+    local ipports = self.impl:get_addrs(
+            {cluster_id=paxos.member_id.cluster_id, ident=ident}, member )
+    if ipports == nil or ipports[1] == nil then
+        return nil
+    end
+
+    return ipports[1][1] .. ':' .. ipports[1][2]
+end
+
+function _M:send_member_alive(paxos, ident, member)
+
+    -- A node failing to respond fails probes to all members on it for
+    -- node_down_ttl seconds. Errors responded by a member are not cached,
+    -- they are about the member, not the node.
+
+    local node
+    if member ~= nil then
+        node = self:node_of(paxos, ident, member)
+    end
+
+    local now = paxos.impl:time()
+
+    local down = node and self._node_down[node]
+    if down ~= nil and down.expire > now then
+        return nil, down.err, down.errmes
+    end
+
     local rst, err, errmes = paxos:send_req(ident, { cmd = "isalive", })
+
+    if node ~= nil then
+        if err ~= nil then
+            self._node_down[node] = {
+                expire = now + self.node_down_ttl, err = err, errmes = errmes }
+        else
+            self._node_down[node] = nil
+        end
+    end
+
     if err == nil and rst.err == nil then
         return nil, nil, nil
     end
 
-    local cluster_id = paxos.member_id.cluster_id
-
     if err == nil then
         local e = rst.err or {}
         err = e.Code
@@ -513,10 +599,12 @@ function _M:report_cluster(paxos, down_members)
     local tb = {}
     for status, members in pairs( down_members ) do
         for _, member in pairs( members ) do
-            local ident, mem, ts, mes = unpack( member )
+            local ident, mem, ts, mes = member[1], member[2], member[3], member[4]
             ts = ts or 0
-            if status ~= 'die_away'
-                or ts > math.max(60 * 60 * 4, self.dead_wait[status])  then
+            -- unknown is a failure of probing, not a status of the member.
+            if status ~= 'unknown'
+                and ( status ~= 'die_away'
+                      or ts > math.max(60 * 60 * 4, self.dead_wait[status]) ) then
                 table.insert(tb,
                     {status=status, index=mem.index, ident=ident, ts=ts, mes=mes})
             end
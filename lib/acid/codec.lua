@@ -0,0 +1,62 @@
+local _M = { _VERSION = "0.1" }
+
+local json = require( "cjson" )
+local msgpack = require( "acid.msgpack" )
+
+-- Codecs to serialize tables for transport, storage and cache.
+--
+--      local c = codec.get( 'msgpack' )
+--      local s = c.encode( { a=1 } )
+--      local t = c.decode( s )
+--
+-- decode raises error on invalid input, as cjson.decode does.
+--
+-- json is the default and the fallback for an unknown content type, since it
+-- is human readable for debugging.
+
+_M.json = {
+    name = 'json',
+    content_type = 'application/json',
+    encode = json.encode,
+    decode = json.decode,
+}
+
+_M.msgpack = {
+    name = 'msgpack',
+    content_type = 'application/x-msgpack',
+    encode = msgpack.encode,
+    decode = msgpack.decode,
+}
+
+_M.default = _M.json
+
+local by_content_type = {
+    [_M.json.content_type] = _M.json,
+    [_M.msgpack.content_type] = _M.msgpack,
+}
+
+function _M.get(name)
+
+    if name == nil then
+        return _M.default
+    end
+
+    local c = _M[ name ]
+    if type( c ) ~= 'table' or c.encode == nil then
+        return nil, 'InvalidArgument', 'unknown codec: ' .. tostring(name)
+    end
+    return c
+end
+
+function _M.by_content_type(content_type)
+
+    if content_type == nil then
+        return _M.default
+    end
+
+    -- strip parameters such as "; charset=utf-8"
+    local ct = content_type:match( '^%s*([^;%s]+)' )
+    return by_content_type[ ct ] or _M.default
+end
+
+return _M
@@ -15,6 +15,21 @@ local tableutil = require( "acid.tableutil" )
 --   status = h.status
 --   headers = h.headers
 --   buf = h:read_body( size )
+--
+--keep-alive:
+--   after the entire body has been read, a connection can be put back into
+--   the pool of ngx cosocket with:
+--   if h:is_keepalive() then
+--       h:set_keepalive( timeout, size )
+--   else
+--       h:close()
+--   end
+--   A following request to the same ip:port reuses it.
+--
+--   A pooled connection might have been closed by peer while idle. With
+--   opts.retry_stale, request() sends the request once more on a new
+--   connection, if the pooled one failed on connect or send, or was closed
+--   before any byte of response is received. A timeout is never retried.
 
 
 local DEF_PORT = 80
@@ -76,20 +91,27 @@ local function _load_resp_status( self )
     local line
     local err_code
     local err_msg
+    local partial
     local elems
 
     while true do
-        line, err_msg = _read_line( self )
+        line, err_msg, partial = _read_line( self )
         if err_msg ~= nil then
+            if partial ~= nil and partial ~= '' then
+                self.resp_started = true
+            end
             return 'SocketError', to_str('read status line:', err_msg)
         end
 
+        self.resp_started = true
+
         elems = strutil.split( line, ' ' )
         if table.getn(elems) < 3 then
             return 'BadStatus', to_str('invalid status line:', line)
         end
 
         status = tonumber( elems[2] )
+        self.http_ver = elems[1]
 
         if status == nil or status < 100 or status > 999 then
             return 'BadStatus', to_str('invalid status value:', status)
@@ -139,8 +161,17 @@ local function _load_resp_headers( self )
         self.headers[hname] = hvalue
     end
 
+    -- HTTP/1.1 keeps connection alive by default, HTTP/1.0 does not.
+    local conn = string.lower( self.headers['connection'] or '' )
+    if self.http_ver == 'HTTP/1.1' then
+        self.keepalive = conn ~= 'close'
+    else
+        self.keepalive = conn == 'keep-alive'
+    end
+
     if self.status == NO_CONTENT or self.status == NOT_MODIFIED
         or self.method == 'HEAD' then
+        self.body_end = true
         return nil, nil
     end
 
@@ -157,9 +188,15 @@ local function _load_resp_headers( self )
                     self.headers['content-length'])
         end
         self.cont_len = cont_len
+        if cont_len == 0 then
+            self.body_end = true
+        end
         return nil, nil
     end
 
+    -- body ends when connection is closed
+    self.keepalive = false
+
     return nil, nil
 end
 
@@ -278,13 +315,24 @@ function _M.new( _, ip, port, timeout )
         has_read = 0,
         cont_len = 0,
         body_end = false,
-        chunked  = false
+        chunked  = false,
+        keepalive = false,
+        resp_started = false,
+        retried = false,
     }
 
     return setmetatable( h, mt )
 end
 
-function _M.request( self, uri, opts )
+local function _is_stale( self, err_msg )
+    -- nothing received from a connection reused from pool: it was closed
+    -- by peer while idle.
+    return self:is_reused()
+        and not self.resp_started
+        and string.find( tostring( err_msg ), 'timeout' ) == nil
+end
+
+local function _request( self, uri, opts )
 
     local err_code, err_msg = self:send_request( uri, opts )
     if err_code ~= nil then
@@ -294,6 +342,28 @@ function _M.request( self, uri, opts )
     return self:finish_request()
 end
 
+function _M.request( self, uri, opts )
+
+    local err_code, err_msg = _request( self, uri, opts )
+
+    if err_code == 'SocketError' and opts ~= nil and opts.retry_stale
+        and _is_stale( self, err_msg ) then
+
+        self.sock:close()
+
+        -- start over on a new connection
+        local h = _M.new( nil, self.ip, self.port, self.timeout )
+        for k, v in pairs( h ) do
+            self[ k ] = v
+        end
+        self.retried = true
+
+        err_code, err_msg = _request( self, uri, opts )
+    end
+
+    return err_code, err_msg
+end
+
 function _M.send_request( self, uri, opts )
 
     opts = opts or {}
@@ -388,6 +458,16 @@ function _M.read_body( self, size )
     return buf, nil, nil
 end
 
+function _M.is_keepalive( self )
+    -- a connection is reusable only if the response has been entirely read.
+    return self.keepalive and self.body_end
+end
+
+function _M.is_reused( self )
+    local n = self.sock:getreusedtimes()
+    return n ~= nil and n > 0
+end
+
 function _M.set_keepalive( self, timeout, size )
     local rst, err_msg = self.sock:setkeepalive( timeout, size )
     if err_msg ~= nil then
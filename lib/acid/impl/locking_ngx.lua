@@ -14,7 +14,8 @@ function _M:lock(pobj, exptime)
         exptime = 60
     end
 
-    local lockname = table.concat( {'paxos', pobj.cluster_id, pobj.ident}, '/' )
+    -- pobj.inst is nil for the main paxos instance
+    local lockname = table.concat( {'paxos', pobj.cluster_id, pobj.ident, pobj.inst}, '/' )
 
     local _lock = resty_lock:new( "paxos_lock", { exptime=exptime, timeout=1 } )
     local elapsed, err = _lock:lock( lockname )
@@ -31,4 +32,19 @@ function _M:unlock(_lock)
     return nil
 end
 
+function _M:add_flag(key, exptime)
+
+    -- Set a flag seen by all workers for exptime seconds. Returns true if
+    -- it is set by this call, or false if it has already been set.
+
+    local ok, err = ngx.shared.paxos_shared_dict:add( key, true, exptime )
+    if not ok and err ~= 'exists' then
+        ngx.log( ngx.ERR, "add_flag: ", key, " ", tostring(err) )
+    end
+    return ok == true
+end
+function _M:del_flag(key)
+    ngx.shared.paxos_shared_dict:delete( key )
+end
+
 return _M
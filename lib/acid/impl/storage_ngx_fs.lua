@@ -1,10 +1,11 @@
 local _M = {}
 local _meta = { __index=_M }
 
-local json = require( "cjson" )
+local codec = require( "acid.codec" )
 local libluafs = require( "libluafs" )
 local strutil = require( "acid.strutil" )
 local cache = require( "acid.cache" )
+local lrucache = require( "acid.lrucache" )
 local tableutil = require("acid.tableutil")
 
 local SP_LEN = 1
@@ -19,12 +20,30 @@ local CHKSUM_END = CHKSUM_START + CHKSUM_LEN - 1
 
 local CONT_START = CHKSUM_END + SP_LEN + 1
 
+-- data version in file header tells the codec of content
+local ver_codecs = {
+    ["1"] = "json",
+    ["2"] = "msgpack",
+}
+local codec_vers = {
+    json = "1",
+    msgpack = "2",
+}
+
 function _M.new(opt)
 
     opt = opt or {}
 
     local e = {
-        sto_base_path = opt.sto_base_path or "/tmp"
+        sto_base_path = opt.sto_base_path or "/tmp",
+
+        -- codec to write record, 'json' or 'msgpack'. Files written in
+        -- either codec can be read.
+        sto_codec = opt.sto_codec,
+
+        -- decoded records cached in this worker, validated by a stamp in
+        -- shared dict that is changed on every store.
+        rec_cache = lrucache.new( opt.rec_cache_size or 1024 ),
     }
     setmetatable( e, _meta )
     return e
@@ -116,16 +135,20 @@ end
 function _M:get_path(pobj)
     -- local path = table.concat( { pobj.cluster_id, pobj.ident }, '/' )
 
-    local elts = {self.sto_base_path, pobj.cluster_id.."_"..pobj.ident..".paxos"}
+    local name = pobj.cluster_id.."_"..pobj.ident
+    if pobj.inst ~= nil then
+        name = name.."_"..pobj.inst
+    end
+
+    local elts = {self.sto_base_path, name..".paxos"}
     local path = table.concat(elts, "/")
     return path
 end
-function _M:_load(pobj)
+function _M:get_round_path(pobj)
+    return self:get_path(pobj) .. '.rnd'
+end
 
-    local path, err, errmes = self:get_path(pobj)
-    if err then
-        return nil, err, errmes
-    end
+local function _load_file(path)
 
     local raw, err, errmes = _read(path)
     if err then
@@ -137,8 +160,8 @@ function _M:_load(pobj)
     end
 
     local _ver = raw:sub( VER_START, VER_END )
-    local ver = tonumber(_ver)
-    if ver ~= 1 then
+    local c = codec.get( ver_codecs[ _ver ] or '' )
+    if c == nil then
         return nil, "StorageError", "data version is invalid: " .. _ver
     end
 
@@ -151,21 +174,180 @@ function _M:_load(pobj)
         return nil, "StorageError", "checksum unmatched: "..chksum .. ':' .. actual_chksum
     end
 
-    local o = json.decode( cont )
+    local ok, o = pcall( c.decode, cont )
+    if not ok then
+        return nil, "StorageError", "invalid " .. c.name .. ": " .. tostring(o)
+    end
     return o, nil, nil
 end
+local function _store_file(path, o, codec_name)
+
+    if o == nil then
+        ngx.log(ngx.INFO, "delete: ", path)
+        os.remove(path)
+        return nil, nil, nil
+    end
+
+    local _, err, errmes = _makedir( _base( path ) )
+    if err then
+        return nil, err, errmes
+    end
+
+    local c, err, errmes = codec.get( codec_name )
+    if err then
+        return nil, err, errmes
+    end
+
+    local cont = c.encode( o )
+
+    local ver = codec_vers[ c.name ]
+    local chksum = _chksum(cont)
+
+    _, err, errmes = _write(path, ver .. ' ' .. chksum .. ' ' .. cont )
+    if err then
+        return nil, err, errmes
+    end
+
+    return nil, nil, nil
+end
+
+local function _committed_ver(rec)
+    if rec == nil or rec.committed == nil then
+        return 0
+    end
+    return rec.committed.ver or 0
+end
+
+function _M:_load(pobj)
+
+    local path, err, errmes = self:get_path(pobj)
+    if err then
+        return nil, err, errmes
+    end
+
+    return _load_file(path)
+end
+function _M:_load_round(pobj)
+
+    local path, err, errmes = self:get_round_path(pobj)
+    if err then
+        return nil, err, errmes
+    end
+
+    return _load_file(path)
+end
+local function _cache_key(pobj)
+    -- pobj.inst is nil for the main paxos instance
+    return table.concat( {'paxos', pobj.cluster_id, pobj.ident, pobj.inst}, '/' )
+end
+
+local function _get_stamp(pobj)
+
+    local dict = ngx.shared.paxos_shared_dict
+    local skey = _cache_key(pobj) .. '/stamp'
+
+    local stamp = dict:get( skey )
+    if stamp == nil then
+        -- stamp has been evicted or never set. Start with current time so
+        -- that it never equals any stamp used before.
+        dict:add( skey, math.floor( ngx.now() * 1000 ) * 1000 )
+        stamp = dict:get( skey )
+    end
+    return stamp
+end
+
+function _M:invalidate(pobj)
+
+    -- Called after a record is stored. Records cached in every worker with
+    -- the previous stamp become stale.
+
+    local dict = ngx.shared.paxos_shared_dict
+    local skey = _cache_key(pobj) .. '/stamp'
+
+    local _, err = dict:incr( skey, 1 )
+    if err then
+        dict:delete( skey )
+    end
+
+    self.rec_cache:delete( _cache_key(pobj) )
+end
+
+_M._cache_key = _cache_key
+
+function _M:record_cache_stat()
+    return self.rec_cache:stat()
+end
+
 function _M:load(pobj, isupdate)
 
-    local key = table.concat( {'paxos', pobj.cluster_id, pobj.ident}, '/' )
+    -- Per worker lru cache is checked first, then shared dict cache and
+    -- file system.
+
+    local key = _cache_key(pobj)
+
+    -- read stamp before loading: a store in between makes it stale.
+    local stamp = _get_stamp(pobj)
+
+    -- Cached record is shared by all readers in this worker and must not be
+    -- modified. See base.init_rec().
+
+    if not isupdate and stamp ~= nil then
+        local r = self.rec_cache:get( key, stamp )
+        if r ~= nil then
+            return r, nil, nil
+        end
+    end
+
+    local r, err, errmes = self:_load_shared(pobj, isupdate)
+    if err then
+        return nil, err, errmes
+    end
+
+    if r ~= nil and stamp ~= nil then
+        self.rec_cache:set( key, r, stamp )
+    end
+
+    return r, nil, nil
+end
+function _M:_load_shared(pobj, isupdate)
+
+    -- A record is stored in 2 files: the main file has the entire record
+    -- written on commit. The round file has only paxos_round and the
+    -- committed version it is based on, written by promise and accept. The
+    -- round file overrides paxos_round of the main file only if they have
+    -- the same committed version.
+
+    local key = _cache_key(pobj)
+    -- cacheable() deep copies opts, thus self(which has rec_cache) must not
+    -- be in opts.args.
     local opts = { exptime = 60 * 30,
-                   args    = { self, pobj },
-                   flush = isupdate}
+                   flush = isupdate,
+                   codec = codec.get( self.sto_codec ) }
+
+    local function _load()
+        return _M._load(self, pobj)
+    end
 
-    local r, err, errmes = cache.cacheable( ngx.shared.paxos_shared_dict, key, _M._load, opts )
+    local r, err, errmes = cache.cacheable( ngx.shared.paxos_shared_dict, key, _load, opts )
     if err then
         return nil, err, errmes
     end
 
+    local function _load_round()
+        return _M._load_round(self, pobj)
+    end
+
+    local rnd, err, errmes = cache.cacheable( ngx.shared.paxos_shared_dict, key .. '/rnd',
+                                              _load_round, opts )
+    if err then
+        return nil, err, errmes
+    end
+
+    if rnd ~= nil and rnd.ver == _committed_ver(r) then
+        r = r or {}
+        r.paxos_round = rnd.paxos_round
+    end
+
     --temporary log error for debug cache
     if r ~= nil
         and r.committed ~= nil
@@ -178,36 +360,64 @@ function _M:load(pobj, isupdate)
 
     return r, nil, nil
 end
-function _M:store(pobj)
+function _M:_store(pobj)
 
     local path, err, errmes = self:get_path(pobj)
     if err then
         return nil, err, errmes
     end
 
-    if pobj.record == nil then
-        ngx.log(ngx.INFO, "delete: ", path)
-        os.remove(path)
-        self:load( pobj, true )
-        return nil, nil, nil
-    end
+    return _store_file(path, pobj.record, self.sto_codec)
+end
+function _M:_store_round(pobj)
 
-    local _, err, errmes = _makedir( _base( path ) )
+    local path, err, errmes = self:get_round_path(pobj)
     if err then
         return nil, err, errmes
     end
 
-    local cont = json.encode( pobj.record )
+    local rnd
+    if pobj.record ~= nil then
+        rnd = {
+            ver = _committed_ver(pobj.record),
+            paxos_round = pobj.record.paxos_round,
+        }
+    end
+
+    return _store_file(path, rnd, self.sto_codec)
+end
+function _M:store(pobj, opts)
 
-    local ver = "1"
-    local chksum = _chksum(cont)
+    -- opts.part = 'paxos_round' stores only paxos_round, leaving the
+    -- committed value untouched.
 
-    _, err, errmes = _write(path, ver .. ' ' .. chksum .. ' ' .. cont )
-    if err then
-        return nil, err, errmes
+    opts = opts or {}
+
+    local key = _cache_key(pobj)
+    local dict = ngx.shared.paxos_shared_dict
+
+    if opts.part ~= 'paxos_round' or pobj.record == nil then
+
+        -- The main file has paxos_round too, thus a stale round file is
+        -- just ignored by its committed version.
+        local _, err, errmes = self:_store(pobj)
+        if err then
+            return nil, err, errmes
+        end
+        dict:delete( key )
     end
 
-    self:load( pobj, true )
+    if opts.part == 'paxos_round' or pobj.record == nil then
+        local _, err, errmes = self:_store_round(pobj)
+        if err then
+            return nil, err, errmes
+        end
+    end
+
+    dict:delete( key .. '/rnd' )
+    self:invalidate(pobj)
+
+    return nil, nil, nil
 end
 
 return _M
@@ -1,7 +1,7 @@
 local _M = {}
 local _meta = { __index=_M }
 
-local json = require( "cjson" )
+local codec = require( "acid.codec" )
 local resty_mc = require( "resty.memcached" )
 
 local function new_mc()
@@ -20,51 +20,135 @@ local function new_mc()
     return mc
 end
 
+-- memcached flags of value tells the codec
+local flag_codecs = {
+    ["0"] = "json",
+    ["2"] = "msgpack",
+}
+local codec_flags = {
+    json = 0,
+    msgpack = 2,
+}
+
+local function _decode(v)
+    -- v is { data, flags } returned by memcached
+    local flags = tostring( v[ 2 ] or 0 )
+    local c = codec.get( flag_codecs[ flags ] or '' )
+    if c == nil then
+        return nil, "StorageError", "unknown codec flags: " .. flags
+    end
+
+    local ok, o = pcall( c.decode, v[ 1 ] )
+    if not ok or type( o ) ~= 'table' then
+        return nil, "StorageError", "invalid " .. c.name .. ": " .. tostring(o)
+    end
+    return o, nil, nil
+end
+
 function _M.new(opt)
 
-    local e = {}
+    opt = opt or {}
+
+    local e = {
+        -- codec to write record, 'json' or 'msgpack'
+        sto_codec = opt.sto_codec,
+    }
     setmetatable( e, _meta )
     return e
 end
 
+local function _key(pobj)
+    -- pobj.inst is nil for the main paxos instance
+    return table.concat( { pobj.cluster_id, pobj.ident, pobj.inst }, '/' )
+end
+
+local function _committed_ver(rec)
+    if rec == nil or rec.committed == nil then
+        return 0
+    end
+    return rec.committed.ver or 0
+end
+
 function _M:load(pobj)
 
+    -- paxos_round written by promise and accept is stored in a separate
+    -- key, along with the committed version it is based on.
+
     local mc = new_mc()
     if mc == nil then
-        return nil
+        return nil, "StorageError", "connect memcached"
     end
 
-    local o, flag, err = mc:get( table.concat( { pobj.cluster_id, pobj.ident }, '/' ) )
+    local mckey = _key(pobj)
+    local rst, err = mc:get( { mckey, mckey .. '/rnd' } )
     if err then
-        return nil
+        mc:close()
+        return nil, "StorageError", "get " .. mckey .. ", " .. tostring(err)
     end
 
     -- leave this to detect too many link
     -- mc:set_keepalive(10000, 100)
     mc:close()
 
+    local o = rst[ mckey ]
+    local rnd = rst[ mckey .. '/rnd' ]
+
+    local errmes
+
     if o ~= nil then
-        o = json.decode( o )
+        o, err, errmes = _decode( o )
+        if err then
+            return nil, err, mckey .. ": " .. errmes
+        end
+    end
+
+    if rnd ~= nil then
+        rnd, err, errmes = _decode( rnd )
+        if err then
+            return nil, err, mckey .. "/rnd: " .. errmes
+        end
+    end
+
+    if rnd ~= nil then
+        if rnd.ver == _committed_ver(o) then
+            o = o or {}
+            o.paxos_round = rnd.paxos_round
+        end
     end
+
     return o
 end
-function _M:store(pobj)
+function _M:store(pobj, opts)
+
+    opts = opts or {}
+
+    -- resolve codec before connecting, not to leave connection open on error.
+    local c, err = codec.get( self.sto_codec )
+    if err then
+        return nil, err, nil
+    end
+    local flags = codec_flags[ c.name ]
 
-    local ok, err
+    local ok
 
     local mc = new_mc()
     if mc == nil then
-        return nil, nil, nil
+        return nil, "StorageError", "connect memcached"
     end
 
-    local mckey = table.concat( { pobj.cluster_id, pobj.ident }, '/' )
+    local mckey = _key(pobj)
 
     -- record being nil means to delete
     if pobj.record == nil then
         ok, err = mc:delete(mckey)
+        mc:delete(mckey .. '/rnd')
+    elseif opts.part == 'paxos_round' then
+        local o = c.encode( { ver = _committed_ver(pobj.record),
+                              paxos_round = pobj.record.paxos_round } )
+        ok, err = mc:set( mckey .. '/rnd', o, 0, flags )
     else
-        local o = json.encode( pobj.record )
-        ok, err = mc:set( mckey, o )
+        local o = c.encode( pobj.record )
+        ok, err = mc:set( mckey, o, 0, flags )
     end
 
     -- set_keepalive()
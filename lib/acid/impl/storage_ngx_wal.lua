@@ -0,0 +1,344 @@
+local _M = {}
+local _meta = { __index=_M }
+
+-- Append-only storage. It is a drop-in replacement of storage_ngx_fs:
+--
+--      local impl = impl_ngx.new({ storage=require("acid.impl.storage_ngx_wal") })
+--
+-- Every store appends only what changed(promise, accept or commit) to a log
+-- file per member and fsync it. The log is compacted into a snapshot when it
+-- grows larger than wal_max_size. The snapshot has the same format as the
+-- file written by storage_ngx_fs, thus data of storage_ngx_fs is loaded as a
+-- snapshot without any conversion.
+--
+-- Appenders in one worker that are waiting for fsync of the same log are
+-- synced together with one fsync.
+
+local ffi = require( "ffi" )
+local semaphore = require( "ngx.semaphore" )
+local cache = require( "acid.cache" )
+local codec = require( "acid.codec" )
+local strutil = require( "acid.strutil" )
+local fs = require( "acid.impl.storage_ngx_fs" )
+local wal = require( "acid.paxos.wal" )
+
+setmetatable( _M, { __index=fs } )
+
+pcall( ffi.cdef, [[
+int open(const char *pathname, int flags, int mode);
+int close(int fd);
+long write(int fd, const void *buf, size_t count);
+int fsync(int fd);
+int ftruncate(int fd, long length);
+char *strerror(int errnum);
+]] )
+
+-- open(2) flags differ between OS.
+local open_flags = {
+    Linux = { O_RDONLY = 0x0000, O_WRONLY = 0x0001, O_CREAT = 0x0040, O_APPEND = 0x0400 },
+    OSX   = { O_RDONLY = 0x0000, O_WRONLY = 0x0001, O_CREAT = 0x0200, O_APPEND = 0x0008 },
+    BSD   = { O_RDONLY = 0x0000, O_WRONLY = 0x0001, O_CREAT = 0x0200, O_APPEND = 0x0008 },
+}
+
+local flags = open_flags[ ffi.os ]
+if flags == nil or ( ffi.os == 'Linux' and ffi.arch:sub( 1, 4 ) == 'mips' ) then
+    error( 'storage_ngx_wal: open(2) flags unknown on ' .. ffi.os .. '/' .. ffi.arch )
+end
+
+local O_RDONLY = flags.O_RDONLY
+local O_WRONLY = flags.O_WRONLY
+local O_CREAT = flags.O_CREAT
+local O_APPEND = flags.O_APPEND
+
+-- sync state of logs in this worker:
+-- { [path] = { appended=, synced=, syncing=, sema=, nr_wait= } }
+local syncs = {}
+
+function _M.new(opt)
+
+    opt = opt or {}
+
+    local e = fs.new(opt)
+    e.wal_max_size = opt.wal_max_size or 1024 * 64
+    -- seconds to wait for other appenders to share one fsync
+    e.wal_sync_delay = opt.wal_sync_delay or 0
+
+    setmetatable( e, _meta )
+    return e
+end
+
+local function _chksum(cont)
+    return string.format("%08x", ngx.crc32_long(cont))
+end
+
+local function _syserr(op, path)
+    return 'StorageError', op .. ' ' .. path .. ', ' .. ffi.string(ffi.C.strerror(ffi.errno()))
+end
+
+local function _fsync(path)
+    local fd = ffi.C.open(path, O_RDONLY, 0)
+    if fd < 0 then
+        return nil, _syserr('open', path)
+    end
+
+    local rc = ffi.C.fsync(fd)
+    ffi.C.close(fd)
+
+    if rc ~= 0 then
+        return nil, _syserr('fsync', path)
+    end
+    return nil, nil, nil
+end
+
+local function _size(path)
+    local f = io.open(path, "r")
+    if f == nil then
+        return 0
+    end
+    local size = f:seek("end")
+    f:close()
+    return size or 0
+end
+
+local function _append(path, cont)
+
+    local fd = ffi.C.open(path, bit.bor(O_WRONLY, O_CREAT, O_APPEND), 420) -- 0644
+    if fd < 0 then
+        return nil, _syserr('open', path)
+    end
+
+    local n = ffi.C.write(fd, cont, #cont)
+    ffi.C.close(fd)
+
+    if n ~= #cont then
+        return nil, _syserr('write', path)
+    end
+
+    return nil, nil, nil
+end
+
+local function _group_fsync(self, path)
+
+    -- The appender that finds no fsync running does the fsync. The others
+    -- wait on st.sema, which is posted once for each of them when it is done.
+
+    local st = syncs[path]
+    if st == nil then
+        local sema, err = semaphore.new()
+        if err then
+            return nil, 'StorageError', 'semaphore: ' .. tostring(err)
+        end
+        st = { appended = 0, synced = 0, syncing = false, sema = sema, nr_wait = 0 }
+        syncs[path] = st
+    end
+
+    st.appended = st.appended + 1
+    local mine = st.appended
+
+    while st.synced < mine do
+
+        if st.syncing then
+            st.nr_wait = st.nr_wait + 1
+            -- timeout only in case the fsync never returns
+            st.sema:wait(1)
+            st.nr_wait = st.nr_wait - 1
+        else
+            st.syncing = true
+
+            if self.wal_sync_delay > 0 then
+                ngx.sleep(self.wal_sync_delay)
+            end
+
+            local upto = st.appended
+            local _, err, errmes = _fsync(path)
+
+            st.syncing = false
+            if not err then
+                st.synced = upto
+            end
+
+            -- on error one of the waiters retries
+            if st.nr_wait > 0 then
+                st.sema:post(st.nr_wait)
+            end
+
+            if err then
+                return nil, err, errmes
+            end
+        end
+    end
+
+    return nil, nil, nil
+end
+
+function _M:get_wal_path(pobj)
+    return self:get_path(pobj) .. '.wal'
+end
+
+function _M:_compact(pobj, rec)
+
+    -- write record as snapshot, then empty the log.
+
+    local path = self:get_path(pobj)
+    local wal_path = self:get_wal_path(pobj)
+
+    local _, err, errmes = fs._store(self, { cluster_id=pobj.cluster_id,
+                                             ident=pobj.ident,
+                                             inst=pobj.inst,
+                                             record=rec })
+    if err then
+        return nil, err, errmes
+    end
+
+    local _, err, errmes = _fsync(path)
+    if err then
+        return nil, err, errmes
+    end
+
+    -- make rename durable
+    local elts = strutil.split( path, '/' )
+    elts[ #elts ] = nil
+    local _, err, errmes = _fsync(table.concat( elts, '/' ))
+    if err then
+        return nil, err, errmes
+    end
+
+    os.remove(self:get_round_path(pobj))
+
+    local fd = ffi.C.open(wal_path, O_WRONLY, 0)
+    if fd >= 0 then
+        ffi.C.ftruncate(fd, 0)
+        ffi.C.fsync(fd)
+        ffi.C.close(fd)
+    end
+
+    return nil, nil, nil
+end
+
+function _M:_load(pobj)
+
+    local rec, err, errmes = fs._load(self, pobj)
+    if err then
+        return nil, err, errmes
+    end
+
+    -- paxos_round left by storage_ngx_fs
+    local rnd, err, errmes = fs._load_round(self, pobj)
+    if err then
+        return nil, err, errmes
+    end
+
+    if rnd ~= nil and rec ~= nil and rnd.ver == rec.committed.ver then
+        rec.paxos_round = rnd.paxos_round
+    end
+
+    local wal_path = self:get_wal_path(pobj)
+    local f = io.open(wal_path, "r")
+    if f == nil then
+        return rec, nil, nil
+    end
+
+    local cont = f:read("*a")
+    f:close()
+
+    if cont == nil or cont == '' then
+        return rec, nil, nil
+    end
+
+    local entries, valid = wal.decode(cont, _chksum)
+    rec = wal.replay(rec, entries)
+
+    if valid < #cont then
+        ngx.log(ngx.ERR, "torn wal entry discarded: ", wal_path,
+                " at: ", valid, " size: ", #cont)
+
+        -- entries appended after the torn one would never be replayed
+        local _, err, errmes = self:_compact(pobj, rec)
+        if err then
+            return nil, err, errmes
+        end
+    end
+
+    return rec, nil, nil
+end
+
+function _M:_load_shared(pobj, isupdate)
+
+    local key = fs._cache_key(pobj)
+    -- cacheable() deep copies opts, thus self(which has rec_cache) must not
+    -- be in opts.args.
+    local opts = { exptime = 60 * 30,
+                   flush = isupdate,
+                   codec = codec.get( self.sto_codec ) }
+
+    local function _load()
+        return _M._load(self, pobj)
+    end
+
+    local r, err, errmes = cache.cacheable( ngx.shared.paxos_shared_dict, key, _load, opts )
+    if err then
+        return nil, err, errmes
+    end
+
+    return r, nil, nil
+end
+
+function _M:store(pobj, opts)
+
+    -- opts is ignored: only the changed part is appended anyway.
+
+    local wal_path = self:get_wal_path(pobj)
+
+    if pobj.record == nil then
+        fs._store(self, pobj)
+        fs._store_round(self, pobj)
+        os.remove(wal_path)
+        self:invalidate( pobj )
+        self:load( pobj, true )
+        return nil, nil, nil
+    end
+
+    local prev, err, errmes = self:load(pobj)
+    if err then
+        return nil, err, errmes
+    end
+
+    local entries = wal.make_entries(prev, pobj.record)
+    if #entries == 0 then
+        return nil, nil, nil
+    end
+
+    if prev == nil then
+        -- make sure base dir exists
+        local _, err, errmes = self:_compact(pobj, pobj.record)
+        if err then
+            return nil, err, errmes
+        end
+        self:invalidate( pobj )
+        self:load( pobj, true )
+        return nil, nil, nil
+    end
+
+    local _, err, errmes = _append(wal_path, wal.encode(entries, _chksum))
+    if err then
+        return nil, err, errmes
+    end
+
+    local _, err, errmes = _group_fsync(self, wal_path)
+    if err then
+        return nil, err, errmes
+    end
+
+    if _size(wal_path) > self.wal_max_size then
+        local _, err, errmes = self:_compact(pobj, pobj.record)
+        if err then
+            return nil, err, errmes
+        end
+    end
+
+    self:invalidate( pobj )
+    self:load( pobj, true )
+    return nil, nil, nil
+end
+
+return _M
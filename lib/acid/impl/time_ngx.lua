@@ -1,6 +1,8 @@
 local _M = {}
 local _meta = { __index=_M }
 
+local semaphore = require( "ngx.semaphore" )
+
 local counter = 0
 local function get_incr_num()
     counter = counter + 1
@@ -16,6 +18,10 @@ end
 function _M:sleep(n_sec)
     ngx.sleep(n_sec or 0.5)
 end
+function _M:new_sema()
+    -- ngx.semaphore works only among light threads in one worker.
+    return semaphore.new()
+end
 function _M:time()
     return ngx.time()
 end
@@ -55,4 +61,77 @@ function _M:wait_run(timeout, f, ...)
     return nil, "Timeout", timeout
 end
 
+function _M:run_async(f, ...)
+
+    -- Run f(...) in a timer without blocking current request.
+
+    local n = select( '#', ... )
+    local args = { ... }
+
+    local ok, err = ngx.timer.at( 0, function(premature)
+        if not premature then
+            f( unpack( args, 1, n ) )
+        end
+    end)
+    if not ok then
+        ngx.log( ngx.ERR, "run_async: ", tostring(err) )
+        return nil, "TimerError", err
+    end
+    return nil, nil, nil
+end
+
+function _M:run_all(fs, is_done)
+
+    -- Run every function in table fs in its own light thread and collect
+    -- the first return value of each by key.
+    --
+    -- It returns as soon as is_done(rsts) is true. Threads still running are
+    -- killed.
+
+    local cos = {}
+    local keys = {}
+    for k, f in pairs(fs) do
+        local co = ngx.thread.spawn(function()
+            local ok, rst = pcall(f)
+            if not ok then
+                ngx.log( ngx.ERR, "run_all: ", tostring(k), " ", tostring(rst) )
+                rst = nil
+            end
+            return k, rst
+        end)
+        table.insert( cos, co )
+        table.insert( keys, k )
+    end
+
+    local rsts = {}
+
+    while #cos > 0 do
+
+        local ok, k, rst = ngx.thread.wait(unpack(cos))
+        if not ok then
+            break
+        end
+
+        for i, _k in ipairs(keys) do
+            if _k == k then
+                table.remove( cos, i )
+                table.remove( keys, i )
+                break
+            end
+        end
+
+        rsts[ k ] = rst
+
+        if is_done ~= nil and is_done( rsts ) then
+            break
+        end
+    end
+
+    for _, co in ipairs(cos) do
+        ngx.thread.kill( co )
+    end
+
+    return rsts
+end
+
 return _M
@@ -1,14 +1,19 @@
 local _M = {}
 local _meta = { __index=_M }
 
-local json = require( "cjson" )
+local codec = require( "acid.codec" )
 local tableutil = require( "acid.tableutil" )
 local strutil = require( "acid.strutil" )
 local paxos = require( "acid.paxos" )
 local http = require( "acid.impl.http" )
+local rtt = require( "acid.rtt" )
+local semaphore = require( "ngx.semaphore" )
 
 local errors = paxos.errors
 
+-- requests being batched to each node: { ["<ip>:<port>"]={ pending=, sema= } }
+local batches = {}
+
 local _status = {
     OK = 200,
     BadRequest = 400,
@@ -32,19 +37,80 @@ local err_to_status = {
     [errors.DuringChange]     = _status.BadRequest,
     [errors.NoChange]         = _status.BadRequest,
     [errors.Conflict]         = _status.BadRequest,
+    [errors.InternalError]    = _status.InternalError,
+    [errors.DeltaMismatch]    = _status.BadRequest,
+    [errors.ViewMismatch]     = _status.BadRequest,
+    [errors.NotLeader]        = _status.BadRequest,
     ["."]                     = _status.BadRequest,
 }
 
 function _M.new(opt)
-    local e = {}
+    local e = {
+        -- send paxos messages to all acceptors concurrently
+        concurrent_send = opt.concurrent_send,
+
+        -- idle connections to peers are kept in cosocket pool.
+        -- keepalive_pool_size = 0 disables it.
+        keepalive_timeout = opt.keepalive_timeout or 60 * 1000, -- milliseconds
+        keepalive_pool_size = opt.keepalive_pool_size or 64,
+
+        -- codec name of messages sent to other members, 'json' or 'msgpack'.
+        -- Messages received are decoded according to their Content-Type.
+        codec = opt.codec,
+
+        -- seconds to wait for more requests to the same node to be sent
+        -- together in one http request. nil disables it. Receiving members
+        -- must support <api_uri>/batch.
+        batch_window = opt.batch_window,
+
+        -- milliseconds to wait for response from a peer. With timeout_min
+        -- set, it is derived from round trip time of recent requests to the
+        -- peer, which is kept in shared dict: srtt + 4 * rttvar, in range
+        -- [timeout_min, timeout_max].
+        timeout_min = opt.timeout_min,
+        timeout_max = opt.timeout_max or 6000,
+
+        -- a read-only request is sent again if there is no response in
+        -- srtt + hedge_k * rttvar milliseconds, and the first response is
+        -- used. It requires timeout_min. nil disables it.
+        hedge_k = opt.hedge_k,
+
+        -- seconds to keep round trip time of a peer not requested any more.
+        rtt_expire = opt.rtt_expire or 60 * 10,
+    }
     setmetatable( e, _meta )
     return e
 end
 
+function _M:chksum(cont)
+    return string.format( "%08x", ngx.crc32_long( cont ) )
+end
+
+local function _is_read_only(req)
+    -- phase3 with ver=0 reads committed from acceptor, see proposer:_remote_read()
+    return req.cmd == 'isalive' or ( req.cmd == 'phase3' and req.ver == 0 )
+end
+
+local function _rtt_key(ip, port)
+    return 'paxos_rtt/' .. ip .. ':' .. port
+end
+
 function _M:send_req(pobj, id, req)
 
+    -- only what paxosserver:_handle_batch() accepts is batched.
+    if self.batch_window ~= nil
+        and ( paxos.acceptor.is_cmd( req.cmd ) or req.cmd == 'isalive' ) then
+        return self:_batch_req(pobj, id, req)
+    end
+
+    return self:_send_req(pobj, id, req)
+end
+
+function _M:_send_req(pobj, id, req)
+
     req = tableutil.dup( req )
 
+    local read_only = _is_read_only( req )
     local uri = self.api_uri .. '/' .. table.concat({pobj.cluster_id, id, req.cmd}, '/')
     local query = ngx.encode_args({
         ver = req.ver
@@ -54,38 +120,309 @@ function _M:send_req(pobj, id, req)
     req.cmd = nil
     req.ver = nil
 
-    local body = json.encode( req )
+    local ip, port = self:_addr(pobj, id)
+
+    return self:_send(ip, port, uri .. '?' .. query, req, read_only)
+end
+
+function _M:_addr(pobj, id)
     local members = tableutil.union( pobj.view )
-    local ipports = self:get_addrs({cluster_id=req.cluster_id, ident=id}, members[id])
+    local ipports = self:get_addrs({cluster_id=pobj.cluster_id, ident=id}, members[id])
     local ipport = ipports[1]
-    local ip, port = ipport[1], ipport[2]
-    local timeout = 6000 -- milliseconds
-    local uri = uri .. '?' .. query
+    return ipport[1], ipport[2]
+end
+
+function _M:_send(ip, port, uri, req, read_only)
+
+    local c, err, errmes = codec.get( self.codec )
+    if err then
+        return nil, err, errmes
+    end
+
+    local body = c.encode( req )
+    local timeout, hedge = self:_timeout( ip, port, read_only )
 
     local args = {
         body = body,
+        headers = {
+            ['Content-Type'] = c.content_type,
+        },
+        -- a pooled connection might have been closed by peer while idle.
+        retry_stale = true,
     }
 
-    local h = http:new( ip, port, timeout )
-    local err, errmes = h:request( uri, args )
+    local resp, err, errmes = self:_timed_http_req( ip, port, timeout, uri, args, hedge )
     if err then
         self:track(
             "send_req-err:"..tostring(err)..','..tostring(errmes)
-            ..",to:"..tostring(args.ip)..":"..tostring(args.port)..tostring(args.url)
+            ..",to:"..tostring(ip)..":"..tostring(port)..tostring(uri)
         )
         return nil, err, errmes
     end
+
+    local rc = codec.by_content_type( resp.headers['content-type'] )
+    local rst, rbody = pcall(rc.decode, resp.body)
+    if not rst then
+        return nil, errors.InvalidMessage, "body is not valid " .. rc.name
+    end
+
+    return rbody
+end
+
+function _M:_timeout(ip, port, read_only)
+
+    -- Returns timeout for a request to ip:port and, for a read-only request,
+    -- milliseconds after which it is sent again.
+
+    if self.timeout_min == nil then
+        return self.timeout_max, nil
+    end
+
+    local dict = ngx.shared.paxos_shared_dict
+    local srtt, rttvar = rtt.decode( dict:get( _rtt_key( ip, port ) ) )
+
+    local timeout = rtt.timeout( srtt, rttvar, self.timeout_min, self.timeout_max )
+
+    local hedge
+    if read_only and self.hedge_k ~= nil and srtt ~= nil then
+        hedge = rtt.timeout( srtt, rttvar, self.timeout_min, timeout, self.hedge_k )
+        if hedge >= timeout then
+            hedge = nil
+        end
+    end
+
+    return timeout, hedge
+end
+
+function _M:_rtt_record(ip, port, ms)
+
+    local dict = ngx.shared.paxos_shared_dict
+    local key = _rtt_key( ip, port )
+
+    local srtt, rttvar = rtt.decode( dict:get( key ) )
+    srtt, rttvar = rtt.update( srtt, rttvar, ms )
+
+    dict:set( key, rtt.encode( srtt, rttvar ), self.rtt_expire )
+end
+
+function _M:_timed_http_req(ip, port, timeout, uri, args, hedge)
+
+    if self.timeout_min == nil then
+        return self:_http_req( ip, port, timeout, uri, args )
+    end
+
+    ngx.update_time()
+    local t0 = ngx.now()
+
+    local resp, err, errmes
+    if hedge ~= nil then
+        resp, err, errmes = self:_hedged_http_req( ip, port, timeout, uri, args, hedge )
+    else
+        resp, err, errmes = self:_http_req( ip, port, timeout, uri, args )
+    end
+
+    ngx.update_time()
+
+    if err == nil then
+        self:_rtt_record( ip, port, ( ngx.now() - t0 ) * 1000 )
+    elseif tostring( errmes ):find( 'timeout' ) then
+        -- back off: a timed out request counts as a round trip of timeout.
+        self:_rtt_record( ip, port, timeout )
+    end
+
+    return resp, err, errmes
+end
+
+local function _tagged_http_req(self, ...)
+    return 'resp', self:_http_req( ... )
+end
+
+local function _tagged_sleep(sec)
+    ngx.sleep( sec )
+    return 'timer'
+end
+
+function _M:_hedged_http_req(ip, port, timeout, uri, args, hedge)
+
+    -- Send the request again if there is no response in hedge milliseconds.
+    -- The first response is used and the other request is aborted.
+
+    local first = ngx.thread.spawn( _tagged_http_req, self, ip, port, timeout, uri, args )
+    local timer = ngx.thread.spawn( _tagged_sleep, hedge / 1000 )
+
+    local ok, tag, resp, err, errmes = ngx.thread.wait( first, timer )
+    if not ok then
+        ngx.thread.kill( first )
+        ngx.thread.kill( timer )
+        return nil, errors.InternalError, tostring( tag )
+    end
+
+    if tag == 'resp' then
+        ngx.thread.kill( timer )
+        return resp, err, errmes
+    end
+
+    self:track( "hedged:" .. tostring(ip) .. ":" .. tostring(port) .. tostring(uri) )
+
+    local second = ngx.thread.spawn( _tagged_http_req, self, ip, port, timeout, uri, args )
+
+    local ok, tag, resp, err, errmes = ngx.thread.wait( first, second )
+    ngx.thread.kill( first )
+    ngx.thread.kill( second )
+
+    if not ok then
+        return nil, errors.InternalError, tostring( tag )
+    end
+
+    return resp, err, errmes
+end
+
+function _M:_batch_req(pobj, id, req)
+
+    -- Requests to the same node within batch_window seconds are sent in one
+    -- request to <api_uri>/batch, see paxosserver:_handle_batch(). The batch
+    -- is sent from a timer, not by any of the callers, thus a caller being
+    -- killed, e.g. by run_all() once a quorum responded, does not stall the
+    -- others. Batches are per worker.
+    --
+    -- Callers wait on q.sema, which is posted once for each of them when
+    -- the batch is done.
+
+    local ip, port = self:_addr(pobj, id)
+    local node = ip .. ':' .. port
+
+    local q = batches[ node ]
+    if q == nil then
+
+        local sema, err = semaphore.new()
+        if err then
+            ngx.log( ngx.ERR, "batch semaphore: ", tostring(err) )
+            return self:_send_req(pobj, id, req)
+        end
+
+        q = { pending = {}, sema = sema }
+
+        local ok, err = ngx.timer.at( self.batch_window, function(premature)
+            self:_flush_batch( node, q, ip, port )
+        end)
+        if not ok then
+            ngx.log( ngx.ERR, "batch timer: ", tostring(err) )
+            return self:_send_req(pobj, id, req)
+        end
+
+        batches[ node ] = q
+    end
+
+    local job = { pobj = pobj, id = id, req = req, done = false }
+    table.insert( q.pending, job )
+
+    -- the batch is sent after batch_window and might be retried once on a
+    -- closed pooled connection.
+    local expire = ngx.now() + self.batch_window + self.timeout_max / 1000 * 2 + 1
+
+    while not job.done do
+        local now = ngx.now()
+        if now >= expire then
+            return nil, errors.InternalError, 'timeout waiting for batch to ' .. node
+        end
+        q.sema:wait( expire - now )
+    end
+
+    return job.rst, job.err, job.errmes
+end
+
+function _M:_flush_batch(node, q, ip, port)
+
+    -- requests arriving from now on go in a new batch.
+    if batches[ node ] == q then
+        batches[ node ] = nil
+    end
+
+    local jobs = q.pending
+    q.pending = {}
+
+    local ok, err = pcall( self._send_batch, self, ip, port, jobs )
+    if not ok then
+        for _, j in ipairs( jobs ) do
+            if not j.done then
+                j.err = errors.InternalError
+                j.errmes = tostring( err )
+                j.done = true
+            end
+        end
+    end
+
+    q.sema:post( #jobs )
+end
+
+function _M:_send_batch(ip, port, jobs)
+
+    -- Result of each job is set in job.rst or job.err, job.errmes.
+
+    if #jobs == 1 then
+        local j = jobs[1]
+        j.rst, j.err, j.errmes = self:_send_req( j.pobj, j.id, j.req )
+        j.done = true
+        return
+    end
+
+    local reqs = {}
+    for i, j in ipairs( jobs ) do
+        local r = tableutil.dup( j.req )
+        r.cluster_id = j.pobj.cluster_id
+        r.ident = j.id
+        reqs[ i ] = r
+    end
+
+    local rst, err, errmes = self:_send( ip, port, self.api_uri .. '/batch', { reqs = reqs } )
+    if err == nil and type( rst ) ~= 'table' then
+        err, errmes = errors.InvalidMessage, 'batch response is not table'
+    end
+
+    for i, j in ipairs( jobs ) do
+        if err then
+            j.err, j.errmes = err, errmes
+        elseif rst.err ~= nil then
+            -- the batch itself failed, every request fails the same way.
+            j.rst = rst
+        elseif type( rst.rsts ) ~= 'table' or rst.rsts[ i ] == nil then
+            j.err, j.errmes = errors.InvalidMessage, 'no response in batch: ' .. i
+        else
+            j.rst = rst.rsts[ i ]
+        end
+        j.done = true
+    end
+end
+
+function _M:_http_req(ip, port, timeout, uri, args)
+
+    -- Returns { body=, headers= }.
+
+    local h = http:new( ip, port, timeout )
+    local err, errmes = h:request( uri, args )
+
+    if h.retried then
+        self:track( "retry-stale:" .. tostring(ip) .. ":" .. tostring(port) .. tostring(uri) )
+    end
+
+    if err then
+        h:close()
+        return nil, err, errmes
+    end
+
     local rstbody, err, errmes = h:read_body( 1024*1024 )
     if err then
+        h:close()
         return nil, err, errmes
     end
 
-    local rst, jbody = pcall(json.decode, rstbody)
-    if not rst then
-        return nil, errors.InvalidMessage, "body is not valid json"
+    if self.keepalive_pool_size > 0 and h:is_keepalive() then
+        h:set_keepalive( self.keepalive_timeout, self.keepalive_pool_size )
+    else
+        h:close()
     end
 
-    return jbody
+    return { body = rstbody, headers = h.headers }, nil, nil
 end
 
 function _M:api_recv()
@@ -101,17 +438,27 @@ function _M:api_recv()
         ident = ident,
         cmd = cmd,
     }
+
+    -- <api_uri>/batch carries several requests in body.reqs
+    if uri == 'batch' then
+        uri_args = { cmd = 'batch' }
+    end
     local query_args = ngx.req.get_uri_args()
     query_args.ver = tonumber( query_args.ver )
 
+    -- respond with the same codec as request
+    local c = codec.by_content_type( ngx.var.content_type )
+    ngx.ctx.paxos_codec = c
+
     ngx.req.read_body()
     local body = ngx.req.get_body_data()
     local req = {}
     if body ~= "" and body ~= nil then
-        req = json.decode( body )
-        if req == nil then
-            self:track( "api_recv-err:BodyIsNotJson" )
-            return nil, errors.InvalidMessage, "body is not valid json"
+        local ok
+        ok, req = pcall( c.decode, body )
+        if not ok or type( req ) ~= 'table' then
+            self:track( "api_recv-err:BodyIsNot" .. c.name )
+            return nil, errors.InvalidMessage, "body is not valid " .. c.name
         end
     end
 
@@ -129,7 +476,10 @@ function _M:api_resp(rst)
         code = _status.OK
     end
 
-    rst = json.encode( rst )
+    local c = ngx.ctx.paxos_codec or codec.default
+
+    rst = c.encode( rst )
+    ngx.header[ 'Content-Type' ] = c.content_type
     ngx.status = code
     ngx.print( rst )
     ngx.eof()
@@ -0,0 +1,102 @@
+local _M = {}
+local _meta = { __index=_M }
+
+local semaphore = require( "ngx.semaphore" )
+
+-- Version committed on this member is kept in shared dict so that a request
+-- in any worker waiting for a newer version sees it:
+--
+--      ["paxos_watch/<cluster_id>/<ident>[/<inst>]"] = ver
+--
+-- Waiters in the worker committing a version are woken up at once by a
+-- semaphore posted in watch_notify. ngx.semaphore does not work across
+-- workers, thus waiters also poll shared dict, every watch_interval seconds
+-- at first and backing off to watch_max_interval.
+
+-- waiters of this worker: { [key]={ sema=, nr= } }
+local waiting = {}
+
+function _M.new(opt)
+
+    opt = opt or {}
+
+    local e = {
+        watch_interval = opt.watch_interval or 0.05,
+        watch_max_interval = opt.watch_max_interval or 1,
+    }
+    setmetatable( e, _meta )
+    return e
+end
+
+local function _watch_key(pobj)
+    -- pobj.inst is nil for the main paxos instance
+    return table.concat( {'paxos_watch', pobj.cluster_id, pobj.ident, pobj.inst}, '/' )
+end
+
+function _M:watch_notify(pobj, ver)
+
+    local dict = ngx.shared.paxos_shared_dict
+    local key = _watch_key(pobj)
+
+    local cur = dict:get( key )
+    if cur ~= nil and ver <= cur then
+        return
+    end
+
+    dict:set( key, ver )
+
+    local w = waiting[ key ]
+    if w ~= nil then
+        w.sema:post( w.nr )
+    end
+end
+
+function _M:watch_wait(pobj, ver, timeout)
+
+    -- Returns the version newer than ver once it is committed, or nil if
+    -- timeout(in seconds) passes.
+
+    local dict = ngx.shared.paxos_shared_dict
+    local key = _watch_key(pobj)
+    local expire = ngx.now() + timeout
+
+    local w = waiting[ key ]
+    if w == nil then
+        local sema, err = semaphore.new()
+        if err then
+            return nil, 'InternalError', 'semaphore: ' .. tostring(err)
+        end
+        w = { sema=sema, nr=0 }
+        waiting[ key ] = w
+    end
+    w.nr = w.nr + 1
+
+    local interval = self.watch_interval
+    local rst
+
+    while true do
+
+        local cur = dict:get( key )
+        if cur ~= nil and cur > ver then
+            rst = cur
+            break
+        end
+
+        local now = ngx.now()
+        if now >= expire then
+            break
+        end
+
+        w.sema:wait( math.min( interval, expire - now ) )
+        interval = math.min( interval * 2, self.watch_max_interval )
+    end
+
+    w.nr = w.nr - 1
+    if w.nr == 0 and waiting[ key ] == w then
+        waiting[ key ] = nil
+    end
+
+    return rst, nil, nil
+end
+
+return _M
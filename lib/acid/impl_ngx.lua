@@ -9,19 +9,33 @@ local time = require("acid.impl.time_ngx")
 local logging = require("acid.impl.logging_ngx")
 local userdata = require("acid.impl.userdata")
 local member = require("acid.impl.member")
+local watch = require("acid.impl.watch_ngx")
 
-tableutil.merge( _M, transport, storage, locking, time, logging, userdata, member )
+tableutil.merge( _M, transport, storage, locking, time, logging, userdata, member, watch )
 
 function _M.new(opt)
     local e = {}
+
+    -- opt.storage replaces the default storage module, e.g.:
+    -- require("acid.impl.storage_ngx_wal")
+    local sto = opt.storage or storage
+    if sto ~= storage then
+        for k, v in pairs( sto ) do
+            if type( v ) == 'function' and k ~= 'new' then
+                e[ k ] = v
+            end
+        end
+    end
+
     tableutil.merge( e,
                      transport.new(opt),
-                     storage.new(opt),
+                     sto.new(opt),
                      locking.new(opt),
                      time.new(opt),
                      logging.new(opt),
                      userdata.new(opt),
-                     member.new(opt)
+                     member.new(opt),
+                     watch.new(opt)
                      )
     setmetatable( e, _meta )
     return e
@@ -0,0 +1,125 @@
+local _M = { _VERSION = "0.1" }
+
+-- A bounded LRU cache in lua table, it is per worker thus no lock is needed.
+--
+--      local c = lrucache.new( 1024 )
+--      c:set( 'key', { ... } )
+--      local v = c:get( 'key' )
+--      c:delete( 'key' )
+--      c:stat() -- { hits=, misses=, stales=, evictions=, size=, capacity= }
+--
+-- An optional stamp can be set along with a value. get() with a different
+-- stamp treats the value as stale and removes it:
+--
+--      c:set( 'key', { ... }, 3 )
+--      c:get( 'key', 3 ) -- value
+--      c:get( 'key', 4 ) -- nil
+
+local _meth = { _VERSION = _M._VERSION }
+local _mt = { __index = _meth }
+
+function _M.new(capacity)
+
+    -- head.next is the most recently used, head.prev the least.
+    local head = {}
+    head.prev = head
+    head.next = head
+
+    local c = {
+        capacity = capacity or 1024,
+        size = 0,
+        nodes = {},
+        head = head,
+
+        hits = 0,
+        misses = 0,
+        stales = 0,
+        evictions = 0,
+    }
+    return setmetatable( c, _mt )
+end
+
+local function _unlink(node)
+    node.prev.next = node.next
+    node.next.prev = node.prev
+end
+
+local function _push_front(head, node)
+    node.next = head.next
+    node.prev = head
+    head.next.prev = node
+    head.next = node
+end
+
+function _meth:get(key, stamp)
+
+    local node = self.nodes[ key ]
+    if node == nil then
+        self.misses = self.misses + 1
+        return nil
+    end
+
+    if node.stamp ~= stamp then
+        self.misses = self.misses + 1
+        self.stales = self.stales + 1
+        self:delete( key )
+        return nil
+    end
+
+    self.hits = self.hits + 1
+
+    _unlink( node )
+    _push_front( self.head, node )
+
+    return node.val
+end
+
+function _meth:set(key, val, stamp)
+
+    local node = self.nodes[ key ]
+    if node ~= nil then
+        node.val = val
+        node.stamp = stamp
+        _unlink( node )
+        _push_front( self.head, node )
+        return
+    end
+
+    if self.size >= self.capacity then
+        local last = self.head.prev
+        _unlink( last )
+        self.nodes[ last.key ] = nil
+        self.size = self.size - 1
+        self.evictions = self.evictions + 1
+    end
+
+    node = { key = key, val = val, stamp = stamp }
+    _push_front( self.head, node )
+    self.nodes[ key ] = node
+    self.size = self.size + 1
+end
+
+function _meth:delete(key)
+
+    local node = self.nodes[ key ]
+    if node == nil then
+        return
+    end
+
+    _unlink( node )
+    self.nodes[ key ] = nil
+    self.size = self.size - 1
+end
+
+function _meth:stat()
+    return {
+        hits = self.hits,
+        misses = self.misses,
+        stales = self.stales,
+        evictions = self.evictions,
+        size = self.size,
+        capacity = self.capacity,
+    }
+end
+
+return _M
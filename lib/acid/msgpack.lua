@@ -0,0 +1,335 @@
+local _M = { _VERSION = "0.1" }
+
+-- A pure lua implementation of a subset of msgpack:
+--
+--      nil, boolean, number(integer or float64), string, array and map.
+--
+-- A table is encoded as an array if its keys are exactly 1..n, n > 0.
+-- Otherwise it is encoded as a map. Thus an empty table is an empty map, the
+-- same as cjson does.
+--
+-- Integers are exact in range [-2^53, 2^53]. Negative integers less than
+-- -2^31 are encoded as float64.
+
+local byte = string.byte
+local char = string.char
+local sub = string.sub
+local floor = math.floor
+local frexp = math.frexp
+local ldexp = math.ldexp
+local concat = table.concat
+
+local function _be(n, nbytes)
+    -- n must be an non-negative integer
+    local b = {}
+    for i = nbytes, 1, -1 do
+        b[ i ] = n % 256
+        n = floor( n / 256 )
+    end
+    return char( unpack( b ) )
+end
+
+local function _float64(n)
+
+    local sign = 0
+    if n < 0 or ( n == 0 and 1 / n < 0 ) then
+        sign = 0x80
+        n = -n
+    end
+
+    if n ~= n then
+        return char( 0xcb, 0x7f, 0xf8, 0, 0, 0, 0, 0, 0 )
+    elseif n == math.huge then
+        return char( 0xcb, sign + 0x7f, 0xf0, 0, 0, 0, 0, 0, 0 )
+    elseif n == 0 then
+        return char( 0xcb, sign, 0, 0, 0, 0, 0, 0, 0 )
+    end
+
+    -- n = m * 2^e, 0.5 <= m < 1
+    local m, e = frexp( n )
+    local exp = e + 1022
+    local frac
+
+    if exp <= 0 then
+        -- subnormal
+        frac = ldexp( m, e + 1074 )
+        exp = 0
+    else
+        frac = ( m * 2 - 1 ) * 2^52
+    end
+
+    return char( 0xcb,
+                 sign + floor( exp / 16 ),
+                 ( exp % 16 ) * 16 + floor( frac / 2^48 ) )
+           .. _be( frac % 2^48, 6 )
+end
+
+local function _integer(n)
+
+    if n >= 0 then
+        if n < 128 then
+            return char( n )
+        elseif n < 2^8 then
+            return char( 0xcc, n )
+        elseif n < 2^16 then
+            return char( 0xcd ) .. _be( n, 2 )
+        elseif n < 2^32 then
+            return char( 0xce ) .. _be( n, 4 )
+        else
+            return char( 0xcf ) .. _be( n, 8 )
+        end
+    else
+        if n >= -32 then
+            return char( 256 + n )
+        elseif n >= -2^7 then
+            return char( 0xd0, 2^8 + n )
+        elseif n >= -2^15 then
+            return char( 0xd1 ) .. _be( 2^16 + n, 2 )
+        elseif n >= -2^31 then
+            return char( 0xd2 ) .. _be( 2^32 + n, 4 )
+        else
+            return _float64( n )
+        end
+    end
+end
+
+local function _is_array(t)
+    local n = #t
+    if n == 0 then
+        return false
+    end
+
+    local nkeys = 0
+    for _ in pairs( t ) do
+        nkeys = nkeys + 1
+        if nkeys > n then
+            return false
+        end
+    end
+    return nkeys == n
+end
+
+local function _header(n, fix, fix_max, c16, c32)
+    if n <= fix_max then
+        return char( fix + n )
+    elseif n < 2^16 then
+        return char( c16 ) .. _be( n, 2 )
+    else
+        return char( c32 ) .. _be( n, 4 )
+    end
+end
+
+local _encode
+
+_encode = function(v, buf)
+
+    local tp = type( v )
+
+    if v == nil or tp == 'userdata' then
+        -- userdata is cjson.null
+        buf[ #buf + 1 ] = char( 0xc0 )
+
+    elseif tp == 'boolean' then
+        buf[ #buf + 1 ] = char( v and 0xc3 or 0xc2 )
+
+    elseif tp == 'number' then
+        if floor( v ) == v and v >= -2^53 and v <= 2^53 then
+            buf[ #buf + 1 ] = _integer( v )
+        else
+            buf[ #buf + 1 ] = _float64( v )
+        end
+
+    elseif tp == 'string' then
+        local n = #v
+        if n < 32 then
+            buf[ #buf + 1 ] = char( 0xa0 + n )
+        elseif n < 2^8 then
+            buf[ #buf + 1 ] = char( 0xd9, n )
+        else
+            buf[ #buf + 1 ] = _header( n, 0, -1, 0xda, 0xdb )
+        end
+        buf[ #buf + 1 ] = v
+
+    elseif tp == 'table' then
+        if _is_array( v ) then
+            local n = #v
+            buf[ #buf + 1 ] = _header( n, 0x90, 15, 0xdc, 0xdd )
+            for i = 1, n do
+                _encode( v[ i ], buf )
+            end
+        else
+            local n = 0
+            for _ in pairs( v ) do
+                n = n + 1
+            end
+            buf[ #buf + 1 ] = _header( n, 0x80, 15, 0xde, 0xdf )
+            for k, vv in pairs( v ) do
+                _encode( k, buf )
+                _encode( vv, buf )
+            end
+        end
+
+    else
+        error( "msgpack: can not encode type: " .. tp )
+    end
+end
+
+function _M.encode(v)
+    local buf = {}
+    _encode( v, buf )
+    return concat( buf )
+end
+
+local function _uint(s, pos, nbytes)
+    if pos + nbytes - 1 > #s then
+        error( "msgpack: truncated at: " .. pos )
+    end
+
+    local n = 0
+    for i = pos, pos + nbytes - 1 do
+        n = n * 256 + byte( s, i )
+    end
+    return n, pos + nbytes
+end
+
+local function _int(s, pos, nbytes)
+    local n, p = _uint( s, pos, nbytes )
+    if n >= 2^( nbytes * 8 - 1 ) then
+        n = n - 2^( nbytes * 8 )
+    end
+    return n, p
+end
+
+local function _dec_float64(s, pos)
+
+    if pos + 7 > #s then
+        error( "msgpack: truncated at: " .. pos )
+    end
+
+    local b1, b2 = byte( s, pos, pos + 1 )
+    local frac = _uint( s, pos + 2, 6 ) + ( b2 % 16 ) * 2^48
+    local exp = ( b1 % 128 ) * 16 + floor( b2 / 16 )
+
+    local n
+    if exp == 0 then
+        n = ldexp( frac, -1074 )
+    elseif exp == 2047 then
+        if frac == 0 then
+            n = math.huge
+        else
+            n = 0 / 0
+        end
+    else
+        n = ldexp( frac + 2^52, exp - 1075 )
+    end
+
+    if b1 >= 128 then
+        n = -n
+    end
+    return n, pos + 8
+end
+
+local _decode
+
+local function _str(s, pos, n)
+    if pos + n - 1 > #s then
+        error( "msgpack: truncated at: " .. pos )
+    end
+    return sub( s, pos, pos + n - 1 ), pos + n
+end
+
+local function _array(s, pos, n)
+    local t = {}
+    for i = 1, n do
+        t[ i ], pos = _decode( s, pos )
+    end
+    return t, pos
+end
+
+local function _map(s, pos, n)
+    local t = {}
+    local k, v
+    for _ = 1, n do
+        k, pos = _decode( s, pos )
+        v, pos = _decode( s, pos )
+        if k == nil then
+            error( "msgpack: nil map key at: " .. pos )
+        end
+        t[ k ] = v
+    end
+    return t, pos
+end
+
+_decode = function(s, pos)
+
+    local c = byte( s, pos )
+    if c == nil then
+        error( "msgpack: truncated at: " .. pos )
+    end
+    pos = pos + 1
+
+    if c < 0x80 then
+        return c, pos
+    elseif c >= 0xe0 then
+        return c - 256, pos
+    elseif c < 0x90 then
+        return _map( s, pos, c - 0x80 )
+    elseif c < 0xa0 then
+        return _array( s, pos, c - 0x90 )
+    elseif c < 0xc0 then
+        return _str( s, pos, c - 0xa0 )
+    elseif c == 0xc0 then
+        return nil, pos
+    elseif c == 0xc2 then
+        return false, pos
+    elseif c == 0xc3 then
+        return true, pos
+    elseif c == 0xcb then
+        return _dec_float64( s, pos )
+    elseif c == 0xcc then
+        return _uint( s, pos, 1 )
+    elseif c == 0xcd then
+        return _uint( s, pos, 2 )
+    elseif c == 0xce then
+        return _uint( s, pos, 4 )
+    elseif c == 0xcf then
+        return _uint( s, pos, 8 )
+    elseif c == 0xd0 then
+        return _int( s, pos, 1 )
+    elseif c == 0xd1 then
+        return _int( s, pos, 2 )
+    elseif c == 0xd2 then
+        return _int( s, pos, 4 )
+    elseif c == 0xd3 then
+        return _int( s, pos, 8 )
+    elseif c == 0xd9 or c == 0xda or c == 0xdb then
+        local n
+        n, pos = _uint( s, pos, 2^( c - 0xd9 ) )
+        return _str( s, pos, n )
+    elseif c == 0xdc or c == 0xdd then
+        local n
+        n, pos = _uint( s, pos, c == 0xdc and 2 or 4 )
+        return _array( s, pos, n )
+    elseif c == 0xde or c == 0xdf then
+        local n
+        n, pos = _uint( s, pos, c == 0xde and 2 or 4 )
+        return _map( s, pos, n )
+    end
+
+    error( "msgpack: unsupported type: " .. c .. " at: " .. ( pos - 1 ) )
+end
+
+function _M.decode(s)
+
+    if type( s ) ~= 'string' then
+        error( "msgpack: expect string but: " .. type( s ) )
+    end
+
+    local v, pos = _decode( s, 1 )
+    if pos <= #s then
+        error( "msgpack: trailing garbage at: " .. pos )
+    end
+    return v
+end
+
+return _M
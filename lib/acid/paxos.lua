@@ -44,12 +44,21 @@ function _M.new(member_id, impl, ver)
     return p
 end
 function _M.extract_memberid(req)
-    local member_id = tableutil.sub(req or {}, {"cluster_id", "ident"})
-    if member_id.cluster_id and member_id.ident then
-        return member_id, nil
-    else
+    -- member_id.inst is the optional paxos instance name, nil for the main
+    -- instance that has the view.
+    local member_id = tableutil.sub(req or {}, {"cluster_id", "ident", "inst"})
+    if not member_id.cluster_id or not member_id.ident then
         return nil, errors.InvalidArgument, "cluster_id or ident not found"
     end
+
+    -- inst is used in storage path and must not contain "/" or "..".
+    if member_id.inst ~= nil
+        and ( type(member_id.inst) ~= 'string'
+              or not member_id.inst:match('^[%w_%-]+$') ) then
+        return nil, errors.InvalidArgument, "inst must be a plain name"
+    end
+
+    return member_id, nil
 end
 
 function _meth:set(field_key, field_val)
@@ -58,12 +67,45 @@ function _meth:set(field_key, field_val)
         return nil, errors.InvalidArgument, 'field_key must be string for set'
     end
 
+    local c, err, errmes = self:mset({ [field_key]=field_val })
+    if err then
+        return nil, err, errmes
+    end
+
+    return { ver=c.ver, key=field_key, val=c.val[field_key] }
+end
+function _meth:mset(fields)
+
+    -- Update several fields of val in one paxos version.
+    -- Returns { ver=, val={ <field_key>=<field_val>, .. } }
+
+    if type(fields) ~= 'table' then
+        return nil, errors.InvalidArgument, 'fields must be table for mset'
+    end
+
+    for k, _ in pairs(fields) do
+        if type(k) ~= 'string' then
+            return nil, errors.InvalidArgument, 'field_key must be string for mset'
+        end
+    end
+
     local c, err, errmes = self:read()
     if err then
         return nil, err, errmes
     end
 
-    if tableutil.eq( c.val[field_key], field_val ) then
+    -- val of a new instance is nil
+    local cval = c.val or {}
+
+    local changed = false
+    for k, v in pairs(fields) do
+        if not tableutil.eq( cval[k], v ) then
+            changed = true
+            break
+        end
+    end
+
+    if not changed then
 
         local p, err, errmes = self:new_proposer()
         if err then
@@ -74,17 +116,35 @@ function _meth:set(field_key, field_val)
         if err then
             return nil, err, errmes
         end
-        return { ver=c.ver, key=field_key, val=field_val }, nil
+        return { ver=c.ver, val=fields }, nil
     end
 
-    c.val[field_key] = field_val
+    -- committed read might be shared with cache
+    local val = tableutil.dup( cval )
+    for k, v in pairs(fields) do
+        val[k] = v
+    end
+
+    -- With impl.lease_read, acceptors accept values only from the leader
+    -- while its lease is valid. See lease_read.
+    local leader = base.valid_leader( cval )
+    if self.impl.lease_read
+        and leader ~= nil
+        and leader.ident ~= self.member_id.ident then
+        return nil, errors.NotLeader, leader.ident
+    end
 
-    local c, err, errmes = self:write(c.val)
+    local c, err, errmes = self:write(val)
     if err then
         return nil, err, errmes
     end
 
-    return { ver=c.ver, key=field_key, val=c.val[field_key] }
+    local rst = {}
+    for k, _ in pairs(fields) do
+        rst[k] = c.val[k]
+    end
+
+    return { ver=c.ver, val=rst }
 end
 function _meth:get(field_key)
 
@@ -92,13 +152,49 @@ function _meth:get(field_key)
         return nil, errors.InvalidArgument, 'field_key must be string or nil for get'
     end
 
-    local c, err, errmes = self:quorum_read()
+    local c, err, errmes = self:lease_read()
     if err then
         return nil, err, errmes
     end
 
     return self:_make_get_rst(field_key, c)
 end
+function _meth:lease_read()
+
+    -- With impl.lease_read, the leader holding a valid lease answers from
+    -- local committed record. Otherwise it is a quorum read.
+    --
+    -- It is up to date because while the lease is valid acceptors accept
+    -- only values from the leader, and the leader does not take a value as
+    -- accepted or committed without its own acceptor. A value accepted but
+    -- not yet committed locally means a write of the leader failed half way
+    -- and its state is unknown, thus it is also a quorum read.
+    --
+    -- Clocks of members drift apart. The leader reads locally only if more
+    -- than impl.lease_read_margin seconds(default 1) of the lease are left,
+    -- which must be no less than the clock skew between members.
+
+    local p, err, errmes = self:new_proposer()
+    if err then
+        return nil, err, errmes
+    end
+
+    if self.impl.lease_read then
+        local lease = p:leader_lease()
+        local margin = self.impl.lease_read_margin or 1
+        if lease ~= nil and lease > margin and p.record.paxos_round.val == nil then
+            self:track( 'read:local,lease:' .. tostring(lease) )
+            return p:read(), nil, nil
+        end
+        self:track( 'read:quorum,lease:' .. tostring(lease or '-') )
+    end
+
+    local c, err, errmes = p:quorum_read()
+    if err then
+        return nil, err, errmes
+    end
+    return { ver=c.ver, val=c.val }, nil, nil
+end
 function _meth:quorum_read()
 
     local p, err, errmes = self:new_proposer()
@@ -162,6 +258,36 @@ function _meth:read()
     return p:read()
 end
 
+function _meth:read_history(ver)
+
+    -- Read a committed version retained in local history. It requires
+    -- impl.history_size.
+
+    local p, err, errmes = self:new_proposer()
+    if err then
+        return nil, err, errmes
+    end
+
+    return p:read_history(ver)
+end
+function _meth:changes_since(ver)
+
+    -- Changes from version ver to the latest committed in local history:
+    --      { ver=latest, changes={ { ver=, set={}, del={} }, ... } }
+
+    local p, err, errmes = self:new_proposer()
+    if err then
+        return nil, err, errmes
+    end
+
+    local changes, err, errmes = p:changes_since(ver)
+    if err then
+        return nil, err, errmes
+    end
+
+    return { ver=p.record.committed.ver, changes=changes }, nil, nil
+end
+
 function _meth:send_req(ident, req)
     local p, err, errmes = self:new_proposer()
     if err then
@@ -220,6 +346,11 @@ end
 function _meth:logerr(...)
     self.impl:_log(1, ...)
 end
+function _meth:track(...)
+    if self.impl.track ~= nil then
+        self.impl:track(...)
+    end
+end
 
 function _meth:new_proposer()
     return proposer.new(self:_paxos_args(), self.impl)
@@ -228,9 +359,12 @@ function _meth:new_acceptor()
     return acceptor.new(self:_paxos_args(), self.impl)
 end
 function _meth:_paxos_args()
-    local mid = tableutil.dup( self.member_id )
-    mid.ver = self.ver
-    return mid
+    return {
+        cluster_id = self.member_id.cluster_id,
+        ident = self.member_id.ident,
+        inst = self.member_id.inst,
+        ver = self.ver,
+    }
 end
 
 return _M
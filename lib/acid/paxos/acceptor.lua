@@ -3,6 +3,8 @@ local _M = { _VERSION = require("acid.paxos._ver") }
 local tableutil = require( "acid.tableutil" )
 local base = require( "acid.paxos.base" )
 local round = require( "acid.paxos.round" )
+local delta = require( "acid.paxos.delta" )
+local history = require( "acid.paxos.history" )
 
 local errors = base.errors
 
@@ -34,10 +36,50 @@ local function is_next_ver(self)
     end
     return true
 end
+local function is_view_matched(self)
+
+    -- An instance other than the main one accepts only messages sent with
+    -- the same view of the main instance. See base.init_inst_view.
+
+    if self.inst ~= nil and self.mes.view_id ~= self.view_id then
+        self.err = {
+            Code = errors.ViewMismatch,
+            Message = self.view_id,
+        }
+        return false
+    end
+    return true
+end
+local function is_leader_matched(self)
+
+    -- With impl.lease_read, only the leader holding a valid lease is allowed
+    -- to write. Thus no version is committed without the leader and the
+    -- leader is able to read from its local record.
+
+    if not self.impl.lease_read then
+        return true
+    end
+
+    local leader = base.valid_leader( self.record.committed.val )
+    if leader ~= nil and leader.ident ~= ( self.mes.rnd or {} )[ 2 ] then
+        self.err = {
+            Code = errors.NotLeader,
+            Message = leader.ident,
+        }
+        return false
+    end
+    return true
+end
 local function committable(self)
     local c = self.record.committed
 
     if self.mes.ver < c.ver or self.mes.ver < 1 then
+
+        -- The sender already has the same committed, do not send val back.
+        if delta.match( c, self.mes.base ) then
+            c = { ver=c.ver, __tag=c.__tag }
+        end
+
         self.err = {
             Code = errors.AlreadyCommitted,
             Message = c,
@@ -46,6 +88,32 @@ local function committable(self)
     end
     return true
 end
+local function apply_delta(self)
+
+    -- Rebuild mes.val from mes.val_delta and the committed it is based on.
+
+    local d = self.mes.val_delta
+    if d == nil then
+        return true
+    end
+
+    local val, err, errmes = delta.apply( self.record.committed, d )
+    if err then
+        self.err = {
+            Code = err,
+            Message = errmes,
+        }
+        return false
+    end
+
+    -- mes might be shared by other acceptors.
+    local mes = tableutil.dup( self.mes )
+    mes.val = val
+    mes.val_delta = nil
+    self.mes = mes
+
+    return true
+end
 
 local function is_committed_valid( self )
 
@@ -65,7 +133,10 @@ function _M.new(args, impl)
     local acc = {
         cluster_id = args.cluster_id,
         ident = args.ident,
+        inst = args.inst,
         ver = args.ver,
+        -- members of the view, for inst ~= nil. See base.view_id
+        view_id = nil,
 
         mes = nil,
 
@@ -147,6 +218,10 @@ function _meth:process(mes)
         return nil, errors.InvalidCluster, self.cluster_id
     end
 
+    if mes.inst ~= self.inst then
+        return nil, errors.InvalidMessage, "inst mismatch: " .. tostring(self.inst)
+    end
+
     -- TODO pcall
     local _l, err = self.impl:lock(self)
     if err then
@@ -160,14 +235,16 @@ function _meth:process(mes)
 
     return rst, err, errmes
 end
-function _meth:store_or_err()
+function _meth:store_or_err(opts)
+
+    -- opts.part = 'paxos_round' tells impl that only paxos_round changed.
 
     if not is_committed_valid( self ) then
         return nil, self.err.Code, self.err.Message
     end
 
     self:lease_to_expire()
-    local _, err, errmes = self.impl:store(self)
+    local _, err, errmes = self.impl:store(self, opts)
     if err then
         return nil, errors.StorageError, nil
     else
@@ -191,6 +268,10 @@ function _meth:phase1()
         return nil, self.err.Code, self.err.Message
     end
 
+    if not is_view_matched( self ) then
+        return nil, self.err.Code, self.err.Message
+    end
+
     if not is_next_ver( self ) then
         return nil, self.err.Code, self.err.Message
     end
@@ -198,8 +279,14 @@ function _meth:phase1()
     local r = self.record.paxos_round
 
     if round.cmp( self.mes.rnd, r.rnd ) >= 0 then
+        -- record might be shared with cache
+        r = tableutil.dup( r )
+        self.record.paxos_round = r
+
         r.rnd = self.mes.rnd
-        local _, err, errmes = self:store_or_err()
+        -- leader promises mes.rnd for all versions up to ver_end.
+        r.ver_end = self.mes.ver_end
+        local _, err, errmes = self:store_or_err({part='paxos_round'})
         if err then
             return nil, err, errmes
         end
@@ -207,6 +294,8 @@ function _meth:phase1()
 
     local rst = {
         rnd=r.rnd,
+        -- tell proposer that phase2 and phase3 with val_delta are supported.
+        delta=true,
     }
     if r.val then
         rst.val = r.val
@@ -232,17 +321,33 @@ function _meth:phase2()
         return nil, self.err.Code, self.err.Message
     end
 
+    if not is_view_matched( self ) then
+        return nil, self.err.Code, self.err.Message
+    end
+
     if not is_next_ver( self ) then
         return nil, self.err.Code, self.err.Message
     end
 
+    if not apply_delta( self ) then
+        return nil, self.err.Code, self.err.Message
+    end
+
+    if not is_leader_matched( self ) then
+        return nil, self.err.Code, self.err.Message
+    end
+
     local r = self.record.paxos_round
 
     if round.cmp( self.mes.rnd, r.rnd ) == 0 then
+        -- record might be shared with cache
+        r = tableutil.dup( r )
+        self.record.paxos_round = r
+
         r.val = self.mes.val
         r.vrnd = self.mes.rnd
 
-        return self:store_or_err()
+        return self:store_or_err({part='paxos_round'})
     else
         return nil, errors.OldRound, nil
     end
@@ -266,16 +371,31 @@ function _meth:phase3()
         return nil, self.err.Code, self.err.Message
     end
 
+    if not apply_delta( self ) then
+        return nil, self.err.Code, self.err.Message
+    end
+
     -- val with higher version is allowed to commit because some proposer has
     -- confirmed that it has been accepted by a quorum.
 
     local rec = self.record
 
     if self.mes.ver > rec.committed.ver then
-        rec.paxos_round = {
-            rnd = round.zero(),
-            vrnd = round.zero(),
-        }
+        local r = rec.paxos_round
+        if r.ver_end ~= nil and self.mes.ver < r.ver_end then
+            -- round promised for a range of versions is kept for next
+            -- version. Thus the leader is able to skip phase1.
+            rec.paxos_round = {
+                rnd = r.rnd,
+                vrnd = round.zero(),
+                ver_end = r.ver_end,
+            }
+        else
+            rec.paxos_round = {
+                rnd = round.zero(),
+                vrnd = round.zero(),
+            }
+        end
     end
 
     -- for bug tracking
@@ -309,12 +429,31 @@ function _meth:phase3()
         end
     end
 
+    local prev = rec.committed
     rec.committed = {
         ver = self.mes.ver,
         val = self.mes.val,
         __tag = self.mes.__tag,
     }
 
-    return self:store_or_err()
+    -- With impl.history_size, the last history_size versions are kept in
+    -- record. See acid.paxos.history.
+    if self.impl.history_size ~= nil or rec.history ~= nil then
+        rec.history = history.push( rec.history, rec.committed, prev,
+                                    self.impl.history_size or 0,
+                                    self.impl:time() )
+    end
+
+    local _, err, errmes = self:store_or_err()
+    if err then
+        return nil, err, errmes
+    end
+
+    -- wake up requests waiting for a newer version. See paxosserver watch.
+    if self.impl.watch_notify ~= nil then
+        self.impl:watch_notify(self, self.mes.ver)
+    end
+
+    return nil
 end
 return _M
@@ -21,11 +21,19 @@ _M.errors = {
     NoChange         = 'NoChange',
     Conflict         = 'Conflict',
     InvalidCommitted = 'InvalidCommitted',
+    InternalError    = 'InternalError',
+    DeltaMismatch    = 'DeltaMismatch',
+    ViewMismatch     = 'ViewMismatch',
+    NotLeader        = 'NotLeader',
 }
 local errors = _M.errors
 
 function _M.init_rec( self, r )
-    r = r or {}
+
+    -- r might be shared with cache thus it must not be modified. Tables
+    -- along the path to a change are copied instead(copy-on-write).
+
+    r = tableutil.dup( r or {} )
     r.committed = r.committed or {
         ver = 0,
         val = nil,
@@ -60,6 +68,10 @@ end
 
 function _M.init_view( self )
 
+    if self.inst ~= nil then
+        return self:init_inst_view()
+    end
+
     for _ = 0, 0 do
 
         local c = self.record.committed
@@ -89,51 +101,155 @@ function _M.init_view( self )
     return nil, errors.NoView, nil
 end
 
-function _M:lease_to_expire()
+function _M.init_inst_view( self )
+
+    -- A paxos instance other than the main one(self.inst ~= nil) runs with
+    -- the view committed in the main instance of the same member. Its own
+    -- val does not have a view.
+    --
+    -- self.view_id identifies members of the view. Proposer carries it in
+    -- every message and acceptor rejects a message with a different one,
+    -- thus a version of the instance can not be accepted by quorums of two
+    -- different views. Other changes to the main instance, such as leader
+    -- lease renewal, do not affect instances.
+
+    local ver = self.record.committed.ver
+    if self.ver ~= nil and self.ver ~= ver then
+        return nil, errors.VerNotExist, ver
+    end
 
-    if self.record == nil then
-        return nil, nil, nil
+    local r, err, errmes = self.impl:load({ cluster_id=self.cluster_id,
+                                            ident=self.ident })
+    if err then
+        return nil, err, errmes
+    end
+
+    local c = ( r or {} ).committed or {}
+    local v = ( c.val or {} ).view
+    if v == nil or v[ 1 ] == nil then
+        return nil, errors.NoView, nil
+    end
+
+    self.ver = ver
+    self.view = v
+    self.view_id = _M.view_id( v )
+    return nil
+end
+
+function _M.view_id( view )
+
+    -- A string of sorted member idents of each group of view, e.g.:
+    -- "a,b,c|b,c,d".
+
+    local groups = {}
+    for _, group in ipairs( view ) do
+        local ids = {}
+        for id, _ in pairs( group ) do
+            table.insert( ids, tostring( id ) )
+        end
+        table.sort( ids )
+        table.insert( groups, table.concat( ids, ',' ) )
     end
+    return table.concat( groups, '|' )
+end
+
+local function convert_val(val, convert, now)
+
+    -- Copy-on-write: returns a new val if any field is converted, or val
+    -- itself.
 
-    local val = self.record.committed.val
     if type(val) ~= 'table' then
-        return nil, nil, nil
+        return val
     end
 
-    local now = self.impl:time()
+    local newval
 
-    for k, v in pairs(val or {}) do
+    for k, v in pairs(val) do
         if type( v ) == 'table' then
-            if v.__lease ~= nil then
-                v.__expire = now + v.__lease
-                v.__lease = nil
+            local nv = convert(v, now)
+            if nv ~= nil then
+                newval = newval or tableutil.dup( val )
+                newval[ k ] = nv
             end
         end
     end
-    return nil, nil, nil
+
+    return newval or val
 end
 
-function _M:expire_to_lease()
+local function to_expire(v, now)
+    if v.__lease ~= nil then
+        v = tableutil.dup( v )
+        v.__expire = now + v.__lease
+        v.__lease = nil
+        return v
+    end
+end
+
+local function to_lease(v, now)
+    if v.__expire ~= nil then
+        v = tableutil.dup( v )
+        v.__lease = v.__expire - now
+        v.__expire = nil
+        return v
+    end
+end
+
+function _M.valid_leader(val)
+
+    -- The leader in val whose lease has not yet expired, or nil. val must
+    -- be converted with expire_to_lease.
+
+    if type(val) ~= 'table' or type(val.leader) ~= 'table' then
+        return nil
+    end
+
+    local leader = val.leader
+    if (leader.__lease or 0) > 0 then
+        return leader
+    end
+    return nil
+end
+
+function _M.val_lease_to_expire(val, now)
+    return convert_val(val, to_expire, now)
+end
+
+function _M.val_expire_to_lease(val, now)
+    return convert_val(val, to_lease, now)
+end
+
+local function convert_committed(self, convert)
+
+    -- Copy-on-write: committed, val and the fields converted are copied.
 
     if self.record == nil then
         return nil, nil, nil
     end
 
-    local val = self.record.committed.val
+    local c = self.record.committed
+    local val = c.val
     if type(val) ~= 'table' then
         return nil, nil, nil
     end
 
-    local now = self.impl:time()
+    local newval = convert_val(val, convert, self.impl:time())
 
-    for k, v in pairs(val or {}) do
-        if type( v ) == 'table' then
-            if v.__expire ~= nil then
-                v.__lease = v.__expire - now
-                v.__expire = nil
-            end
-        end
+    if newval ~= val then
+        c = tableutil.dup( c )
+        c.val = newval
+        self.record.committed = c
     end
+
+    return nil, nil, nil
+end
+
+function _M:lease_to_expire()
+    return convert_committed(self, to_expire)
+end
+
+function _M:expire_to_lease()
+    return convert_committed(self, to_lease)
 end
 
 return _M
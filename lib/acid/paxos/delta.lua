@@ -0,0 +1,103 @@
+local _M = { _VERSION = require("acid.paxos._ver") }
+
+local tableutil = require( "acid.tableutil" )
+local base = require( "acid.paxos.base" )
+
+local errors = base.errors
+
+-- Delta of a value against the last committed one, with top level fields
+-- as unit:
+--
+--      {
+--          ver = 3,            -- version of the base committed
+--          __tag = 'x/a/3/..', -- tag of the base committed
+--          set = { leader={...} },
+--          del = { 'foo' },
+--      }
+--
+-- A committed is identified by ver and __tag together, thus the receiver
+-- applies a delta only to exactly the same committed it is made from.
+
+function _M.diff(a, b)
+
+    -- Returns fields to set and to delete to turn table a into b, and the
+    -- number of fields unchanged.
+
+    local set = {}
+    local del = {}
+    local nsame = 0
+
+    for k, v in pairs(b) do
+        if rawequal( v, a[ k ] ) or tableutil.eq( v, a[ k ] ) then
+            nsame = nsame + 1
+        else
+            set[ k ] = v
+        end
+    end
+
+    for k, _ in pairs(a) do
+        if b[ k ] == nil then
+            table.insert( del, k )
+        end
+    end
+
+    return set, del, nsame
+end
+
+function _M.patch(val, set, del)
+
+    -- val might be shared with cache, a new table is returned.
+    val = tableutil.dup( val )
+
+    for k, v in pairs( set or {} ) do
+        val[ k ] = v
+    end
+
+    for _, k in ipairs( del or {} ) do
+        val[ k ] = nil
+    end
+
+    return val
+end
+
+function _M.make(c, val)
+
+    -- Returns nil if a delta does not save anything.
+
+    if c == nil or c.__tag == nil
+        or type(c.val) ~= 'table' or type(val) ~= 'table' then
+        return nil
+    end
+
+    local set, del, nsame = _M.diff( c.val, val )
+    if nsame == 0 then
+        return nil
+    end
+
+    return {
+        ver = c.ver,
+        __tag = c.__tag,
+        set = set,
+        del = del,
+    }
+end
+
+function _M.match(c, d)
+    return c ~= nil
+        and d ~= nil
+        and c.__tag ~= nil
+        and c.ver == d.ver
+        and c.__tag == d.__tag
+end
+
+function _M.apply(c, d)
+
+    if not _M.match( c, d ) or type(c.val) ~= 'table' then
+        return nil, errors.DeltaMismatch, { ver=( c or {} ).ver,
+                                            __tag=( c or {} ).__tag }
+    end
+
+    return _M.patch( c.val, d.set, d.del ), nil, nil
+end
+
+return _M
@@ -0,0 +1,129 @@
+local _M = { _VERSION = require("acid.paxos._ver") }
+
+local base = require( "acid.paxos.base" )
+local delta = require( "acid.paxos.delta" )
+
+local errors = base.errors
+
+-- Recent committed versions kept in record, newest first:
+--
+--      history = {
+--          { ver=4, __tag='..', set={...}, del={...} },
+--          { ver=2, __tag='..', set={...}, del={...} },
+--      }
+--
+-- An entry is a reverse delta: it turns the val of the version before it,
+-- or committed for the first one, into the val of its own version. Versions
+-- are not always contiguous: an acceptor lagging behind might commit a
+-- version several versions ahead.
+--
+-- Leases in entries are stored as __expire, the same as committed.
+
+function _M.push(history, c, prev, size, now)
+
+    -- Returns history after c is committed over prev. history might be
+    -- shared with cache thus it is not modified.
+
+    if size < 1 then
+        return nil
+    end
+
+    if prev.ver == c.ver then
+        return history
+    end
+
+    if prev.ver == nil or prev.ver == 0 or prev.ver > c.ver
+        or type(prev.val) ~= 'table' or type(c.val) ~= 'table' then
+        -- entries are relative to prev and can not be used any more.
+        return nil
+    end
+
+    local set, del = delta.diff( c.val, prev.val )
+
+    local h = {
+        {
+            ver = prev.ver,
+            __tag = prev.__tag,
+            set = base.val_lease_to_expire( set, now ),
+            del = del,
+        },
+    }
+
+    for i = 1, math.min( #( history or {} ), size - 1 ) do
+        h[ i + 1 ] = history[ i ]
+    end
+
+    return h
+end
+
+local function _walk(c, history, ver, now)
+
+    -- Returns committed of c and retained versions down to ver, newest
+    -- first.
+
+    if type(ver) ~= 'number' then
+        return nil, errors.InvalidArgument, 'ver must be number'
+    end
+
+    local cs = { c }
+    if ver == c.ver then
+        return cs, nil, nil
+    end
+
+    local val = c.val
+    for _, e in ipairs( history or {} ) do
+
+        if e.ver < ver then
+            break
+        end
+
+        val = delta.patch( val, base.val_expire_to_lease( e.set, now ), e.del )
+        table.insert( cs, { ver=e.ver, val=val, __tag=e.__tag } )
+
+        if e.ver == ver then
+            return cs, nil, nil
+        end
+    end
+
+    local oldest = c.ver
+    if history ~= nil and #history > 0 then
+        oldest = history[ #history ].ver
+    end
+
+    return nil, errors.VerNotExist, 'retained versions: '
+            .. tostring(oldest) .. '-' .. tostring(c.ver)
+end
+
+function _M.read(c, history, ver, now)
+
+    -- Returns committed of version ver.
+
+    local cs, err, errmes = _walk( c, history, ver, now )
+    if err then
+        return nil, err, errmes
+    end
+
+    return cs[ #cs ], nil, nil
+end
+
+function _M.changes_since(c, history, ver, now)
+
+    -- Returns changes to turn val of version ver into the latest, oldest
+    -- first:
+    --      { { ver=3, set={...}, del={...} }, ... }
+
+    local cs, err, errmes = _walk( c, history, ver, now )
+    if err then
+        return nil, err, errmes
+    end
+
+    local changes = {}
+    for i = #cs, 2, -1 do
+        local set, del = delta.diff( cs[ i ].val, cs[ i - 1 ].val )
+        table.insert( changes, { ver=cs[ i - 1 ].ver, set=set, del=del } )
+    end
+
+    return changes, nil, nil
+end
+
+return _M
@@ -3,6 +3,8 @@ local _M = { _VERSION = require("acid.paxos._ver") }
 local tableutil = require( "acid.tableutil" )
 local round = require( "acid.paxos.round" )
 local base = require( "acid.paxos.base" )
+local delta = require( "acid.paxos.delta" )
+local history = require( "acid.paxos.history" )
 
 local errors = base.errors
 
@@ -10,14 +12,28 @@ local _meth = { _VERSION = _M._VERSION }
 local _mt = { __index = _meth }
 tableutil.merge( _meth, base )
 
+-- Rounds promised by a quorum to the leader of this worker for a range of
+-- versions:
+--      { ["<cluster_id>/<ident>[/<inst>]"] = { rnd=, ver_end=, used_ver= } }
+local promised = {}
+
+-- Acceptors that accept val_delta in phase2 and phase3, learnt from their
+-- phase1 responses:
+--      { ["<cluster_id>/<acceptor_id>"] = true }
+local delta_peers = {}
+
 function _M.new( args, impl )
 
     local proposer = {
         cluster_id = args.cluster_id,
         ident = args.ident .. "",
+        -- paxos instance in cluster, nil for the main one. See base.init_view
+        inst = args.inst,
 
         ver = args.ver,
         view = nil,
+        -- members of the view, for inst ~= nil. See base.view_id
+        view_id = nil,
         acceptors = nil,
 
         -- stat becomes valid after self:decide()
@@ -72,7 +88,20 @@ function _meth:write( myval )
     --      1. not enough member to form a quorum.
     --      2. there is currently another value accepted.
 
-    local val, err, errmes = self:decide( myval )
+    local val, err, errmes
+    if self:is_promised() then
+        val, err, errmes = self:decide_promised( myval )
+        if err then
+            -- Promise is broken by other proposer or acceptor lost it. Run
+            -- a complete round.
+            self:unpromise()
+            self.stat = nil
+            val, err, errmes = self:decide( myval )
+        end
+    else
+        val, err, errmes = self:decide( myval )
+    end
+
     if err then
         return nil, err, errmes
     end
@@ -94,6 +123,20 @@ function _meth:read()
     local c = self.record.committed
     return { ver=c.ver, val=c.val }
 end
+function _meth:read_history(ver)
+    local c, err, errmes = history.read( self.record.committed,
+                                         self.record.history,
+                                         ver, self.impl:time() )
+    if err then
+        return nil, err, errmes
+    end
+    return { ver=c.ver, val=c.val }
+end
+function _meth:changes_since(ver)
+    return history.changes_since( self.record.committed,
+                                  self.record.history,
+                                  ver, self.impl:time() )
+end
 function _meth:remote_read()
     return self:_remote_read(false)
 end
@@ -102,16 +145,23 @@ function _meth:quorum_read()
 end
 function _meth:_remote_read(need_quorum)
 
-    -- to commit with empty data, response data contains committed data stored
-    local _resps = self:phase3({ ver=0 })
+    -- to commit with empty data, response data contains committed data stored.
+    -- An acceptor having the same committed as base responds without val.
+    local mine = self.record.committed
+    local base_c
+    if mine.__tag ~= nil then
+        base_c = { ver=mine.ver, __tag=mine.__tag }
+    end
 
-    local resps = {}
+    local _resps = self:phase3({ ver=0, base=base_c }, function(_resps)
+        return self:is_quorum( self:_choose_committed( _resps ) )
+    end)
+
+    local resps = self:_choose_committed( _resps )
     local err = {}
     for id, resp in pairs(_resps) do
-        if resp.err.Code == errors.AlreadyCommitted then
-            resps[ id ] = resp
-        else
-            err[ id ] = (resps.err or {}).Code
+        if resps[ id ] == nil then
+            err[ id ] = (resp.err or {}).Code
         end
     end
 
@@ -122,6 +172,9 @@ function _meth:_remote_read(need_quorum)
     local latest = { ver=0, val=nil }
     for _, resp in pairs(resps) do
         local c = resp.err.Message
+        if c.val == nil and delta.match( mine, c ) then
+            c = mine
+        end
         if c.ver ~= nil and c.ver > latest.ver then
             latest = c
         end
@@ -146,7 +199,11 @@ function _meth:decide( my_val )
         self.rnd = round.incr( self.rnd )
     end
 
-    local resps = self:phase1()
+    local ver_end = self:_promise_ver_end()
+
+    local resps = self:phase1(function(_resps)
+        return self:is_quorum( (self:choose_p1( _resps, my_val )) )
+    end, ver_end)
     local accepted_resps, val, stat = self:choose_p1( resps, my_val )
 
     self.stat = {}
@@ -168,7 +225,13 @@ function _meth:decide( my_val )
         return nil, errors.QuorumFailure, 'phase1: ' .. tableutil.repr(st.phase1.err)
     end
 
-    resps = self:phase2( val )
+    if ver_end ~= nil then
+        self:promise( ver_end )
+    end
+
+    resps = self:phase2( val, function(_resps)
+        return self:is_write_quorum( self:choose_p2( _resps ) )
+    end)
     self.p2 = resps
     accepted_resps = self:choose_p2( resps )
 
@@ -177,7 +240,7 @@ function _meth:decide( my_val )
         err = self:_choose_err( resps ),
     }
 
-    if not self:is_quorum( accepted_resps ) then
+    if not self:is_write_quorum( accepted_resps ) then
         return nil, errors.QuorumFailure, 'phase2: ' .. tableutil.repr(st.phase2.err)
     end
 
@@ -185,6 +248,39 @@ function _meth:decide( my_val )
 
     return val, nil, nil
 end
+function _meth:decide_promised( my_val )
+
+    -- phase2 only, with the round a quorum has promised to this leader.
+
+    if self.stat ~= nil then
+        return nil, errors.InvalidPhase, 'phase 1 and 2 has already run'
+    end
+
+    local pr = promised[ self:_promise_key() ]
+    pr.used_ver = self.ver + 1
+    self.rnd = pr.rnd
+
+    local resps = self:phase2( my_val, function(_resps)
+        return self:is_write_quorum( self:choose_p2( _resps ) )
+    end)
+    self.p2 = resps
+    local accepted_resps = self:choose_p2( resps )
+
+    self.stat = {
+        phase2 = {
+            ok = tableutil.keys( accepted_resps ),
+            err = self:_choose_err( resps ),
+        },
+    }
+
+    if not self:is_write_quorum( accepted_resps ) then
+        return nil, errors.QuorumFailure, 'promised phase2: ' .. tableutil.repr(self.stat.phase2.err)
+    end
+
+    self.stat.accepted_val = my_val
+
+    return my_val, nil, nil
+end
 function _meth:commit()
     local c, err, errmes = self:make_commit_data()
     if err then
@@ -194,9 +290,11 @@ function _meth:commit()
 end
 function _meth:commit_specific(c)
 
-    local resps = self:phase3(c)
+    local resps = self:phase3(c, function(_resps)
+        return self:is_write_quorum( self:choose_p3( _resps ) )
+    end)
     local positive = self:choose_p3( resps )
-    local ok = self:is_quorum( positive )
+    local ok = self:is_write_quorum( positive )
     if ok then
         return { ver=c.ver, val=c.val }, nil
     else
@@ -205,36 +303,58 @@ function _meth:commit_specific(c)
     end
 end
 -- paxos level api
-function _meth:phase1()
+--
+-- is_done is an optional function(resps) telling whether responses already
+-- received are enough. It takes effect only if messages are sent
+-- concurrently. See send_mes_all.
+function _meth:phase1(is_done, ver_end)
     local mes = {
         cmd = 'phase1',
         cluster_id = self.cluster_id,
+        inst = self.inst,
+        view_id = self.view_id,
         ver = self.ver + 1,
-        rnd = self.rnd
+        rnd = self.rnd,
+        ver_end = ver_end,
     }
-    return self:send_mes_all( mes )
+    local resps = self:send_mes_all( mes, is_done )
+
+    for id, resp in pairs(resps) do
+        if type(resp) == 'table' and resp.err == nil then
+            delta_peers[ self:_delta_peer_key( id ) ] = resp.delta == true or nil
+        end
+    end
+
+    return resps
 end
-function _meth:phase2(val)
+function _meth:phase2(val, is_done)
     local mes = {
         cmd = 'phase2',
         cluster_id = self.cluster_id,
+        inst = self.inst,
+        view_id = self.view_id,
         ver = self.ver + 1,
         rnd = self.rnd,
         val = val,
     }
-    return self:send_mes_all( mes )
+    return self:send_mes_all( mes, is_done, self:_delta_mes( mes ) )
 end
-function _meth:phase3(c)
+function _meth:phase3(c, is_done)
     local req = {
         cmd = 'phase3',
         cluster_id = self.cluster_id,
+        inst = self.inst,
+        view_id = self.view_id,
 
         ver = c.ver,
         val = c.val,
 
         __tag = c.__tag,
+
+        -- only for remote read
+        base = c.base,
     }
-    return self:send_mes_all( req )
+    return self:send_mes_all( req, is_done, self:_delta_mes( req ) )
 end
 function _meth:choose_p1( resps, my_val )
 
@@ -298,6 +418,16 @@ function _meth:_choose_no_err(resps)
     return positive
 end
 
+function _meth:_choose_committed(resps)
+    local committed = {}
+    for id, resp in pairs(resps) do
+        if resp.err ~= nil and resp.err.Code == errors.AlreadyCommitted then
+            committed[ id ] = resp
+        end
+    end
+    return committed
+end
+
 function _meth:_choose_err(resps)
     local err = {}
     for id, resp in pairs(resps) do
@@ -327,6 +457,19 @@ function _meth:make_commit_data()
     }
     return c
 end
+function _meth:is_write_quorum( accepted )
+
+    -- With impl.lease_read, a value is accepted and committed by the leader
+    -- only with its own acceptor, thus the local record of the leader is not
+    -- behind what it has written. See paxos.lease_read.
+
+    if self.impl.lease_read
+        and accepted[ self.ident ] == nil
+        and self:is_leader() then
+        return false
+    end
+    return self:is_quorum( accepted )
+end
 function _meth:is_quorum( accepted )
 
     for _, group in ipairs(self.view) do
@@ -342,14 +485,137 @@ function _meth:is_quorum( accepted )
 
     return true
 end
-function _meth:send_mes_all( mes )
+function _meth:send_mes_all( mes, is_done, delta_mes )
+
+    -- With impl.concurrent_send, messages are sent to all acceptors at once
+    -- by impl:run_all(). It returns as soon as is_done(resps) is satisfied
+    -- and the requests still in flight are cancelled.
+    --
+    -- delta_mes is an optional message with val_delta instead of val. It is
+    -- sent to acceptors supporting it. See _send_delta.
+
+    if self.impl.concurrent_send and self.impl.run_all ~= nil then
+        local fs = {}
+        for id, _ in pairs( self.acceptors ) do
+            fs[ id ] = function()
+                return self:_send_delta( id, mes, delta_mes )
+            end
+        end
+        return self.impl:run_all( fs, is_done )
+    end
+
     local resps = {}
     for id, _ in pairs( self.acceptors ) do
-        resps[ id ] = self.impl:send_req( self, id, mes )
+        resps[ id ] = self:_send_delta( id, mes, delta_mes )
     end
     return resps
 end
 
+-- delta messages
+--
+-- phase2 and phase3 carry val_delta, the fields changed against the
+-- committed of this proposer, instead of the entire val. An acceptor that
+-- does not have exactly the same committed responds with DeltaMismatch, and
+-- the full message is sent again.
+function _meth:_delta_peer_key( id )
+    return tostring(self.cluster_id) .. '/' .. id
+end
+function _meth:_delta_mes( mes )
+
+    local c = self.record.committed
+    if mes.ver ~= c.ver + 1 then
+        return nil
+    end
+
+    local d = delta.make( c, mes.val )
+    if d == nil then
+        return nil
+    end
+
+    local dmes = tableutil.dup( mes )
+    dmes.val = nil
+    dmes.val_delta = d
+    return dmes
+end
+function _meth:_send_delta( id, mes, delta_mes )
+
+    if delta_mes == nil or not delta_peers[ self:_delta_peer_key( id ) ] then
+        return self.impl:send_req( self, id, mes )
+    end
+
+    local resp = self.impl:send_req( self, id, delta_mes )
+    if type(resp) == 'table'
+        and resp.err ~= nil
+        and resp.err.Code == errors.DeltaMismatch then
+
+        resp = self.impl:send_req( self, id, mes )
+    end
+    return resp
+end
+
+-- stable leader
+--
+-- With impl.promise_nver, the leader asks acceptors in phase1 to promise its
+-- round for the next promise_nver versions. Following writes of this leader
+-- run only phase2 and phase3, until the leader lease expires, the versions
+-- run out or the promise is broken by a greater round.
+function _meth:_promise_key()
+    local k = tostring(self.cluster_id) .. '/' .. self.ident
+    if self.inst ~= nil then
+        k = k .. '/' .. self.inst
+    end
+    return k
+end
+function _meth:_promise_ver_end()
+    local nver = self.impl.promise_nver
+    if nver == nil or nver < 1 or not self:is_leader() then
+        return nil
+    end
+    return self.ver + 1 + nver
+end
+function _meth:is_leader()
+    return self:leader_lease() ~= nil
+end
+function _meth:leader_lease()
+    -- seconds left of the lease if this proposer is the leader, or nil.
+    local leader = base.valid_leader( self.record.committed.val )
+    if leader ~= nil and leader.ident == self.ident then
+        return leader.__lease
+    end
+    return nil
+end
+function _meth:promise( ver_end )
+    promised[ self:_promise_key() ] = {
+        rnd = self.rnd,
+        ver_end = ver_end,
+        used_ver = self.ver + 1,
+    }
+end
+function _meth:unpromise()
+    promised[ self:_promise_key() ] = nil
+end
+function _meth:is_promised()
+
+    if self.impl.promise_nver == nil then
+        return false
+    end
+
+    local pr = promised[ self:_promise_key() ]
+    if pr == nil then
+        return false
+    end
+
+    local ver = self.ver + 1
+
+    -- A round must never be used twice for one version, or different values
+    -- might be accepted in the same round.
+    if ver > pr.ver_end or ver <= pr.used_ver or not self:is_leader() then
+        return false
+    end
+
+    return true
+end
+
 function _meth:sync_committed()
     -- commit if there is stale record:
     --      1, version greater than current proposer found
@@ -0,0 +1,135 @@
+local _M = { _VERSION = require("acid.paxos._ver") }
+
+local json = require( "cjson" )
+local tableutil = require( "acid.tableutil" )
+local round = require( "acid.paxos.round" )
+
+-- Write-ahead log of acceptor record.
+--
+-- Every change to a record is appended as one or more entries, one line for
+-- each:
+--
+--      <chksum> <json>\n
+--
+-- Entry types:
+--
+--      { t="promise", rnd={}, ver_end=nil }
+--      { t="accept", vrnd={}, val={} }
+--      { t="commit", record={} }   -- replace the entire record
+--      { t="delete" }
+--
+-- A torn entry at the tail, left by a crash while appending, is detected
+-- by checksum and replay stops there.
+
+local function is_round_only(prev, rec)
+    for k, _ in pairs( tableutil.union( { prev, rec } ) ) do
+        if k ~= 'paxos_round' and not tableutil.eq( prev[ k ], rec[ k ] ) then
+            return false
+        end
+    end
+    return true
+end
+
+function _M.make_entries(prev, rec)
+
+    if rec == nil then
+        return { { t='delete' } }
+    end
+
+    if prev == nil or not is_round_only( prev, rec ) then
+        return { { t='commit', record=rec } }
+    end
+
+    local pr = prev.paxos_round or {}
+    local r = rec.paxos_round or {}
+    local entries = {}
+
+    if round.cmp( pr.rnd, r.rnd ) ~= 0 or pr.ver_end ~= r.ver_end then
+        table.insert( entries, { t='promise', rnd=r.rnd, ver_end=r.ver_end } )
+    end
+
+    if round.cmp( pr.vrnd, r.vrnd ) ~= 0 or not tableutil.eq( pr.val, r.val ) then
+        table.insert( entries, { t='accept', vrnd=r.vrnd, val=r.val } )
+    end
+
+    return entries
+end
+
+function _M.apply(rec, e)
+
+    if e.t == 'delete' then
+        return nil
+    elseif e.t == 'commit' then
+        return e.record
+    end
+
+    rec = rec or {}
+    rec.paxos_round = rec.paxos_round or {}
+    local r = rec.paxos_round
+
+    if e.t == 'promise' then
+        r.rnd = e.rnd
+        r.ver_end = e.ver_end
+    elseif e.t == 'accept' then
+        r.vrnd = e.vrnd
+        r.val = e.val
+    end
+
+    return rec
+end
+
+function _M.encode(entries, chksum)
+    local lines = {}
+    for _, e in ipairs( entries ) do
+        local cont = json.encode( e )
+        table.insert( lines, chksum( cont ) .. ' ' .. cont .. '\n' )
+    end
+    return table.concat( lines )
+end
+
+function _M.decode(cont, chksum)
+
+    -- Returns entries decoded and the length of the valid part of cont.
+    -- Valid length less than #cont means the tail is torn.
+
+    local entries = {}
+    local valid = 0
+
+    while valid < #cont do
+
+        local eol = cont:find( '\n', valid + 1, true )
+        if eol == nil then
+            break
+        end
+
+        local line = cont:sub( valid + 1, eol - 1 )
+        local sp = line:find( ' ', 1, true )
+        if sp == nil then
+            break
+        end
+
+        local sum, body = line:sub( 1, sp - 1 ), line:sub( sp + 1 )
+        if chksum( body ) ~= sum then
+            break
+        end
+
+        local ok, e = pcall( json.decode, body )
+        if not ok or type( e ) ~= 'table' then
+            break
+        end
+
+        table.insert( entries, e )
+        valid = eol
+    end
+
+    return entries, valid
+end
+
+function _M.replay(rec, entries)
+    for _, e in ipairs( entries ) do
+        rec = _M.apply( rec, e )
+    end
+    return rec
+end
+
+return _M
@@ -1,6 +1,7 @@
 local _M = { _VERSION = require("acid.paxos._ver") }
 local tableutil = require( "acid.tableutil" )
 local base = require( "acid.paxos.base" )
+local codec = require( "acid.codec" )
 local errors = base.errors
 
 local nr_retry = 5
@@ -31,6 +32,298 @@ function _M.elect_leader(paxos, lease)
         __lease = lease,
     })
 end
+-- pending sets of each paxos instance of cluster in this worker:
+-- { <cluster_id>[/<inst>]={ pending={ <job>, .. }, running=false, sema=, nr_wait=0 } }
+local set_queues = {}
+
+function _M.batch_set(paxos, key, val, window)
+
+    -- Sets to one cluster arriving within `window` seconds are merged into
+    -- one val and committed by one paxos round. The first caller drives the
+    -- round while the others wait for it. Every caller gets its own
+    -- { ver=, key=, val= }.
+    --
+    -- Waiters are woken up by q.sema, posted once for each of them when a
+    -- round finishes. If impl has no new_sema(), waiters poll.
+
+    if type(key) ~= 'string' then
+        return nil, errors.InvalidArgument, 'field_key must be string for set'
+    end
+
+    local qkey = table.concat( { paxos.member_id.cluster_id, paxos.member_id.inst }, '/' )
+    local q = set_queues[ qkey ]
+    if q == nil then
+        q = { pending = {}, running = false, nr_wait = 0 }
+
+        if paxos.impl.new_sema ~= nil then
+            local sema, err = paxos.impl:new_sema()
+            if err then
+                return nil, errors.InternalError, 'semaphore: ' .. tostring(err)
+            end
+            q.sema = sema
+        end
+
+        set_queues[ qkey ] = q
+    end
+
+    local job = { key = key, val = val, done = false }
+    table.insert( q.pending, job )
+
+    while not job.done do
+
+        if q.running then
+            q.nr_wait = q.nr_wait + 1
+            if q.sema ~= nil then
+                -- timeout only in case the round never finishes
+                q.sema:wait( 1 )
+            else
+                paxos.impl:sleep( 0.001 )
+            end
+            q.nr_wait = q.nr_wait - 1
+        else
+            q.running = true
+
+            if window > 0 then
+                paxos.impl:sleep( window )
+            end
+
+            local jobs = q.pending
+            q.pending = {}
+
+            local ok, err = pcall( _M.apply_sets, paxos, jobs )
+            if not ok then
+                for _, j in ipairs( jobs ) do
+                    j.err = errors.InternalError
+                    j.errmes = tostring( err )
+                    j.done = true
+                end
+            end
+
+            -- let waiters take over
+            q.running = false
+
+            if q.sema ~= nil and q.nr_wait > 0 then
+                q.sema:post( q.nr_wait )
+            end
+        end
+    end
+
+    if #q.pending == 0 and not q.running and q.nr_wait == 0 then
+        set_queues[ qkey ] = nil
+    end
+
+    return job.rst, job.err, job.errmes
+end
+function _M.apply_sets(paxos, jobs)
+
+    -- Apply jobs = { { key=, val= }, .. } in one paxos round. Result of each
+    -- job is set in job.rst or job.err, job.errmes.
+
+    -- later set of the same key wins
+    local fields = {}
+    for _, j in ipairs( jobs ) do
+        fields[ j.key ] = j.val
+    end
+
+    local c, err, errmes = paxos:mset( fields )
+
+    for _, j in ipairs( jobs ) do
+        if err then
+            j.err, j.errmes = err, errmes
+        else
+            j.rst = { ver=c.ver, key=j.key, val=c.val[ j.key ] }
+        end
+        j.done = true
+    end
+end
+function _M.make_snapshot(paxos, ver)
+
+    -- Committed of this member for a lagging member to pull:
+    --      { ver=, data=<json of { ver=, val=, __tag= }>, chksum= }
+    -- data and chksum are absent if committed is not newer than ver.
+
+    local args = paxos:_paxos_args()
+    args.ver = nil
+
+    local p, err, errmes = paxos.proposer.new( args, paxos.impl )
+    if err then
+        return nil, err, errmes
+    end
+
+    local c = p.record.committed
+    if ver ~= nil and c.ver <= ver then
+        return { ver=c.ver }, nil, nil
+    end
+
+    local data = codec.json.encode( { ver=c.ver, val=c.val, __tag=c.__tag } )
+    return { ver=c.ver, data=data, chksum=paxos.impl:chksum( data ) }, nil, nil
+end
+-- members of this worker running catch_up:
+-- { "paxos_catch_up/<cluster_id>/<ident>[/<inst>]"=true }
+local catching_up = {}
+
+-- seconds a catch up is taken as running by other workers, in case the
+-- worker running it exits without clearing its flag.
+_M.catch_up_timeout = 60
+
+local function lock_catch_up(paxos)
+
+    -- At most one catch up runs for a member at a time. With impl.add_flag
+    -- it is so across workers. Returns the key to unlock, or nil if one is
+    -- already running.
+
+    local mid = paxos.member_id
+    local key = table.concat( { 'paxos_catch_up', mid.cluster_id, mid.ident, mid.inst }, '/' )
+    if catching_up[ key ] then
+        return nil
+    end
+
+    if paxos.impl.add_flag ~= nil
+        and not paxos.impl:add_flag( key, _M.catch_up_timeout ) then
+        return nil
+    end
+
+    catching_up[ key ] = true
+    return key
+end
+local function unlock_catch_up(paxos, key)
+    catching_up[ key ] = nil
+    if paxos.impl.del_flag ~= nil then
+        paxos.impl:del_flag( key )
+    end
+end
+local function catch_up_locked(paxos, key, ver)
+
+    local ok, rst, err, errmes = pcall( _M._catch_up, paxos, ver )
+    unlock_catch_up( paxos, key )
+
+    if not ok then
+        return nil, errors.InternalError, tostring( rst )
+    end
+    return rst, err, errmes
+end
+
+function _M.catch_up(paxos, ver)
+
+    -- Pull the latest committed from other members and install it with a
+    -- local phase3 if it is newer than the local one. Returns the committed
+    -- installed, or nil if this member is up to date.
+    --
+    -- ver is the optional version known to be committed on other members.
+    -- Nothing is sent if the local one is not older, and it stops as soon
+    -- as a member has sent it.
+    --
+    -- A member behind the others repairs itself this way, without a
+    -- proposer running a commit to all members for it.
+
+    local key = lock_catch_up( paxos )
+    if key == nil then
+        return nil, nil, nil
+    end
+
+    return catch_up_locked( paxos, key, ver )
+end
+function _M.catch_up_async(paxos, ver)
+
+    -- The same as catch_up but in background with impl:run_async(). Nothing
+    -- is started if a catch up of the member is already running.
+
+    local key = lock_catch_up( paxos )
+    if key == nil then
+        return nil, nil, nil
+    end
+
+    local _, err, errmes = paxos.impl:run_async( function()
+        local _, err, errmes = catch_up_locked( paxos, key, ver )
+        if err then
+            paxos:logerr( "catch up:", err, errmes, paxos.member_id )
+        end
+    end )
+    if err then
+        unlock_catch_up( paxos, key )
+        return nil, err, errmes
+    end
+
+    return nil, nil, nil
+end
+function _M._catch_up(paxos, known)
+
+    local args = paxos:_paxos_args()
+    args.ver = nil
+
+    local p, err, errmes = paxos.proposer.new( args, paxos.impl )
+    if err then
+        return nil, err, errmes
+    end
+
+    local ver = p.record.committed.ver
+    local latest
+
+    for id, _ in pairs( p.acceptors ) do
+        if known ~= nil and ver >= known then
+            break
+        end
+        if id ~= p.ident then
+            -- only snapshot newer than the one already got is sent back.
+            local c = _M._fetch_snapshot( paxos, p, id, ver )
+            if c ~= nil then
+                latest = c
+                ver = c.ver
+            end
+        end
+    end
+
+    if latest == nil then
+        return nil, nil, nil
+    end
+
+    local acc, err, errmes = paxos.acceptor.new( args, paxos.impl )
+    if err then
+        return nil, err, errmes
+    end
+
+    local _, err, errmes = acc:process( {
+        cmd = 'phase3',
+        cluster_id = args.cluster_id,
+        inst = args.inst,
+        ver = latest.ver,
+        val = latest.val,
+        __tag = latest.__tag,
+    } )
+    if err then
+        return nil, err, errmes
+    end
+
+    paxos:track( 'catch_up:' .. tostring(latest.ver) )
+
+    return { ver=latest.ver, val=latest.val }, nil, nil
+end
+function _M._fetch_snapshot(paxos, p, id, ver)
+
+    local rst = paxos.impl:send_req( p, id, {
+        cmd = 'snapshot',
+        cluster_id = p.cluster_id,
+        inst = p.inst,
+        ver = ver,
+    } )
+
+    if type(rst) ~= 'table' or rst.err ~= nil or rst.data == nil then
+        return nil
+    end
+
+    if paxos.impl:chksum( rst.data ) ~= rst.chksum then
+        paxos:logerr( 'snapshot checksum mismatch from:', id, paxos.member_id )
+        return nil
+    end
+
+    local ok, c = pcall( codec.json.decode, rst.data )
+    if not ok or type(c) ~= 'table' or c.ver ~= rst.ver or c.ver <= ver then
+        paxos:logerr( 'invalid snapshot from:', id, paxos.member_id )
+        return nil
+    end
+
+    return c
+end
 function _M.change_view(paxos, changes)
     -- changes = {
     --     add = { a=1, b=1 },
@@ -67,6 +360,9 @@ function _M._change_view(paxos, changes)
         return nil, err, errmes
     end
 
+    -- committed read might be shared with cache
+    c = tableutil.dup( c, true )
+
     _M._merge_changes( c.val, changes.merge or {} )
 
     local cval = c.val
@@ -13,14 +13,38 @@ _M.adm_method = {
     get_or_elect_leader = true,
     get = true,
     set = true,
+    mset = true,
     isalive = true,
+    watch = true,
 
     read = true,
     local_read = true,
+    read_history = true,
+    changes_since = true,
+    snapshot = true,
+    cache_stat = true,
 }
 
 local function _true() return true, nil, nil end
 
+local function _catch_up(paxos)
+    local _, err, errmes = paxoshelper.catch_up(paxos)
+    if err then
+        paxos:logerr( "catch up:", err, errmes, paxos.member_id )
+    end
+end
+
+local function sync_on_err(paxos, err)
+    -- A write fails with VerNotExist if this member is behind. Catching up
+    -- is enough, without running commit on all members.
+    if err == errors.VerNotExist then
+        paxos.ver = nil
+        _catch_up(paxos)
+    else
+        paxos:sync()
+    end
+end
+
 function _M.new(impl, opt)
 
     opt = opt or {}
@@ -28,6 +52,20 @@ function _M.new(impl, opt)
     local srv = {
         impl = impl,
         handlers = opt.handlers or {},
+
+        -- seconds to wait for concurrent sets to one cluster to be merged
+        -- into one paxos round. nil disables it.
+        set_window = opt.set_window,
+
+        -- function(key) returns name of the paxos instance a user key
+        -- belongs to, or nil for the main instance. Keys in different
+        -- instances are written in parallel, each with its own version.
+        -- Instance names are used in storage file names.
+        -- "view" and "leader" always belong to the main instance.
+        inst_of = opt.inst_of,
+
+        -- max seconds a watch request waits for a newer version.
+        watch_timeout = opt.watch_timeout or 30,
     }
 
     setmetatable(srv, _meta)
@@ -41,7 +79,12 @@ function _M:handle_req()
         self:err_exit(err, errmes)
     end
 
-    local rst, err, errmes = self:_handle_req( req )
+    local rst, err, errmes
+    if req.cmd == 'batch' and req.cluster_id == nil then
+        rst, err, errmes = self:_handle_batch( req )
+    else
+        rst, err, errmes = self:_handle_req( req )
+    end
 
     if err then
         self:err_exit(err, errmes)
@@ -56,6 +99,16 @@ function _M:_handle_req(req)
         return nil, err, errmes
     end
 
+    -- inst in request is only for paxos messages between members. The
+    -- instance of an admin command is decided by its keys, thus "view" and
+    -- "leader" are always in the main instance.
+    if self.adm_method[ cmd ] then
+        member_id.inst, err, errmes = self:_inst_of_req(req)
+        if err then
+            return nil, err, errmes
+        end
+    end
+
     local paxos, err, errmes = self:new_paxos(member_id)
     if err then
         return nil, err, errmes
@@ -67,7 +120,19 @@ function _M:_handle_req(req)
         if err then
             return nil, err, errmes
         end
-        return acceptor:process(req)
+
+        local rst, err, errmes = acceptor:process(req)
+
+        -- The proposer has committed req.ver - 1 and this member has not.
+        -- Pull it from other members in background.
+        if err == errors.VerNotExist and self.impl.run_async ~= nil then
+            local _, err, errmes = paxoshelper.catch_up_async( paxos, req.ver - 1 )
+            if err then
+                paxos:logerr( "catch up:", err, errmes, paxos.member_id )
+            end
+        end
+
+        return rst, err, errmes
 
     elseif self.adm_method[ cmd ] then
 
@@ -91,12 +156,30 @@ function _M:_handle_req(req)
             return paxos:get( req.key )
 
         elseif cmd == 'set' then
-            local rst, err, errmes = paxos:set( req.key, req.val )
+            local rst, err, errmes
+            if self.set_window ~= nil and paxos.ver == nil then
+                rst, err, errmes = ph.batch_set( paxos, req.key, req.val, self.set_window )
+            else
+                rst, err, errmes = paxos:set( req.key, req.val )
+            end
+            if err then
+                sync_on_err( paxos, err )
+            end
+            return rst, err, errmes
+
+        elseif cmd == 'mset' then
+            local rst, err, errmes = paxos:mset( req.fields )
             if err then
-                paxos:sync()
+                sync_on_err( paxos, err )
             end
             return rst, err, errmes
 
+        elseif cmd == 'watch' then
+            -- req.ver is the version the client already has, not the
+            -- version to operate on.
+            paxos.ver = nil
+            return self:_watch(paxos, req)
+
         elseif cmd == 'isalive' then
             return self:_isalive(paxos, req)
 
@@ -109,6 +192,36 @@ function _M:_handle_req(req)
             -- same as 'read' but return value in local storage without
             -- querying other member for latest committed value.
             return paxos:read()
+
+        elseif cmd == 'read_history' then
+            -- read a retained version req.ver from local storage, or the
+            -- field req.key of it.
+            paxos.ver = nil
+            local c, err, errmes = paxos:read_history(req.ver)
+            if err then
+                return nil, err, errmes
+            end
+            if req.key ~= nil then
+                return paxos:_make_get_rst(req.key, c)
+            end
+            return c
+
+        elseif cmd == 'changes_since' then
+            paxos.ver = nil
+            return paxos:changes_since(req.ver)
+
+        elseif cmd == 'snapshot' then
+            -- req.ver is the version the requester has.
+            paxos.ver = nil
+            return ph.make_snapshot(paxos, req.ver)
+
+        elseif cmd == 'cache_stat' then
+            -- counters of the record cache of the worker serving it:
+            -- { hits=, misses=, stales=, evictions=, size=, capacity= }
+            if self.impl.record_cache_stat == nil then
+                return nil, errors.InvalidCommand, 'record cache is not supported'
+            end
+            return self.impl:record_cache_stat()
         end
 
     elseif self.handlers[cmd] then
@@ -120,6 +233,151 @@ function _M:_handle_req(req)
     end
 end
 
+function _M:_handle_batch(req)
+
+    -- Run every request in req.reqs, each with cluster_id, ident and cmd in
+    -- it as a normal request has. Results are responded in the same order:
+    --
+    --      { rsts = { {...}, { err={ Code=, Message= } }, ... } }
+
+    if type(req.reqs) ~= 'table' then
+        return nil, errors.InvalidMessage, 'reqs must be table'
+    end
+
+    local fs = {}
+    for i, r in ipairs(req.reqs) do
+        fs[i] = function()
+            local rst, err, errmes
+            if type(r) ~= 'table' then
+                err, errmes = errors.InvalidMessage, 'request in batch must be table'
+            elseif not acid_paxos.acceptor.is_cmd( r.cmd ) and r.cmd ~= 'isalive' then
+                -- only messages between members. Admin commands take locks
+                -- and must not run concurrently in one batch.
+                err, errmes = errors.InvalidCommand, 'not allowed in batch: ' .. tostring( r.cmd )
+            else
+                rst, err, errmes = self:_handle_req( r )
+            end
+            if err then
+                return { err={ Code=err, Message=errmes } }
+            end
+            return rst or {}
+        end
+    end
+
+    local rsts
+    if self.impl.run_all ~= nil then
+        rsts = self.impl:run_all( fs )
+    else
+        rsts = {}
+        for i, f in ipairs(fs) do
+            rsts[i] = f()
+        end
+    end
+
+    local out = {}
+    for i = 1, #fs do
+        out[i] = rsts[i] or { err={ Code=errors.InternalError,
+                                    Message='request in batch failed' } }
+    end
+
+    return { rsts = out }, nil, nil
+end
+
+local _main_keys = {
+    view = true,
+    leader = true,
+}
+
+function _M:_inst_of_key(key)
+    if self.inst_of == nil or type(key) ~= 'string' or _main_keys[ key ] then
+        return nil
+    end
+    return self.inst_of(key)
+end
+function _M:_inst_of_req(req)
+
+    if self.inst_of == nil then
+        return nil, nil, nil
+    end
+
+    -- snapshot is sent between members to catch up an instance. It is read
+    -- only and does not touch view or leader. See paxoshelper.catch_up.
+    if req.cmd == 'snapshot' then
+        return req.inst, nil, nil
+    end
+
+    if req.cmd == 'get' or req.cmd == 'set'
+        or req.cmd == 'watch' or req.cmd == 'read_history' then
+        return self:_inst_of_key(req.key), nil, nil
+
+    elseif req.cmd == 'mset' and type(req.fields) == 'table' then
+
+        local inst
+        local first = true
+        for k, _ in pairs(req.fields) do
+            local i = self:_inst_of_key(k)
+            if not first and i ~= inst then
+                return nil, errors.InvalidArgument, 'fields of mset must be in one instance'
+            end
+            inst = i
+            first = false
+        end
+        return inst, nil, nil
+    end
+
+    return nil, nil, nil
+end
+
+function _M:_watch(paxos, req)
+
+    -- Long poll of committed version on this member. It responds as soon as
+    -- a version newer than req.ver is committed, or with the current version
+    -- when timeout passes. Response is the same as "local_read" or, with
+    -- req.key, the same as "get" from local storage.
+
+    if self.impl.watch_wait == nil then
+        return nil, errors.InvalidCommand, 'watch is not supported'
+    end
+
+    local function _read()
+        if req.key == nil then
+            return paxos:read()
+        end
+        return paxos:local_get(req.key)
+    end
+
+    local rst, err, errmes = _read()
+    if err then
+        return nil, err, errmes
+    end
+
+    local known = tonumber(req.ver)
+    if known == nil or rst.ver > known then
+        return rst, nil, nil
+    end
+
+    -- The version impl knows might be missing or older than the local one,
+    -- e.g. evicted from shared dict. Waiting on it would not be woken up
+    -- until the next commit.
+    if self.impl.watch_notify ~= nil then
+        self.impl:watch_notify(paxos.member_id, rst.ver)
+    end
+
+    local timeout = math.min( tonumber(req.timeout) or self.watch_timeout,
+                              self.watch_timeout )
+
+    local ver, err, errmes = self.impl:watch_wait(paxos.member_id, known, timeout)
+    if err then
+        return nil, err, errmes
+    end
+
+    if ver == nil then
+        return rst, nil, nil
+    end
+
+    return _read()
+end
+
 function _M:_isalive(paxos, req)
     local _mem, err, errmes = paxos:local_get_mem()
     if err then
@@ -0,0 +1,59 @@
+local _M = { _VERSION = "0.1" }
+
+-- Round trip time estimation and retransmission timeout, as TCP does in
+-- RFC 6298. Times are in milliseconds.
+--
+--      local srtt, rttvar = rtt.update( srtt, rttvar, sample )
+--      local timeout = rtt.timeout( srtt, rttvar, min, max )
+
+local ALPHA = 1 / 8
+local BETA = 1 / 4
+local K = 4
+
+function _M.update(srtt, rttvar, r)
+
+    -- Returns the new srtt and rttvar after a sample r. srtt is nil if
+    -- there is no sample yet.
+
+    if srtt == nil then
+        return r, r / 2
+    end
+
+    rttvar = ( 1 - BETA ) * rttvar + BETA * math.abs( srtt - r )
+    srtt = ( 1 - ALPHA ) * srtt + ALPHA * r
+
+    return srtt, rttvar
+end
+
+function _M.timeout(srtt, rttvar, min, max, k)
+
+    -- srtt + k * rttvar in [min, max]. It is max without any sample.
+
+    if srtt == nil then
+        return max
+    end
+
+    local t = srtt + ( k or K ) * rttvar
+    return math.floor( math.min( math.max( t, min ), max ) )
+end
+
+function _M.encode(srtt, rttvar)
+    return string.format( "%.3f %.3f", srtt, rttvar )
+end
+
+function _M.decode(s)
+
+    if s == nil then
+        return nil, nil
+    end
+
+    local srtt, rttvar = s:match( "^(%S+) (%S+)$" )
+    srtt, rttvar = tonumber( srtt ), tonumber( rttvar )
+    if srtt == nil or rttvar == nil then
+        return nil, nil
+    end
+
+    return srtt, rttvar
+end
+
+return _M
@@ -0,0 +1,315 @@
+local _M = { _VERSION = "0.1" }
+
+-- Run jobs periodically, each in its own light thread, with at most
+-- `concurrency` of them running at once. Jobs are kept in a min-heap by
+-- the time they are due thus a slow job does not delay the others.
+--
+--      local s = scheduler.new({
+--          concurrency = 16,
+--          interval = 1,
+--          run = function(key, job) ... end,
+--      })
+--      s:set_jobs( { [key]=job, .. } )
+--      s:loop( refresh ) -- refresh() returns all jobs, see set_jobs()
+--
+-- After a job finishes, it is due again in `interval` seconds, or at the
+-- time returned by opt.due(key, job, t) if it is earlier than t. Up to
+-- `jitter` * `interval` seconds are added randomly to spread jobs.
+--
+-- `stat()` returns how late jobs started comparing to when they were due:
+--      { nr_jobs=, nr_running=, nr_run=, nr_err=, lag_max=, lag_avg= }
+
+local _meth = { _VERSION = _M._VERSION }
+local _mt = { __index = _meth }
+
+local function _spawn(f)
+    -- A timer instead of a light thread: a light thread is not freed until
+    -- the thread spawning it waits for it, and loop() never does.
+    return ngx.timer.at( 0, function(premature)
+        if not premature then
+            f()
+        end
+    end)
+end
+local function _sleep(n)
+    return ngx.sleep(n)
+end
+local function _now()
+    return ngx.now()
+end
+local function _exiting()
+    return ngx.worker.exiting()
+end
+
+function _M.new(opt)
+
+    local s = {
+        concurrency = opt.concurrency or 16,
+        interval = opt.interval or 1,
+        jitter = opt.jitter or 0.1,
+
+        -- max seconds to sleep in loop()
+        tick = opt.tick or 0.1,
+        -- seconds between two calls to refresh() in loop()
+        refresh_interval = opt.refresh_interval or opt.interval or 1,
+
+        run = opt.run,
+        due = opt.due,
+
+        spawn = opt.spawn or _spawn,
+        sleep = opt.sleep or _sleep,
+        now = opt.now or _now,
+        exiting = opt.exiting or _exiting,
+        random = opt.random or math.random,
+
+        -- { key={ job=, seq=, running= } }
+        jobs = {},
+        nr_jobs = 0,
+        nr_running = 0,
+
+        -- min-heap of { due, key, seq }. An element is valid only if its seq
+        -- is the latest of the job.
+        heap = {},
+        seq = 0,
+
+        nr_run = 0,
+        nr_err = 0,
+        lag_max = 0,
+        lag_sum = 0,
+    }
+    return setmetatable( s, _mt )
+end
+
+local function _less(a, b)
+    return a[ 1 ] < b[ 1 ]
+end
+
+local function _heap_push(h, elt)
+    table.insert( h, elt )
+    local i = #h
+    while i > 1 do
+        local p = math.floor( i / 2 )
+        if not _less( h[ i ], h[ p ] ) then
+            break
+        end
+        h[ i ], h[ p ] = h[ p ], h[ i ]
+        i = p
+    end
+end
+
+local function _heap_pop(h)
+
+    local n = #h
+    if n == 0 then
+        return nil
+    end
+
+    local top = h[ 1 ]
+    h[ 1 ] = h[ n ]
+    h[ n ] = nil
+    n = n - 1
+
+    local i = 1
+    while true do
+        local l, r = i * 2, i * 2 + 1
+        local m = i
+        if l <= n and _less( h[ l ], h[ m ] ) then
+            m = l
+        end
+        if r <= n and _less( h[ r ], h[ m ] ) then
+            m = r
+        end
+        if m == i then
+            break
+        end
+        h[ i ], h[ m ] = h[ m ], h[ i ]
+        i = m
+    end
+
+    return top
+end
+
+_M._heap_push = _heap_push
+_M._heap_pop = _heap_pop
+
+function _meth:_schedule(key, t)
+
+    local j = self.jobs[ key ]
+
+    if self.due ~= nil then
+        local d = self.due( key, j.job, t )
+        -- a time already passed would make the job run again at once.
+        if d ~= nil and d < t and d > self.now() then
+            t = d
+        end
+    end
+
+    t = t + self.random() * self.jitter * self.interval
+
+    self.seq = self.seq + 1
+    j.seq = self.seq
+    _heap_push( self.heap, { t, key, j.seq } )
+end
+
+function _meth:add(key, job)
+
+    if self.jobs[ key ] ~= nil then
+        self.jobs[ key ].job = job
+        return
+    end
+
+    self.jobs[ key ] = { job = job }
+    self.nr_jobs = self.nr_jobs + 1
+
+    -- spread new jobs over one interval.
+    local now = self.now()
+    self.seq = self.seq + 1
+    self.jobs[ key ].seq = self.seq
+    _heap_push( self.heap, { now + self.random() * self.interval, key, self.seq } )
+end
+
+function _meth:remove(key)
+    if self.jobs[ key ] ~= nil then
+        self.jobs[ key ] = nil
+        self.nr_jobs = self.nr_jobs - 1
+    end
+end
+
+function _meth:set_jobs(jobs)
+
+    -- Add jobs not yet scheduled and remove those not in jobs.
+
+    for key, _ in pairs( self.jobs ) do
+        if jobs[ key ] == nil then
+            self:remove( key )
+        end
+    end
+
+    for key, job in pairs( jobs ) do
+        self:add( key, job )
+    end
+end
+
+function _meth:_start(key, due)
+
+    local j = self.jobs[ key ]
+    local now = self.now()
+
+    local lag = math.max( now - due, 0 )
+    self.lag_max = math.max( self.lag_max, lag )
+    self.lag_sum = self.lag_sum + lag
+    self.nr_run = self.nr_run + 1
+
+    j.running = true
+    self.nr_running = self.nr_running + 1
+
+    local ok, err = self.spawn( function()
+
+        local ok, err = pcall( self.run, key, j.job )
+        if not ok then
+            self.nr_err = self.nr_err + 1
+            if ngx ~= nil then
+                ngx.log( ngx.ERR, "scheduler job ", tostring(key), ": ", tostring(err) )
+            end
+        end
+
+        j.running = false
+        self.nr_running = self.nr_running - 1
+
+        -- removed while running
+        if self.jobs[ key ] == j then
+            self:_schedule( key, self.now() + self.interval )
+        end
+    end)
+
+    if not ok then
+        self.nr_err = self.nr_err + 1
+        if ngx ~= nil then
+            ngx.log( ngx.ERR, "scheduler spawn ", tostring(key), ": ", tostring(err) )
+        end
+
+        j.running = false
+        self.nr_running = self.nr_running - 1
+        self:_schedule( key, now + self.interval )
+    end
+end
+
+function _meth:step()
+
+    -- Start jobs that are due, as many as concurrency allows. Returns
+    -- seconds until the next job is due, or nil if there is no job.
+
+    local h = self.heap
+
+    while h[ 1 ] ~= nil do
+
+        local due, key, seq = h[ 1 ][ 1 ], h[ 1 ][ 2 ], h[ 1 ][ 3 ]
+        local j = self.jobs[ key ]
+
+        if j == nil or j.seq ~= seq then
+            -- removed or rescheduled
+            _heap_pop( h )
+
+        else
+            local now = self.now()
+            if due > now then
+                return due - now
+            end
+
+            if self.nr_running >= self.concurrency then
+                return 0
+            end
+
+            _heap_pop( h )
+            self:_start( key, due )
+        end
+    end
+
+    return nil
+end
+
+function _meth:loop(refresh)
+
+    -- Run until worker exits. refresh() returns all jobs to run, it is
+    -- called every refresh_interval seconds.
+
+    local next_refresh = 0
+
+    while not self.exiting() do
+
+        if refresh ~= nil and self.now() >= next_refresh then
+            local jobs = refresh()
+            if jobs ~= nil then
+                self:set_jobs( jobs )
+            end
+            next_refresh = self.now() + self.refresh_interval
+        end
+
+        local wait = self:step() or self.tick
+        self.sleep( math.max( math.min( wait, self.tick ), 0.001 ) )
+    end
+end
+
+function _meth:stat()
+    local avg = 0
+    if self.nr_run > 0 then
+        avg = self.lag_sum / self.nr_run
+    end
+    return {
+        nr_jobs = self.nr_jobs,
+        nr_running = self.nr_running,
+        nr_run = self.nr_run,
+        nr_err = self.nr_err,
+        lag_max = self.lag_max,
+        lag_avg = avg,
+    }
+end
+
+function _meth:reset_stat()
+    self.nr_run = 0
+    self.nr_err = 0
+    self.lag_max = 0
+    self.lag_sum = 0
+end
+
+return _M
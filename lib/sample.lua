@@ -1,5 +1,6 @@
 local acid_cluster = require( "acid.cluster" )
 local impl_ngx = require( "acid.impl_ngx" )
+local scheduler = require( "acid.scheduler" )
 
 local _M = {}
 
@@ -7,6 +8,8 @@ local impl = impl_ngx.new({})
 impl.api_uri = '/api'
 impl.sto_base_path = "/tmp/paxos_test"
 impl.tracking_varname = 'paxos_log'
+impl.concurrent_send = true
+impl.promise_nver = 16
 impl.get_addrs = function( impl, member_id, member )
     local ident = member_id.ident
     return { {'127.0.0.1', 9080+tonumber(ident)} }
@@ -40,7 +43,8 @@ _M.cluster = acid_cluster.new(impl, {
 local function list_member_ids()
     local ms = {}
     for _, ident in ipairs(_M.members_on_this_node) do
-        table.insert( ms, {cluster_id="x", ident=ident} )
+        local mid = {cluster_id="x", ident=ident}
+        ms[ mid.cluster_id .. '/' .. ident ] = mid
     end
     return ms
 end
@@ -52,25 +56,30 @@ function _M.init_cluster_check(enabled)
 
     local check_interval = 1
 
-    local timer_work
-
-    timer_work = function (premature)
-
-        if premature then
-            -- worker is shutting down
-            return
-        end
-
-        for _, mid in ipairs( list_member_ids() ) do
+    -- Members are checked concurrently, thus a slow check of one cluster
+    -- does not delay the others.
+    _M.scheduler = scheduler.new({
+        concurrency = 16,
+        interval = check_interval,
+        jitter = 0.2,
+        run = function(key, mid)
             local rst, err, errmes = _M.cluster:member_check(mid)
             if err then
                 ngx.log( ngx.ERR, 'member_check: ', rst, ' ', err, ' ', tostring(errmes) )
             end
-        end
+        end,
+        due = function(key, mid, t)
+            return _M.cluster:next_check_time(mid, t)
+        end,
+    })
 
-        local ok, err = ngx.timer.at( check_interval, timer_work )
-    end
-    local ok, err = ngx.timer.at( check_interval, timer_work )
+    local ok, err = ngx.timer.at( 0, function(premature)
+        if premature then
+            -- worker is shutting down
+            return
+        end
+        _M.scheduler:loop( list_member_ids )
+    end)
 end
 
 return _M
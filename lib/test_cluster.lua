@@ -0,0 +1,181 @@
+local cluster = require( "acid.cluster" )
+
+local function make_paxos(cluster_id, alive, nsent)
+
+    -- alive[ident] is nil for a node not responding, or an error code the
+    -- member responds with, or true.
+
+    local clock = { now=100 }
+    local paxos = {
+        member_id = { cluster_id=cluster_id, ident='a' },
+        impl = {
+            time = function() return clock.now end,
+        },
+    }
+
+    function paxos:send_req(ident, req)
+        nsent[ident] = ( nsent[ident] or 0 ) + 1
+        local a = alive[ident]
+        if a == nil then
+            return nil, 'SocketError', 'timeout'
+        elseif a == true then
+            return {}
+        end
+        return { err={ Code=a, Message='x' } }
+    end
+
+    function paxos:local_get_members()
+        local ms = {}
+        for ident, _ in pairs(alive) do
+            ms[ident] = { node=ident }
+        end
+        ms.dead = { node='dead' }
+        return { val=ms }
+    end
+
+    function paxos:logerr() end
+
+    return paxos, clock
+end
+
+local function make_cluster()
+    local impl = {
+        time = function() return 100 end,
+        get_addrs = function(self, member_id, member)
+            return { { member.node, 80 } }
+        end,
+    }
+    local c = cluster.new( impl, { admin_lease=10, node_down_ttl=5 } )
+    c._node_down = {}
+    c._dead = {}
+    return c
+end
+
+function test_node_down_cache(t)
+
+    local c = make_cluster()
+    local nsent = {}
+
+    local p1, clock1 = make_paxos( 'x', {}, nsent )
+    local p2, clock2 = make_paxos( 'y', {}, nsent )
+
+    local _, err = c:send_member_alive( p1, 'dead', { node='dead' } )
+    t:eq( 'SocketError', err )
+    t:eq( 1, nsent.dead )
+
+    -- another cluster on the same node uses the cached result
+    local _, err = c:send_member_alive( p2, 'dead', { node='dead' } )
+    t:eq( 'SocketError', err )
+    t:eq( 1, nsent.dead )
+
+    -- probe again after ttl
+    clock2.now = 106
+    local _, err = c:send_member_alive( p2, 'dead', { node='dead' } )
+    t:eq( 'SocketError', err )
+    t:eq( 2, nsent.dead )
+
+    -- without member, it does not know the node
+    local _, err = c:send_member_alive( p1, 'dead' )
+    t:eq( 3, nsent.dead )
+end
+
+function test_node_down_cache_member_err(t)
+
+    local c = make_cluster()
+    local nsent = {}
+
+    local p, clock = make_paxos( 'x', { b='Damaged' }, nsent )
+
+    for i = 1, 2 do
+        local _, err = c:send_member_alive( p, 'b', { node='b' } )
+        t:eq( 'Damaged', err )
+        t:eq( i, nsent.b, 'error responded by member is not cached' )
+    end
+    t:eq( nil, c._node_down['b:80'] )
+end
+
+function test_find_down(t)
+
+    local c = make_cluster()
+
+    for _, concurrent in ipairs( { false, true } ) do
+
+        local nsent = {}
+        local p = make_paxos( 'x', { a=true, b='Damaged', m='Migrating' }, nsent )
+        p.impl.wait_run = function() end
+
+        local nr_run_all = 0
+        if concurrent then
+            p.impl.run_all = function( self, fs )
+                nr_run_all = nr_run_all + 1
+                local rsts = {}
+                for k, f in pairs( fs ) do
+                    rsts[ k ] = f()
+                end
+                return rsts
+            end
+        end
+
+        c._node_down = {}
+        c._dead = {}
+
+        local down, err = c:find_down( p )
+        t:eq( nil, err )
+        t:eq( concurrent and 1 or 0, nr_run_all )
+
+        t:eq( 'b', down.restore[1][1] )
+        t:eq( 'dead', down.die_away[1][1] )
+        t:eq( 'm', down.migrating[1][1] )
+        t:eq( nil, down.alive )
+        t:eq( nil, down.unknown )
+    end
+end
+
+function test_find_down_probe_failed(t)
+
+    local c = make_cluster()
+
+    local p = make_paxos( 'x', { a=true, b=true }, {} )
+    p.impl.wait_run = function() end
+    p.impl.run_all = function( self, fs )
+        -- probe of "b" is killed or raises an error
+        return { a=fs.a(), dead=fs.dead() }
+    end
+
+    local down, err = c:find_down( p )
+    t:eq( nil, err )
+
+    t:eq( 1, #down.unknown )
+    t:eq( 'b', down.unknown[1][1] )
+    t:eq( nil, down.alive )
+
+    t:eq( 'dead', down.die_away[1][1] )
+
+    local reported
+    c.impl.report_cluster = function( self, paxos, tb ) reported = tb end
+    c:report_cluster( p, { unknown=down.unknown } )
+    t:eq( nil, reported, 'unknown is not reported' )
+end
+
+function test_next_check_time(t)
+
+    local c = make_cluster()
+    c._check = {}
+
+    local mid = { cluster_id='x', ident='1' }
+
+    t:eq( 200, c:next_check_time( mid, 200 ) )
+
+    c:reset_check_exptime( 'data_check', mid, 150 )
+    t:eq( 150, c:next_check_time( mid, 200 ) )
+
+    c:reset_check_exptime( 'leader_check', mid, 120 )
+    t:eq( 120, c:next_check_time( mid, 200 ) )
+
+    -- now is 100
+    c:reset_check_exptime( 'leader_check', mid, 90 )
+    t:eq( 150, c:next_check_time( mid, 200 ), 'expired is ignored' )
+
+    c:reset_check_exptime( 'data_check', mid, 100 )
+    t:eq( 200, c:next_check_time( mid, 200 ), 'expiring now is ignored' )
+end
@@ -0,0 +1,170 @@
+local codec = require( "acid.codec" )
+local msgpack = require( "acid.msgpack" )
+
+function test_get(t)
+
+    t:eq( codec.json, codec.get() )
+    t:eq( codec.json, codec.get( 'json' ) )
+    t:eq( codec.msgpack, codec.get( 'msgpack' ) )
+
+    local c, err = codec.get( 'xxx' )
+    t:eq( nil, c )
+    t:eq( 'InvalidArgument', err )
+
+    c, err = codec.get( 'get' )
+    t:eq( nil, c )
+    t:eq( 'InvalidArgument', err )
+end
+
+function test_by_content_type(t)
+
+    local cases = {
+        { nil, codec.json },
+        { '', codec.json },
+        { 'text/html', codec.json },
+        { 'application/json', codec.json },
+        { 'application/x-msgpack', codec.msgpack },
+        { 'application/x-msgpack; charset=utf-8', codec.msgpack },
+        { ' application/x-msgpack', codec.msgpack },
+    }
+
+    for i, case in ipairs( cases ) do
+        local ct, expected = case[ 1 ], case[ 2 ]
+        t:eq( expected, codec.by_content_type( ct ), i .. ': ' .. tostring(ct) )
+    end
+end
+
+function test_msgpack_scalar(t)
+
+    local cases = {
+        { true, '\195' },
+        { false, '\194' },
+        { 0, '\0' },
+        { 127, '\127' },
+        { 128, '\204\128' },
+        { 255, '\204\255' },
+        { 256, '\205\1\0' },
+        { 65536, '\206\0\1\0\0' },
+        { 2^32, '\207\0\0\0\1\0\0\0\0' },
+        { -1, '\255' },
+        { -32, '\224' },
+        { -33, '\208\223' },
+        { -129, '\209\255\127' },
+        { -32769, '\210\255\255\127\255' },
+        { 1.5, '\203\63\248\0\0\0\0\0\0' },
+        { -2, '\254' },
+        { -0.25, '\203\191\208\0\0\0\0\0\0' },
+        { '', '\160' },
+        { 'abc', '\163abc' },
+        { string.rep( 'x', 32 ), '\217\32' .. string.rep( 'x', 32 ) },
+        { string.rep( 'x', 256 ), '\218\1\0' .. string.rep( 'x', 256 ) },
+    }
+
+    for i, case in ipairs( cases ) do
+        local v, expected = case[ 1 ], case[ 2 ]
+        local mes = i .. ': ' .. tostring( v )
+
+        local s = msgpack.encode( v )
+        t:eq( expected, s, mes )
+        t:eq( v, msgpack.decode( s ), mes )
+    end
+
+    t:eq( '\192', msgpack.encode( nil ) )
+    t:eq( nil, msgpack.decode( '\192' ) )
+end
+
+function test_msgpack_number(t)
+
+    local cases = {
+        0.1,
+        -0.1,
+        1/3,
+        1e300,
+        -1e-300,
+        4.9e-324,
+        2.2250738585072014e-308,
+        2^53,
+        -2^53,
+        2^40 + 1,
+        -2^31,
+        -2^31 - 1,
+        math.huge,
+        -math.huge,
+    }
+
+    for i, v in ipairs( cases ) do
+        local mes = i .. ': ' .. tostring( v )
+        t:eq( v, msgpack.decode( msgpack.encode( v ) ), mes )
+    end
+
+    local nan = msgpack.decode( msgpack.encode( 0/0 ) )
+    t:neq( nan, nan, 'nan' )
+
+    -- int64 and uint64 from other implementations
+    t:eq( -2^40, msgpack.decode( '\211\255\255\255\0\0\0\0\0' ), 'int64' )
+    t:eq( 2^40, msgpack.decode( '\207\0\0\1\0\0\0\0\0' ), 'uint64' )
+end
+
+function test_msgpack_table(t)
+
+    local cases = {
+        {},
+        { 1, 2, 3 },
+        { a=1, b={ 'x', 'y' } },
+        { [1]=1, [3]=3 },
+        { [2]=2 },
+        { 1, 2, x=3 },
+        {
+            committed = {
+                ver = 3,
+                val = {
+                    view = { { a=1, b=1, c=1 }, { b=1, c=1, d=1 } },
+                    leader = { ident='a', __expire=1430000000.5 },
+                },
+                __tag = 'a/3',
+            },
+            paxos_round = { rnd={ 2, 'a' }, vrnd={ 0, '' } },
+        },
+    }
+
+    local bigmap = {}
+    for i = 1, 20 do
+        bigmap[ 'k' .. i ] = i
+    end
+    table.insert( cases, bigmap )
+
+    for i, v in ipairs( cases ) do
+        local mes = i .. ''
+        t:eqdict( v, msgpack.decode( msgpack.encode( v ) ), mes )
+    end
+
+    -- array32
+    local big = {}
+    for i = 1, 70000 do
+        big[ i ] = i
+    end
+    local s = msgpack.encode( big )
+    t:eq( '\221\0\1\17\112', s:sub( 1, 5 ), 'array32 header' )
+
+    local dbig = msgpack.decode( s )
+    t:eq( #big, #dbig, 'array32 length' )
+    t:eq( 70000, dbig[ 70000 ], 'array32 last' )
+
+    t:eq( '\128', msgpack.encode( {} ), 'empty table is map' )
+    t:eq( '\146\1\2', msgpack.encode( { 1, 2 } ), 'array' )
+end
+
+function test_msgpack_invalid(t)
+
+    local s = msgpack.encode( { a={ 1, 2, 'xyz' }, b=1.5 } )
+
+    for i = 0, #s - 1 do
+        t:err( function () msgpack.decode( s:sub( 1, i ) ) end, 'truncated at ' .. i )
+    end
+
+    t:err( function () msgpack.decode( s .. '\0' ) end, 'trailing' )
+    t:err( function () msgpack.decode( '\193' ) end, 'unsupported type' )
+    t:err( function () msgpack.decode( nil ) end, 'not string' )
+    t:err( function () msgpack.decode( '\129\192\1' ) end, 'nil key' )
+    t:err( function () msgpack.encode( { f=function() end } ) end, 'function' )
+end
@@ -0,0 +1,90 @@
+local base = require( "acid.paxos.base" )
+local delta = require( "acid.paxos.delta" )
+local tableutil = require( "acid.tableutil" )
+
+local errors = base.errors
+
+function test_make_apply(t)
+
+    local c = {
+        ver = 3,
+        val = { view={ { a=1 } }, leader={ ident='a' }, foo=1 },
+        __tag = 'x/a/3/1-a',
+    }
+
+    local cases = {
+        -- val, set, del
+        { { view={ { a=1 } }, leader={ ident='b' }, foo=1 },
+          { leader={ ident='b' } }, {} },
+
+        { { view={ { a=1 } }, leader={ ident='a' } },
+          {}, { 'foo' } },
+
+        { { view={ { a=1 } }, leader={ ident='a' }, foo=1, bar=2 },
+          { bar=2 }, {} },
+
+        { { view={ { a=1 } }, leader={ ident='a' }, foo=1 },
+          {}, {} },
+
+        { { view={ { a=1 } }, foo=2 },
+          { foo=2 }, { 'leader' } },
+    }
+
+    for i, case in ipairs( cases ) do
+        local val, set, del = case[ 1 ], case[ 2 ], case[ 3 ]
+
+        local d = delta.make( c, val )
+        t:eqdict( { ver=3, __tag=c.__tag, set=set, del=del }, d, i .. '' )
+
+        local v, err = delta.apply( c, d )
+        t:eq( nil, err, i .. '' )
+        t:eqdict( val, v, i .. '' )
+    end
+
+    t:eq( 1, c.val.foo, 'base not changed' )
+    t:eq( 'a', c.val.leader.ident, 'base not changed' )
+end
+
+function test_make_nil(t)
+
+    local c = { ver=3, val={ foo=1 }, __tag='x/a/3/1-a' }
+
+    local cases = {
+        { c, 'str' },
+        { c, { foo=2 } },
+        { c, {} },
+        { { ver=3, val={ foo=1 } }, { foo=1 } },
+        { { ver=3, val='str', __tag='x' }, { foo=1 } },
+        { nil, { foo=1 } },
+    }
+
+    for i, case in ipairs( cases ) do
+        t:eq( nil, delta.make( case[ 1 ], case[ 2 ] ), i .. '' )
+    end
+end
+
+function test_apply_mismatch(t)
+
+    local c = { ver=3, val={ foo=1, bar=1 }, __tag='x/a/3/1-a' }
+    local d = delta.make( c, { foo=2, bar=1 } )
+
+    local cases = {
+        { ver=3, val={ foo=1, bar=1 }, __tag='x/b/3/1-b' },
+        { ver=2, val={ foo=1, bar=1 }, __tag='x/a/3/1-a' },
+        { ver=3, val={ foo=1, bar=1 } },
+        { ver=3, val=nil, __tag='x/a/3/1-a' },
+    }
+
+    for i, cc in ipairs( cases ) do
+        local v, err, errmes = delta.apply( cc, d )
+        t:eq( nil, v, i .. '' )
+        t:eq( errors.DeltaMismatch, err, i .. '' )
+        t:eqdict( { ver=cc.ver, __tag=cc.__tag }, errmes, i .. '' )
+    end
+
+    local v, err = delta.apply( nil, d )
+    t:eq( errors.DeltaMismatch, err )
+
+    t:eq( true, delta.match( c, d ) )
+    t:eq( false, delta.match( c, nil ) )
+end
@@ -0,0 +1,134 @@
+local base = require( "acid.paxos.base" )
+local history = require( "acid.paxos.history" )
+local tableutil = require( "acid.tableutil" )
+
+local errors = base.errors
+
+local vals = {
+    [1] = { view={ { a=1 } } },
+    [2] = { view={ { a=1 } }, foo=1 },
+    [3] = { view={ { a=1 } }, foo=2 },
+    [4] = { view={ { a=1 } }, foo=2, bar=1 },
+    [5] = { view={ { a=1, b=1 } }, bar=1 },
+}
+
+local function commit_all(size, vers)
+    local h
+    local prev = { ver=0 }
+    for _, v in ipairs( vers ) do
+        local c = { ver=v, val=vals[ v ], __tag='t' .. v }
+        h = history.push( h, c, prev, size, 0 )
+        prev = c
+    end
+    return h, prev
+end
+
+function test_push(t)
+
+    local cases = {
+        -- size, versions committed, versions retained
+        { 0, { 1, 2, 3 }, nil },
+        { 1, { 1 }, {} },
+        { 1, { 1, 2, 3 }, { 2 } },
+        { 3, { 1, 2, 3 }, { 2, 1 } },
+        { 3, { 1, 2, 3, 4, 5 }, { 4, 3, 2 } },
+        { 3, { 1, 3, 5 }, { 3, 1 } },
+        { 3, { 1, 2, 2, 3 }, { 2, 1 } },
+    }
+
+    for i, case in ipairs( cases ) do
+        local size, vers, retained = case[ 1 ], case[ 2 ], case[ 3 ]
+        local h = commit_all( size, vers )
+
+        if retained == nil then
+            t:eq( nil, h, i .. '' )
+        else
+            local got = {}
+            for _, e in ipairs( h or {} ) do
+                table.insert( got, e.ver )
+                t:eq( 't' .. e.ver, e.__tag, i .. '' )
+            end
+            t:eqdict( retained, got, i .. '' )
+        end
+    end
+
+    -- only changed fields are kept
+    local h = commit_all( 3, { 1, 2, 3 } )
+    t:eqdict( { set={ foo=1 }, del={} }, tableutil.sub( h[ 1 ], { 'set', 'del' } ) )
+    t:eqdict( { set={}, del={ 'foo' } }, tableutil.sub( h[ 2 ], { 'set', 'del' } ) )
+
+    -- history is not modified
+    local h2 = history.push( h, { ver=4, val=vals[ 4 ] }, { ver=3, val=vals[ 3 ] }, 3, 0 )
+    t:eq( 2, #h )
+    t:eq( 3, #h2 )
+
+    -- chain broken
+    t:eq( nil, history.push( h, { ver=4, val=vals[ 4 ] }, { ver=3, val='x' }, 3, 0 ) )
+end
+
+function test_lease(t)
+
+    local prev = { ver=1, val={ leader={ ident='a', __lease=10 } } }
+    local c = { ver=2, val={ leader={ ident='b', __lease=10 } } }
+
+    local h = history.push( nil, c, prev, 3, 100 )
+    t:eqdict( { ident='a', __expire=110 }, h[ 1 ].set.leader )
+
+    local r = history.read( c, h, 1, 105 )
+    t:eqdict( { ident='a', __lease=5 }, r.val.leader )
+end
+
+function test_read(t)
+
+    local h, c = commit_all( 3, { 1, 2, 3, 4, 5 } )
+
+    for _, ver in ipairs( { 5, 4, 3, 2 } ) do
+        local r, err = history.read( c, h, ver, 0 )
+        t:eq( nil, err, ver .. '' )
+        t:eq( ver, r.ver, ver .. '' )
+        t:eqdict( vals[ ver ], r.val, ver .. '' )
+    end
+
+    local cases = {
+        { 1, errors.VerNotExist },
+        { 6, errors.VerNotExist },
+        { nil, errors.InvalidArgument },
+        { '3', errors.InvalidArgument },
+    }
+    for i, case in ipairs( cases ) do
+        local r, err, errmes = history.read( c, h, case[ 1 ], 0 )
+        t:eq( nil, r, i .. '' )
+        t:eq( case[ 2 ], err, i .. '' )
+    end
+
+    local _, _, errmes = history.read( c, h, 1, 0 )
+    t:eq( 'retained versions: 2-5', errmes )
+
+    -- gap
+    h, c = commit_all( 3, { 1, 3, 5 } )
+    t:eq( errors.VerNotExist, select( 2, history.read( c, h, 4, 0 ) ) )
+    t:eqdict( vals[ 3 ], history.read( c, h, 3, 0 ).val )
+end
+
+function test_changes_since(t)
+
+    local h, c = commit_all( 3, { 1, 2, 3, 4, 5 } )
+
+    local changes, err = history.changes_since( c, h, 5, 0 )
+    t:eq( nil, err )
+    t:eqdict( {}, changes )
+
+    changes, err = history.changes_since( c, h, 3, 0 )
+    t:eq( nil, err )
+    t:eqdict( {
+        { ver=4, set={ bar=1 }, del={} },
+        { ver=5, set={ view={ { a=1, b=1 } } }, del={ 'foo' } },
+    }, changes )
+
+    changes, err = history.changes_since( c, h, 2, 0 )
+    t:eq( 3, #changes )
+
+    changes, err = history.changes_since( c, h, 1, 0 )
+    t:eq( nil, changes )
+    t:eq( errors.VerNotExist, err )
+end
@@ -0,0 +1,206 @@
+local http = require( "acid.impl.http" )
+local tableutil = require( "acid.tableutil" )
+
+local resp_200 = { 'HTTP/1.1 200 OK', 'Content-Length: 3', '' }
+
+local function new_sock( conf )
+
+    -- A cosocket returning what conf says:
+    --      { reused=, send_err=, lines={ .. }, read_err=, partial=, body= }
+
+    local sock = { conf = conf, sent = 0, closed = false }
+
+    function sock:settimeout( ms ) end
+    function sock:connect( ip, port ) return 1, nil end
+
+    function sock:send( buf )
+        if self.conf.send_err ~= nil then
+            return nil, self.conf.send_err
+        end
+        self.sent = self.sent + 1
+        return #buf, nil
+    end
+
+    function sock:receiveuntil( pattern )
+        return function()
+            local lines = self.conf.lines or {}
+            if #lines == 0 then
+                return nil, self.conf.read_err or 'closed', self.conf.partial or ''
+            end
+            return table.remove( lines, 1 ), nil, nil
+        end
+    end
+
+    function sock:receive( size )
+        return ( self.conf.body or '' ):sub( 1, size ), nil
+    end
+
+    function sock:getreusedtimes() return self.conf.reused or 0 end
+    function sock:close() self.closed = true; return 1, nil end
+    function sock:setkeepalive() self.pooled = true; return 1, nil end
+
+    return sock
+end
+
+local function with_socks( confs, f )
+
+    -- ngx.socket.tcp() returns sockets made from confs one by one.
+
+    local socks = {}
+    for i, conf in ipairs( confs ) do
+        socks[ i ] = new_sock( conf )
+    end
+
+    local nr = 0
+    local saved = ngx
+    ngx = { socket = { tcp = function()
+        nr = nr + 1
+        return socks[ nr ]
+    end } }
+
+    local ok, err = pcall( f )
+    ngx = saved
+    if not ok then
+        error( err )
+    end
+
+    return socks, nr
+end
+
+function test_keepalive(t)
+
+    local cases = {
+        { { 'HTTP/1.1 200 OK', 'Content-Length: 3', '' }, true },
+        { { 'HTTP/1.1 200 OK', 'Content-Length: 3', 'Connection: close', '' }, false },
+        { { 'HTTP/1.0 200 OK', 'Content-Length: 3', '' }, false },
+        { { 'HTTP/1.0 200 OK', 'Content-Length: 3', 'Connection: keep-alive', '' }, true },
+        { { 'HTTP/1.1 200 OK', '' }, false },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        local lines, expected = case[1], case[2]
+        local mes = 'case ' .. i
+
+        with_socks( { { lines = lines, body = 'foo' } }, function()
+
+            local h = http:new( '127.0.0.1', 80, 1000 )
+            local err, errmes = h:request( '/', { body = 'x' } )
+            t:eq( nil, err, mes .. ' ' .. tostring( errmes ) )
+
+            t:eq( false, h:is_keepalive(), mes .. ': body not read' )
+
+            h:read_body( 1024 )
+            t:eq( expected, h:is_keepalive(), mes )
+        end )
+    end
+end
+
+function test_retry_stale(t)
+
+    local function ok_sock()
+        return { lines = tableutil.dup( resp_200 ), body = 'foo' }
+    end
+
+    local cases = {
+        {
+            mes = 'fresh connection ok',
+            socks = { ok_sock() },
+            nr_sock = 1,
+        },
+        {
+            mes = 'pooled connection ok',
+            socks = { { reused = 1, lines = tableutil.dup( resp_200 ), body = 'foo' } },
+            nr_sock = 1,
+        },
+        {
+            mes = 'send to pooled connection failed',
+            socks = { { reused = 1, send_err = 'broken pipe' }, ok_sock() },
+            nr_sock = 2,
+            retried = true,
+        },
+        {
+            mes = 'pooled connection closed before response',
+            socks = { { reused = 1, read_err = 'closed' }, ok_sock() },
+            nr_sock = 2,
+            retried = true,
+        },
+        {
+            mes = 'pooled connection reset before response',
+            socks = { { reused = 1, read_err = 'connection reset by peer' }, ok_sock() },
+            nr_sock = 2,
+            retried = true,
+        },
+        {
+            mes = 'retry only once',
+            socks = { { reused = 1, read_err = 'closed' },
+                      { reused = 1, read_err = 'closed' },
+                      ok_sock() },
+            nr_sock = 2,
+            retried = true,
+            err = 'SocketError',
+        },
+        {
+            mes = 'timeout is not retried',
+            socks = { { reused = 1, read_err = 'timeout' }, ok_sock() },
+            nr_sock = 1,
+            err = 'SocketError',
+        },
+        {
+            mes = 'send timeout is not retried',
+            socks = { { reused = 1, send_err = 'timeout' }, ok_sock() },
+            nr_sock = 1,
+            err = 'SocketError',
+        },
+        {
+            mes = 'closed after part of response',
+            socks = { { reused = 1, read_err = 'closed', partial = 'HTTP/1.1 2' }, ok_sock() },
+            nr_sock = 1,
+            err = 'SocketError',
+        },
+        {
+            mes = 'closed after status line',
+            socks = { { reused = 1, lines = { 'HTTP/1.1 200 OK' } }, ok_sock() },
+            nr_sock = 1,
+            err = 'SocketError',
+        },
+        {
+            mes = 'fresh connection closed',
+            socks = { { read_err = 'closed' }, ok_sock() },
+            nr_sock = 1,
+            err = 'SocketError',
+        },
+        {
+            mes = 'retry_stale not set',
+            socks = { { reused = 1, read_err = 'closed' }, ok_sock() },
+            no_retry = true,
+            nr_sock = 1,
+            err = 'SocketError',
+        },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        local mes = i .. ': ' .. case.mes
+
+        local h, err, errmes
+        local socks, nr_sock = with_socks( case.socks, function()
+            h = http:new( '127.0.0.1', 80, 1000 )
+            err, errmes = h:request( '/', { body = 'x', retry_stale = not case.no_retry } )
+        end )
+
+        t:eq( case.err, err, mes .. ' ' .. tostring( errmes ) )
+        t:eq( case.nr_sock, nr_sock, mes )
+        t:eq( case.retried or false, h.retried, mes )
+
+        if nr_sock > 1 then
+            t:eq( true, socks[ 1 ].closed, mes .. ': stale connection closed' )
+        end
+
+        if case.err == nil then
+            t:eq( 200, h.status, mes )
+            t:eq( 'foo', h:read_body( 1024 ), mes )
+        end
+    end
+end
+
@@ -0,0 +1,84 @@
+local lrucache = require( "acid.lrucache" )
+
+function test_get_set(t)
+
+    local c = lrucache.new( 3 )
+
+    t:eq( nil, c:get( 'a' ) )
+
+    c:set( 'a', 1 )
+    c:set( 'b', 2 )
+    t:eq( 1, c:get( 'a' ) )
+    t:eq( 2, c:get( 'b' ) )
+
+    c:set( 'a', 10 )
+    t:eq( 10, c:get( 'a' ) )
+
+    c:delete( 'a' )
+    t:eq( nil, c:get( 'a' ) )
+    c:delete( 'a' )
+
+    t:eqdict( { hits=3, misses=2, stales=0, evictions=0, size=1, capacity=3 }, c:stat() )
+end
+
+function test_evict(t)
+
+    local cases = {
+        -- ops, keys remaining
+        { { 'a', 'b', 'c', 'd' }, { 'b', 'c', 'd' } },
+        { { 'a', 'b', 'c', 'get:a', 'd' }, { 'a', 'c', 'd' } },
+        { { 'a', 'b', 'c', 'a', 'd' }, { 'a', 'c', 'd' } },
+        { { 'a', 'b', 'c', 'del:b', 'd' }, { 'a', 'c', 'd' } },
+        { { 'a', 'b', 'c', 'd', 'e', 'f', 'g' }, { 'e', 'f', 'g' } },
+    }
+
+    for i, case in ipairs( cases ) do
+        local ops, expected = case[ 1 ], case[ 2 ]
+        local c = lrucache.new( 3 )
+
+        for _, op in ipairs( ops ) do
+            if op:sub( 1, 4 ) == 'get:' then
+                c:get( op:sub( 5 ) )
+            elseif op:sub( 1, 4 ) == 'del:' then
+                c:delete( op:sub( 5 ) )
+            else
+                c:set( op, op )
+            end
+        end
+
+        local st = c:stat()
+        t:eq( #expected, st.size, i .. ': size' )
+
+        for _, k in ipairs( expected ) do
+            t:eq( k, c:get( k ), i .. ': ' .. k )
+        end
+    end
+
+    local c = lrucache.new( 2 )
+    for i = 1, 5 do
+        c:set( i, i )
+    end
+    t:eq( 3, c:stat().evictions )
+end
+
+function test_stamp(t)
+
+    local c = lrucache.new( 3 )
+
+    c:set( 'a', 1, 5 )
+    t:eq( 1, c:get( 'a', 5 ) )
+    t:eq( nil, c:get( 'a' ), 'without stamp' )
+
+    c:set( 'a', 1, 5 )
+    t:eq( nil, c:get( 'a', 6 ), 'newer stamp' )
+    t:eq( nil, c:get( 'a', 5 ), 'stale value removed' )
+
+    c:set( 'a', 2, 6 )
+    t:eq( 2, c:get( 'a', 6 ) )
+
+    local st = c:stat()
+    t:eq( 2, st.stales )
+    t:eq( 3, st.misses )
+    t:eq( 2, st.hits )
+    t:eq( 1, st.size )
+end
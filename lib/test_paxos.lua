@@ -37,6 +37,30 @@ function test_new(t)
             rst=nil,
             err=nil,
         },
+        {
+            mid={ cluster_id="x", ident="x", inst="i_1-a" },
+            impl=nil,
+            rst=nil,
+            err=nil,
+        },
+        {
+            mid={ cluster_id="x", ident="x", inst="../x" },
+            impl=nil,
+            rst=nil,
+            err=errors.InvalidArgument,
+        },
+        {
+            mid={ cluster_id="x", ident="x", inst="" },
+            impl=nil,
+            rst=nil,
+            err=errors.InvalidArgument,
+        },
+        {
+            mid={ cluster_id="x", ident="x", inst=1 },
+            impl=nil,
+            rst=nil,
+            err=errors.InvalidArgument,
+        },
 
     }
     for i, case in ipairs( cases ) do
@@ -185,6 +209,81 @@ function test_set(t)
     end
 
 end
+function test_mset(t)
+
+    local def_sto = {
+        committed = {
+            ver=1,
+            val = {
+                foo = "bar",
+                view = { { a=1, b=1, c=1 } },
+            }
+        }
+    }
+    local ok_resps = { a={}, b={}, c={} }
+
+    local cases = {
+        {
+            mes = 'mset ok',
+            fields = { k1="v1", k2={ x=1 } },
+            rst = { ver=2, val={ k1="v1", k2={ x=1 } } },
+            resps = ok_resps,
+        },
+        {
+            mes = 'mset with specific ver',
+            fields = { k1="v1", foo="bar" }, ver=1,
+            rst = { ver=2, val={ k1="v1", foo="bar" } },
+            resps = ok_resps,
+        },
+        {
+            mes = 'mset with unsatisfied ver',
+            fields = { k1="v1" }, ver=3,
+            err = errors.VerNotExist,
+            resps = ok_resps,
+        },
+        {
+            mes = 'mset without change',
+            fields = { foo="bar" },
+            rst = { ver=1, val={ foo="bar" } },
+            resps = ok_resps,
+        },
+        {
+            mes = 'mset invalid fields',
+            fields = "k1",
+            err = errors.InvalidArgument,
+            resps = ok_resps,
+        },
+        {
+            mes = 'mset invalid key',
+            fields = { "v1" },
+            err = errors.InvalidArgument,
+            resps = ok_resps,
+        },
+        {
+            mes = 'mset quorum failure',
+            fields = { k1="v1" },
+            err = errors.QuorumFailure,
+            resps = { a={p1=false}, b={p1=false}, c={} },
+        },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        local mes = i .. ": " .. case.mes
+
+        local impl = make_implementation({
+            resps = case.resps,
+            def_sto = def_sto,
+        })
+
+        local p, err = paxos.new( { cluster_id="x", ident="a" }, impl, case.ver )
+        t:eq( nil, err, mes )
+
+        local c, err, errmes = p:mset( case.fields )
+        t:eq( case.err, err, mes )
+        t:eqdict( case.rst, c, mes )
+    end
+end
 function test_get(t)
 
     local def_sto = {
@@ -299,6 +398,182 @@ function test_get(t)
     end
 
 end
+function test_get_lease_read(t)
+
+    local resps = {
+        a={p3=false},
+        b={p3=false},
+        c={p3=false},
+    }
+    local function sto( leader, paxos_round )
+        return {
+            committed = {
+                ver=1,
+                val = {
+                    foo = "bar",
+                    leader = leader,
+                    view = { { a=1, b=1, c=1 } },
+                }
+            },
+            paxos_round = paxos_round,
+        }
+    end
+
+    cases = {
+        {
+            mes = 'leader reads locally',
+            def_sto = sto( { ident="a", __expire=os.time()+10 } ),
+            rst = {ver=1, key="foo", val="bar"},
+            err = nil,
+            tracked = 'read:local,lease:10',
+        },
+        {
+            mes = 'not leader',
+            def_sto = sto( { ident="b", __expire=os.time()+10 } ),
+            rst = nil,
+            err = errors.QuorumFailure,
+            tracked = 'read:quorum,lease:-',
+        },
+        {
+            mes = 'lease expired',
+            def_sto = sto( { ident="a", __expire=os.time()-1 } ),
+            rst = nil,
+            err = errors.QuorumFailure,
+            tracked = 'read:quorum,lease:-',
+        },
+        {
+            mes = 'leader has accepted but not committed value',
+            def_sto = sto( { ident="a", __expire=os.time()+10 },
+                           { rnd={ 1, 'a' }, vrnd={ 1, 'a' }, val={ foo='x' } } ),
+            rst = nil,
+            err = errors.QuorumFailure,
+            tracked = 'read:quorum,lease:10',
+        },
+        {
+            mes = 'lease about to expire',
+            def_sto = sto( { ident="a", __expire=os.time()+1 } ),
+            rst = nil,
+            err = errors.QuorumFailure,
+            tracked = 'read:quorum,lease:1',
+        },
+        {
+            mes = 'lease within margin',
+            def_sto = sto( { ident="a", __expire=os.time()+5 } ),
+            margin = 5,
+            rst = nil,
+            err = errors.QuorumFailure,
+            tracked = 'read:quorum,lease:5',
+        },
+        {
+            mes = 'lease beyond margin',
+            def_sto = sto( { ident="a", __expire=os.time()+5 } ),
+            margin = 3,
+            rst = {ver=1, key="foo", val="bar"},
+            err = nil,
+            tracked = 'read:local,lease:5',
+        },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        mes = i .. ": " .. (case.mes or '')
+
+        local impl = make_implementation({
+            resps = resps,
+            def_sto = case.def_sto
+        })
+        local tracked
+        impl.lease_read = true
+        impl.lease_read_margin = case.margin
+        impl.track = function( self, s ) tracked = s end
+
+        local p, err = paxos.new( { cluster_id="x", ident="a" }, impl )
+        t:eq( nil, err, mes )
+
+        local c, err, errmes = p:get( 'foo' )
+        t:eq( case.err, err, mes )
+        t:eqdict( case.rst, c, mes )
+        t:eq( case.tracked, tracked, mes )
+    end
+
+end
+function test_set_lease_read(t)
+
+    local function sto( leader )
+        return {
+            committed = {
+                ver=1,
+                val = {
+                    leader = leader,
+                    view = { { a=1, b=1, c=1 } },
+                }
+            }
+        }
+    end
+
+    local storage_err = { err={ Code=errors.StorageError } }
+
+    cases = {
+        {
+            mes = 'leader writes',
+            def_sto = sto( { ident="a", __expire=os.time()+10 } ),
+            resps = {},
+            rst = { ver=2, key="foo", val="x" },
+        },
+        {
+            mes = 'not leader',
+            def_sto = sto( { ident="b", __expire=os.time()+10 } ),
+            resps = {},
+            err = errors.NotLeader,
+            errmes = 'b',
+        },
+        {
+            mes = 'lease of other member expired',
+            def_sto = sto( { ident="b", __expire=os.time()-1 } ),
+            resps = {},
+            rst = { ver=2, key="foo", val="x" },
+        },
+        {
+            mes = 'leader failed to accept',
+            def_sto = sto( { ident="a", __expire=os.time()+10 } ),
+            resps = { a={ p2=storage_err } },
+            err = errors.QuorumFailure,
+        },
+        {
+            mes = 'leader failed to commit',
+            def_sto = sto( { ident="a", __expire=os.time()+10 } ),
+            resps = { a={ p3=storage_err } },
+            err = errors.QuorumFailure,
+        },
+        {
+            mes = 'quorum without a member not leader',
+            def_sto = sto( { ident="a", __expire=os.time()+10 } ),
+            resps = { b={ p2=storage_err, p3=storage_err } },
+            rst = { ver=2, key="foo", val="x" },
+        },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        mes = i .. ": " .. (case.mes or '')
+
+        local impl = make_implementation({
+            resps = case.resps,
+            def_sto = case.def_sto
+        })
+        impl.lease_read = true
+
+        local p, err = paxos.new( { cluster_id="x", ident="a" }, impl )
+        t:eq( nil, err, mes )
+
+        local c, err, errmes = p:set( 'foo', 'x' )
+        t:eq( case.err, err, mes )
+        t:eqdict( case.rst, c, mes )
+        if case.errmes then
+            t:eq( case.errmes, errmes, mes )
+        end
+    end
+end
 function test_sendmes(t)
 
     local def_sto = {
@@ -363,3 +638,291 @@ function test_sendmes(t)
     end
 
 end
+function test_batch_set(t)
+
+    local paxoshelper = require( "acid.paxoshelper" )
+
+    local def_sto = {
+        committed = {
+            ver=1,
+            val = {
+                foo = "bar",
+                view = { { a=1, b=1, c=1 } },
+            }
+        }
+    }
+
+    local cases = {
+        {
+            mes = 'merged',
+            sets = { { 'k1', 1 }, { 'k2', 2 }, { 'k3', 3 } },
+            resps = { a={}, b={}, c={} },
+            rsts = {
+                { { ver=2, key='k1', val=1 } },
+                { { ver=2, key='k2', val=2 } },
+                { { ver=2, key='k3', val=3 } },
+            },
+            nr_phase2 = 3,
+            nr_post = 2,
+        },
+        {
+            mes = 'same key',
+            sets = { { 'k1', 1 }, { 'k1', 2 } },
+            resps = { a={}, b={}, c={} },
+            rsts = {
+                { { ver=2, key='k1', val=2 } },
+                { { ver=2, key='k1', val=2 } },
+            },
+            nr_phase2 = 3,
+            nr_post = 1,
+        },
+        {
+            mes = 'no change',
+            sets = { { 'foo', 'bar' }, { 'foo', 'bar' } },
+            resps = { a={}, b={}, c={} },
+            rsts = {
+                { { ver=1, key='foo', val='bar' } },
+                { { ver=1, key='foo', val='bar' } },
+            },
+            nr_phase2 = 0,
+            nr_post = 1,
+        },
+        {
+            mes = 'invalid key',
+            sets = { { 1, 1 }, { 'k2', 2 } },
+            resps = { a={}, b={}, c={} },
+            rsts = {
+                { nil, errors.InvalidArgument },
+                { { ver=2, key='k2', val=2 } },
+            },
+            nr_phase2 = 3,
+            nr_post = 0,
+        },
+        {
+            mes = 'quorum failure',
+            sets = { { 'k1', 1 }, { 'k2', 2 } },
+            resps = { a={p1=false}, b={p1=false}, c={} },
+            rsts = {
+                { nil, errors.QuorumFailure },
+                { nil, errors.QuorumFailure },
+            },
+            nr_phase2 = 0,
+            nr_post = 1,
+        },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        local mes = i .. ": " .. case.mes
+
+        local impl = make_implementation({
+            resps = case.resps,
+            def_sto = def_sto,
+        })
+
+        local nr_phase2 = 0
+        local send_req = impl.send_req
+        impl.send_req = function( self, p, id, req )
+            if req.cmd == 'phase2' then
+                nr_phase2 = nr_phase2 + 1
+            end
+            return send_req( self, p, id, req )
+        end
+        -- waiters must be woken by the committer instead of polling
+        local nr_post = 0
+        local nr_poll = 0
+        impl.sleep = function( self, n )
+            if n ~= 0.01 then
+                nr_poll = nr_poll + 1
+            end
+            coroutine.yield()
+        end
+        impl.new_sema = function( self )
+            return {
+                wait = function( sema, timeout ) coroutine.yield() end,
+                post = function( sema, n ) nr_post = nr_post + n end,
+            }
+        end
+
+        -- concurrent requests
+        local cos = {}
+        local rsts = {}
+        for j, kv in ipairs( case.sets ) do
+            local p = paxos.new( { cluster_id="x", ident="a" }, impl )
+            cos[ j ] = coroutine.create( function()
+                local rst, err = paxoshelper.batch_set( p, kv[ 1 ], kv[ 2 ], 0.01 )
+                rsts[ j ] = { rst, err }
+            end )
+        end
+
+        local alive = true
+        while alive do
+            alive = false
+            for _, co in ipairs( cos ) do
+                if coroutine.status( co ) ~= 'dead' then
+                    local ok, err = coroutine.resume( co )
+                    t:eq( true, ok, mes .. ' ' .. tostring(err) )
+                    alive = true
+                end
+            end
+        end
+
+        t:eqdict( case.rsts, rsts, mes )
+        t:eq( case.nr_phase2, nr_phase2, mes )
+        t:eq( case.nr_post, nr_post, mes )
+        t:eq( 0, nr_poll, mes )
+    end
+end
+function test_catch_up(t)
+
+    local paxoshelper = require( "acid.paxoshelper" )
+
+    local view = { { a=1, b=1, c=1 } }
+    local function rec( ver, foo )
+        return { committed={ ver=ver, val={ view=view, foo=foo }, __tag='t' .. ver } }
+    end
+
+    local cases = {
+        {
+            mes = 'pull the latest',
+            stores = { a=rec( 1, 1 ), b=rec( 3, 3 ), c=rec( 2, 2 ) },
+            rst = { ver=3, val={ view=view, foo=3 } },
+            a_ver = 3,
+        },
+        {
+            mes = 'up to date',
+            stores = { a=rec( 3, 3 ), b=rec( 3, 3 ), c=rec( 2, 2 ) },
+            rst = nil,
+            a_ver = 3,
+        },
+        {
+            mes = 'checksum mismatch',
+            stores = { a=rec( 1, 1 ), b=rec( 3, 3 ), c=rec( 2, 2 ) },
+            corrupt = { b=true },
+            rst = { ver=2, val={ view=view, foo=2 } },
+            a_ver = 2,
+        },
+        {
+            mes = 'peer down',
+            stores = { a=rec( 1, 1 ), b=rec( 3, 3 ), c=rec( 2, 2 ) },
+            down = { b=true, c=true },
+            rst = nil,
+            a_ver = 1,
+        },
+        {
+            mes = 'not behind known ver',
+            stores = { a=rec( 2, 2 ), b=rec( 3, 3 ), c=rec( 3, 3 ) },
+            ver = 2,
+            rst = nil,
+            a_ver = 2,
+            nr_sent = 0,
+        },
+        {
+            mes = 'behind known ver',
+            stores = { a=rec( 1, 1 ), b=rec( 3, 3 ), c=rec( 3, 3 ) },
+            ver = 3,
+            rst = { ver=3, val={ view=view, foo=3 } },
+            a_ver = 3,
+            nr_sent = 1,
+        },
+        {
+            mes = 'running in other worker',
+            stores = { a=rec( 1, 1 ), b=rec( 3, 3 ), c=rec( 2, 2 ) },
+            flagged = true,
+            rst = nil,
+            a_ver = 1,
+            nr_sent = 0,
+        },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        local mes = i .. ": " .. case.mes
+        local stores = tableutil.dup( case.stores, true )
+        local impl = make_implementation( {} )
+        local nr_data = 0
+        local nr_sent = 0
+        local flags = {}
+
+        impl.load = function( self, p ) return stores[ p.ident ] end
+        impl.store = function( self, p ) stores[ p.ident ] = p.record end
+
+        impl.lock = function() return {} end
+        impl.unlock = function() end
+        impl.chksum = function( self, s ) return 'sum' .. #s end
+        impl._log = function() end
+        impl.add_flag = function( self, key, exptime )
+            if case.flagged or flags[ key ] then
+                return false
+            end
+            flags[ key ] = true
+            return true
+        end
+        impl.del_flag = function( self, key ) flags[ key ] = nil end
+        impl.send_req = function( self, p, id, req )
+            t:eq( 'snapshot', req.cmd, mes )
+            nr_sent = nr_sent + 1
+            if ( case.down or {} )[ id ] then
+                return nil
+            end
+
+            local peer = paxos.new( { cluster_id="x", ident=id }, impl )
+            local rst, err = paxoshelper.make_snapshot( peer, req.ver )
+            t:eq( nil, err, mes )
+
+            if rst.data ~= nil then
+                nr_data = nr_data + 1
+                if ( case.corrupt or {} )[ id ] then
+                    rst.chksum = 'xx'
+                end
+            end
+            return rst
+        end
+
+        local p = paxos.new( { cluster_id="x", ident="a" }, impl )
+        local rst, err = paxoshelper.catch_up( p, case.ver )
+        t:eq( nil, err, mes )
+        t:eqdict( case.rst, rst, mes )
+        t:eqdict( {}, flags, mes .. ': flag is cleared' )
+        if case.nr_sent ~= nil then
+            t:eq( case.nr_sent, nr_sent, mes )
+        end
+
+        local c = p:read()
+        t:eq( case.a_ver, c.ver, mes )
+        t:eq( 'a', p.member_id.ident )
+        t:neq( 3, nr_data, mes .. ': only newer snapshot is sent' )
+    end
+end
+
+function test_catch_up_async(t)
+
+    local paxoshelper = require( "acid.paxoshelper" )
+
+    local impl = make_implementation( {} )
+    local fs = {}
+    impl.run_async = function( self, f ) table.insert( fs, f ) end
+    impl._log = function() end
+
+    local p = paxos.new( { cluster_id="x", ident="a" }, impl )
+    local called = 0
+    local _catch_up = paxoshelper._catch_up
+    paxoshelper._catch_up = function( paxos, ver )
+        called = called + 1
+        t:eq( 5, ver )
+    end
+
+    paxoshelper.catch_up_async( p, 5 )
+    paxoshelper.catch_up_async( p, 5 )
+    t:eq( 1, #fs, 'only one catch up is started' )
+
+    fs[ 1 ]()
+    t:eq( 1, called )
+
+    paxoshelper.catch_up_async( p, 5 )
+    t:eq( 2, #fs, 'started again once the previous one is done' )
+    fs[ 2 ]()
+    t:eq( 2, called )
+
+    paxoshelper._catch_up = _catch_up
+end
@@ -0,0 +1,152 @@
+local paxosserver = require( "acid.paxosserver" )
+
+function test_handle_batch(t)
+
+    local srv = paxosserver.new( {} )
+
+    function srv:_handle_req(req)
+        if req.cmd == 'phase1' then
+            return { ident=req.ident }
+        elseif req.cmd == 'isalive' then
+            return nil, nil, nil
+        end
+        return nil, 'Foo', req.ident
+    end
+
+    local rst, err, errmes = srv:_handle_batch( { reqs={
+        { cluster_id='x', ident='1', cmd='phase1' },
+        { cluster_id='x', ident='2', cmd='phase2' },
+        { cluster_id='y', ident='3', cmd='isalive' },
+        'not table',
+        { cluster_id='x', ident='5', cmd='set' },
+    } } )
+
+    t:eq( nil, err )
+    t:eqdict( {
+        rsts = {
+            { ident='1' },
+            { err={ Code='Foo', Message='2' } },
+            {},
+            { err={ Code='InvalidMessage', Message='request in batch must be table' } },
+            { err={ Code='InvalidCommand', Message='not allowed in batch: set' } },
+        },
+    }, rst )
+
+    local rst, err, errmes = srv:_handle_batch( {} )
+    t:eq( 'InvalidMessage', err )
+
+    -- with run_all
+    local nr = 0
+    srv.impl.run_all = function( self, fs )
+        nr = nr + 1
+        local rsts = {}
+        for k, f in pairs( fs ) do
+            rsts[ k ] = f()
+        end
+        rsts[ 2 ] = nil
+        return rsts
+    end
+
+    local rst, err, errmes = srv:_handle_batch( { reqs={
+        { cluster_id='x', ident='1', cmd='phase1' },
+        { cluster_id='x', ident='2', cmd='phase1' },
+    } } )
+    t:eq( 1, nr )
+    t:eqdict( { ident='1' }, rst.rsts[ 1 ] )
+    t:eq( 'InternalError', rst.rsts[ 2 ].err.Code, 'thread failed' )
+end
+
+function test_handle_req_inst(t)
+
+    local srv = paxosserver.new( {}, {
+        inst_of = function( key ) return 'i' .. key end,
+    } )
+
+    local got
+    function srv:new_paxos( member_id )
+        got = member_id
+        return nil, 'Stop'
+    end
+
+    local cases = {
+        { req={ cmd='get', key='1' }, inst='i1' },
+        { req={ cmd='get', key='1', inst='i2' }, inst='i1' },
+        { req={ cmd='get', key='leader', inst='i2' }, inst=nil },
+        { req={ cmd='isalive', inst='i2' }, inst=nil },
+        { req={ cmd='snapshot', inst='i2' }, inst='i2' },
+        { req={ cmd='snapshot', inst='/i2' }, err='InvalidArgument' },
+        { req={ cmd='phase1', inst='i2' }, inst='i2' },
+        { req={ cmd='phase1', inst='../i2' }, err='InvalidArgument' },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        got = nil
+        local req = case.req
+        req.cluster_id = 'x'
+        req.ident = '1'
+
+        local _, err = srv:_handle_req( req )
+        if case.err then
+            t:eq( case.err, err, i .. '' )
+            t:eq( nil, got, i .. '' )
+        else
+            t:eq( 'Stop', err, i .. '' )
+            t:eq( case.inst, got.inst, i .. '' )
+        end
+    end
+end
+
+function test_watch(t)
+
+    local notified, waited
+    local impl = {
+        watch_notify = function( self, pobj, ver )
+            table.insert( notified, ver )
+        end,
+        watch_wait = function( self, pobj, ver, timeout )
+            waited = { ver, timeout }
+            return nil, nil, nil
+        end,
+    }
+    local srv = paxosserver.new( impl, { watch_timeout=10 } )
+
+    local paxos = {
+        member_id = { cluster_id='x', ident='1' },
+        read = function() return { ver=3, val={} } end,
+    }
+
+    local cases = {
+        { req={ ver=2 }, notified={}, waited=nil },
+        { req={ ver=3 }, notified={ 3 }, waited={ 3, 10 } },
+        { req={ ver=3, timeout=1 }, notified={ 3 }, waited={ 3, 1 } },
+        { req={ ver=4, timeout=20 }, notified={ 3 }, waited={ 4, 10 } },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        notified, waited = {}, nil
+
+        local rst, err = srv:_watch( paxos, case.req )
+        t:eq( nil, err, i .. '' )
+        t:eq( 3, rst.ver, i .. '' )
+        t:eqdict( case.notified, notified, i .. ': local ver is notified before waiting' )
+        t:eqdict( case.waited, waited, i .. '' )
+    end
+end
+
+function test_cache_stat(t)
+
+    local srv = paxosserver.new( {} )
+    local req = { cluster_id='x', ident='1', cmd='cache_stat' }
+
+    local _, err = srv:_handle_req( req )
+    t:eq( 'InvalidCommand', err )
+
+    srv.impl.record_cache_stat = function( self )
+        return { hits=3, misses=1 }
+    end
+    local rst, err = srv:_handle_req( req )
+    t:eq( nil, err )
+    t:eqdict( { hits=3, misses=1 }, rst )
+end
@@ -132,6 +132,140 @@ function test_send_mes_all(t)
     }, rs )
 end
 
+function test_send_mes_all_concurrent(t)
+
+    local impl = tableutil.dup( prop_impl )
+    impl.concurrent_send = true
+    impl.run_all = function( self, fs, is_done )
+        -- run one by one in key order and stop as soon as it is done
+        local ks = tableutil.keys( fs )
+        table.sort( ks )
+        local rsts = {}
+        for _, k in ipairs( ks ) do
+            rsts[ k ] = fs[ k ]()
+            if is_done ~= nil and is_done( rsts ) then
+                break
+            end
+        end
+        return rsts
+    end
+
+    local x = paxos.proposer.new( prop_args, impl )
+    mes_receiver = {}
+
+    local rs = x:send_mes_all( 2 )
+    t:eqdict( { a=2, b=2, c=2, d=2, e=2 }, mes_receiver, 'all got message' )
+    t:eqdict( { a='resp', b='resp', c='resp', d='resp', e='resp' }, rs )
+
+    mes_receiver = {}
+    local rs = x:send_mes_all( 2, function( rsts )
+        return tableutil.nkeys( rsts ) == 2
+    end )
+    t:eqdict( { a=2, b=2 }, mes_receiver, 'stop after is_done' )
+    t:eqdict( { a='resp', b='resp' }, rs )
+
+    -- decide returns once a quorum of each view group is reached
+    impl.send_req = function( self, pp, id, mes )
+        mes_receiver[ id ] = ( mes_receiver[ id ] or '' ) .. mes.cmd
+        if mes.cmd == 'phase1' then
+            return { rnd=mes.rnd }
+        end
+        return {}
+    end
+
+    mes_receiver = {}
+    local x = paxos.proposer.new( prop_args, impl )
+    local val, err = x:decide( 'val' )
+    t:eq( nil, err )
+    t:eq( 'val', val )
+    t:eqdict( { a='phase1phase2', b='phase1phase2', c='phase1phase2', d='phase1phase2' },
+              mes_receiver, 'quorum of both groups: a, b, c, d' )
+end
+
+function test_write_promised(t)
+
+    local sent = {}
+    local impl = {
+        promise_nver = 2,
+        load = function( self, pp )
+            return { committed={
+                ver=sent.ver or 1,
+                val={
+                    view={ { a=1, b=1, c=1 } },
+                    leader={ ident='a', __lease=10 },
+                },
+            }}
+        end,
+        time = function( self ) return os.time() end,
+        send_req = function( self, pp, id, mes )
+            table.insert( sent, mes.cmd )
+            if mes.cmd == 'phase1' then
+                t:eq( mes.ver + 2, mes.ver_end, 'leader asks for promise' )
+                return { rnd=mes.rnd }
+            end
+            return {}
+        end,
+    }
+
+    local function write( val )
+        sent = { ver=sent.ver }
+        local x = paxos.proposer.new( { cluster_id='promised', ident='a' }, impl )
+        local c, err = x:write( val )
+        t:eq( nil, err )
+        t:eq( val, c.val )
+        sent.ver = c.ver
+        return x
+    end
+
+    write( 'v2' )
+    t:eq( 9, #sent, 'phase1, phase2 and phase3' )
+
+    local x = write( 'v3' )
+    t:eq( 6, #sent, 'no phase1 with promised round' )
+    t:eqlist( { 'phase2', 'phase2', 'phase2', 'phase3', 'phase3', 'phase3' }, sent )
+
+    write( 'v4' )
+    t:eq( 6, #sent, 'no phase1 with promised round' )
+
+    write( 'v5' )
+    t:eq( 9, #sent, 'promised versions run out' )
+
+    -- promise broken
+    impl.send_req = function( self, pp, id, mes )
+        table.insert( sent, mes.cmd )
+        if mes.cmd == 'phase1' then
+            return { rnd=mes.rnd }
+        elseif mes.cmd == 'phase2' and round.cmp( mes.rnd, pp.rnd ) == 0 and #sent <= 3 then
+            return { err={ Code=errors.OldRound } }
+        end
+        return {}
+    end
+
+    write( 'v6' )
+    t:eq( 12, #sent, 'fall back to phase1 after promised phase2 fails' )
+
+    -- not leader
+    impl.load = function( self, pp )
+        return { committed={
+            ver=sent.ver,
+            val={
+                view={ { a=1, b=1, c=1 } },
+                leader={ ident='b', __lease=10 },
+            },
+        }}
+    end
+    impl.send_req = function( self, pp, id, mes )
+        table.insert( sent, mes.cmd )
+        if mes.cmd == 'phase1' then
+            t:eq( nil, mes.ver_end, 'only leader asks for promise' )
+            return { rnd=mes.rnd }
+        end
+        return {}
+    end
+    write( 'v7' )
+    t:eq( 9, #sent )
+end
+
 function test_phase1(t)
     local x = paxos.proposer.new( prop_args, prop_impl )
     mes_receiver = {}
@@ -915,6 +1049,15 @@ local acc_store = {
         },
         paxos_round={ rnd={ 3, 'c' }, vrnd=round.zero() }
     },
+    kprange = {
+        committed = {
+            ver=2,
+            val= {
+                view={ {a=1} },
+            }
+        },
+        paxos_round = { rnd={ 2, 'b' }, vrnd={ 2, 'b' }, val='val-b', ver_end=4 },
+    },
 
 }
 local acc_reflect = {r=nil}
@@ -927,10 +1070,11 @@ local function default_acc(t, sto)
     }
     local lock_ph = {}
     local acc_impl = {
-        store=function( self, p )
+        store=function( self, p, opts )
             t:eq( acc_args.cluster_id, p.cluster_id )
             t:eq( acc_args.ident, p.ident )
             acc_reflect.r = p.record
+            acc_reflect.opts = opts
         end,
         load=function( self, p )
             t:eq( acc_args.cluster_id, p.cluster_id )
@@ -1203,13 +1347,13 @@ function test_acc_phase1(t)
         {
             sto = acc_store.kp1,
             req = { rnd={ 0, 'x' }, ver=3, },
-            rst = { {rnd={ 2, 'b' }}, },
+            rst = { {rnd={ 2, 'b' }, delta=true}, },
             stored = nil,
         },
         {
             sto = acc_store.kp1,
             req = { rnd={ 3, 'x' }, ver=3 },
-            rst = { {rnd={ 3, 'x' }} },
+            rst = { {rnd={ 3, 'x' }, delta=true} },
             stored = {
                 committed = acc_store.kp1.committed,
                 paxos_round = { rnd={ 3, 'x' }, vrnd=round.zero() },
@@ -1218,13 +1362,13 @@ function test_acc_phase1(t)
         {
             sto = acc_store.kp2,
             req = { rnd={ 1, 'a' }, ver=3 },
-            rst = { {rnd={ 2, 'b' }, vrnd={ 2, 'b' }, val='val-b'} },
+            rst = { {rnd={ 2, 'b' }, delta=true, vrnd={ 2, 'b' }, val='val-b'} },
             stored = nil,
         },
         {
             sto = acc_store.kp2,
             req = { rnd={ 3, 'a' }, ver=3 },
-            rst = { {rnd={ 3, 'a' }, vrnd={ 2, 'b' }, val='val-b'} },
+            rst = { {rnd={ 3, 'a' }, delta=true, vrnd={ 2, 'b' }, val='val-b'} },
             stored = {
                 committed = acc_store.kp2.committed,
                 paxos_round = { rnd={ 3, 'a' }, vrnd={ 2, 'b' }, val='val-b' },
@@ -1245,12 +1389,27 @@ function test_acc_phase1(t)
         {
             sto = acc_store.kcmt,
             req = { rnd={ 1, 'a' }, ver=3, },
-            rst = { {rnd={ 1, 'a' }} },
+            rst = { {rnd={ 1, 'a' }, delta=true} },
             stored = {
                 committed = acc_store.kcmt.committed,
                 paxos_round = { rnd={ 1, 'a' }, vrnd=round.zero() },
             },
         },
+        {
+            sto = acc_store.kp1,
+            req = { rnd={ 3, 'x' }, ver=3, ver_end=10 },
+            rst = { {rnd={ 3, 'x' }, delta=true} },
+            stored = {
+                committed = acc_store.kp1.committed,
+                paxos_round = { rnd={ 3, 'x' }, vrnd=round.zero(), ver_end=10 },
+            },
+        },
+        {
+            sto = acc_store.kp1,
+            req = { rnd={ 1, 'x' }, ver=3, ver_end=10 },
+            rst = { {rnd={ 2, 'b' }, delta=true} },
+            stored = nil,
+        },
     }
 
     for i, case in ipairs(cases) do
@@ -1468,6 +1627,26 @@ function test_acc_phase3(t)
                 paxos_round = acc_store.kp2.paxos_round,
             }
         },
+        {
+            mes = 'commmit ver=3, round promised till ver=4 is kept',
+            sto = acc_store.kprange,
+            req = { ver=3, },
+            rst = {},
+            stored = {
+                committed = { ver=3, val='myval' },
+                paxos_round = { rnd={ 2, 'b' }, vrnd=round.zero(), ver_end=4 },
+            }
+        },
+        {
+            mes = 'commmit ver=4, round promised till ver=4 is cleared',
+            sto = acc_store.kprange,
+            req = { ver=4, },
+            rst = {},
+            stored = {
+                committed = { ver=4, val='myval' },
+                paxos_round = empty_pr,
+            }
+        },
     }
 
     for i, case in ipairs(cases) do
@@ -1484,3 +1663,519 @@ function test_acc_phase3(t)
         t:eqdict( case.stored, acc_reflect.r, mes )
     end
 end
+function test_acc_store_part(t)
+
+    local cases = {
+        { 'phase1', { rnd={ 3, 'x' }, ver=3 }, {part='paxos_round'} },
+        { 'phase2', { rnd={ 2, 'b' }, ver=3, val='val-x' }, {part='paxos_round'} },
+        { 'phase3', { ver=3, val={ view={ {a=1} } } }, nil },
+    }
+
+    for i, case in ipairs(cases) do
+        local cmd, req, opts = unpack( case )
+        local mes = i .. ': ' .. cmd
+
+        local x = default_acc( t, acc_store.kp1 )
+        req = tableutil.dup( req, true )
+        req.cmd = cmd
+        req.cluster_id = 'cl'
+
+        acc_reflect = {}
+        local _, err = x:process( req )
+        t:eq( nil, err, mes )
+        t:eqdict( opts, acc_reflect.opts, mes )
+    end
+end
+function test_acc_inst(t)
+
+    local main = {
+        committed = {
+            ver=5,
+            val={ view={ {a=1, b=1, c=1} } },
+        },
+    }
+
+    local cases = {
+        {
+            mes = 'phase1 of new instance',
+            sto = nil,
+            req = { cmd='phase1', inst='i1', view_id='a,b,c', rnd={ 1, 'x' }, ver=1 },
+            rst = { { rnd={ 1, 'x' }, delta=true } },
+            view = main.committed.val.view,
+        },
+        {
+            mes = 'phase2 of instance',
+            sto = { paxos_round={ rnd={ 1, 'x' }, vrnd={ 0, '' } } },
+            req = { cmd='phase2', inst='i1', view_id='a,b,c', rnd={ 1, 'x' }, ver=1, val={ k=1 } },
+            rst = { nil },
+            view = main.committed.val.view,
+        },
+        {
+            mes = 'phase1 with another view',
+            sto = nil,
+            req = { cmd='phase1', inst='i1', view_id='a,b,d', rnd={ 1, 'x' }, ver=1 },
+            rst = { nil, errors.ViewMismatch, 'a,b,c' },
+        },
+        {
+            mes = 'phase2 with a view being changed',
+            sto = { paxos_round={ rnd={ 1, 'x' }, vrnd={ 0, '' } } },
+            req = { cmd='phase2', inst='i1', view_id='a,b,c|a,b,d', rnd={ 1, 'x' }, ver=1, val={ k=1 } },
+            rst = { nil, errors.ViewMismatch, 'a,b,c' },
+        },
+        {
+            mes = 'phase1 without view_id',
+            sto = nil,
+            req = { cmd='phase1', inst='i1', rnd={ 1, 'x' }, ver=1 },
+            rst = { nil, errors.ViewMismatch, 'a,b,c' },
+        },
+        {
+            mes = 'instance mismatch',
+            sto = nil,
+            req = { cmd='phase1', inst='i2', rnd={ 1, 'x' }, ver=1 },
+            rst = { nil, errors.InvalidMessage, 'inst mismatch: i1' },
+        },
+        {
+            mes = 'main instance message',
+            sto = nil,
+            req = { cmd='phase1', rnd={ 1, 'x' }, ver=1 },
+            rst = { nil, errors.InvalidMessage, 'inst mismatch: i1' },
+        },
+        {
+            mes = 'no view in main instance',
+            sto = nil,
+            main = {},
+            req = { cmd='phase1', inst='i1', rnd={ 1, 'x' }, ver=1 },
+            rst = { nil, errors.NoView },
+        },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        local mes = i .. ': ' .. case.mes
+        local loaded = {}
+
+        local impl = {
+            load = function( self, p )
+                table.insert( loaded, p.inst or '-' )
+                if p.inst == nil then
+                    return tableutil.dup( case.main or main, true )
+                end
+                return tableutil.dup( case.sto, true )
+            end,
+            store = function( self, p )
+                t:eq( 'i1', p.inst, mes )
+            end,
+            time = function( self ) return os.time() end,
+            lock = function( self, p )
+                t:eq( 'i1', p.inst, mes )
+                return {}
+            end,
+            unlock = function( self, l ) end,
+        }
+
+        local acc, err = paxos.acceptor.new( { cluster_id='cl', ident='a', inst='i1' }, impl )
+        t:eq( nil, err, mes )
+
+        local req = tableutil.dup( case.req, true )
+        req.cluster_id = 'cl'
+
+        local r, err, errmes = acc:process( req )
+        t:eqdict( case.rst, { r, err, errmes }, mes )
+
+        if case.view then
+            t:eqdict( case.view, acc.view, mes )
+            t:eq( 'a,b,c', acc.view_id, mes )
+            t:eqdict( { 'i1', '-' }, loaded, mes )
+        end
+    end
+end
+
+function test_inst_write_main_changed(t)
+
+    local view = { { a=1, b=1, c=1 } }
+
+    local cases = {
+        {
+            mes = 'leader renewed between phases',
+            val = { view=view, leader={ ident='a', __lease=20 } },
+            err = nil,
+        },
+        {
+            mes = 'view changed between phases',
+            val = { view={ { a=1, b=1, c=1 }, { a=1, b=1, d=1 } } },
+            err = errors.QuorumFailure,
+        },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        local mes = i .. ': ' .. case.mes
+
+        -- stores[ ident ][ inst or '-' ]
+        local stores = {}
+        for _, id in ipairs( { 'a', 'b', 'c' } ) do
+            stores[ id ] = {
+                ['-'] = { committed={ ver=5, val={ view=view, leader={ ident='a', __lease=10 } } } },
+            }
+        end
+
+        local acc_impl = {
+            load = function( self, p )
+                return tableutil.dup( stores[ p.ident ][ p.inst or '-' ], true )
+            end,
+            store = function( self, p )
+                stores[ p.ident ][ p.inst or '-' ] = tableutil.dup( p.record, true )
+            end,
+            lock = function( self, p ) return {} end,
+            unlock = function( self, l ) end,
+            time = function( self ) return os.time() end,
+        }
+
+        local nr_p1 = 0
+        local impl = {
+            load = acc_impl.load,
+            time = acc_impl.time,
+            send_req = function( self, p, id, req )
+
+                local acc = paxos.acceptor.new( { cluster_id='x', ident=id, inst=req.inst }, acc_impl )
+                local r, err, errmes = acc:process( req )
+
+                if req.cmd == 'phase1' then
+                    nr_p1 = nr_p1 + 1
+                    if nr_p1 == 3 then
+                        -- main instance commits ver 6 on every member
+                        for _, sto in pairs( stores ) do
+                            sto[ '-' ] = { committed={ ver=6, val=case.val } }
+                        end
+                    end
+                end
+
+                if err then
+                    return { err={ Code=err, Message=errmes } }
+                end
+                return r or {}
+            end,
+        }
+
+        local x, err = paxos.proposer.new( { cluster_id='x', ident='a', inst='i1' }, impl )
+        t:eq( nil, err, mes )
+
+        local c, err = x:write( { k=1 } )
+        t:eq( case.err, err, mes )
+        if case.err == nil then
+            t:eq( 1, c.ver, mes )
+            t:eq( 1, stores.b.i1.committed.ver, mes )
+        end
+    end
+end
+
+function test_cached_record_not_changed(t)
+
+    -- impl.load() returns the cached record itself, without a copy. It must
+    -- not be changed by any phase or lease conversion.
+
+    local view = { { a=1, b=1, c=1 } }
+    local stores = {}
+    for _, id in ipairs( { 'a', 'b', 'c' } ) do
+        stores[ id ] = {
+            committed={ ver=1, val={ view=view, leader={ ident='a', __expire=os.time()+10 } } },
+        }
+    end
+
+    -- every record returned by load() and a copy of it taken at that time
+    local loaded = {}
+
+    local acc_impl = {
+        load = function( self, p )
+            local rec = stores[ p.ident ]
+            table.insert( loaded, { rec=rec, copy=tableutil.dup( rec, true ), ident=p.ident } )
+            return rec
+        end,
+        store = function( self, p )
+            -- the cache is filled with a record newly read from storage
+            stores[ p.ident ] = tableutil.dup( p.record, true )
+        end,
+        lock = function( self, p ) return {} end,
+        unlock = function( self, l ) end,
+        time = function( self ) return os.time() end,
+    }
+
+    local impl = {
+        load = acc_impl.load,
+        time = acc_impl.time,
+        send_req = function( self, p, id, req )
+            local acc = paxos.acceptor.new( { cluster_id='x', ident=id }, acc_impl )
+            local r, err, errmes = acc:process( req )
+            if err then
+                return { err={ Code=err, Message=errmes } }
+            end
+            return r or {}
+        end,
+    }
+
+    local vals = {
+        { view=view, leader={ ident='a', __lease=20 } },
+        { view=view, leader={ ident='a', __lease=30 }, foo=1 },
+    }
+
+    for i, val in ipairs( vals ) do
+        local x, err = paxos.proposer.new( { cluster_id='x', ident='a' }, impl )
+        t:eq( nil, err, i )
+
+        local c, err = x:write( val )
+        t:eq( nil, err, i )
+        t:eq( i + 1, c.ver, i )
+        t:eq( i + 1, stores.b.committed.ver, i )
+    end
+
+    t:neq( 0, #loaded )
+    for i, l in ipairs( loaded ) do
+        t:eqdict( l.copy, l.rec, i .. ': loaded by ' .. l.ident )
+    end
+end
+
+function test_acc_lease_read(t)
+
+    local function sto( leader )
+        return {
+            committed = {
+                ver=1,
+                val={ view={ {a=1, b=1, c=1} }, leader=leader },
+            },
+            paxos_round = { rnd={ 1, 'b' }, vrnd={ 0, '' } },
+        }
+    end
+
+    local cases = {
+        {
+            mes = 'from leader',
+            sto = sto( { ident='a', __expire=os.time()+10 } ),
+            rnd = { 1, 'a' },
+            rst = { nil, errors.OldRound },
+        },
+        {
+            mes = 'from other member',
+            sto = sto( { ident='a', __expire=os.time()+10 } ),
+            rnd = { 1, 'b' },
+            rst = { nil, errors.NotLeader, 'a' },
+        },
+        {
+            mes = 'lease expired',
+            sto = sto( { ident='a', __expire=os.time()-1 } ),
+            rnd = { 1, 'b' },
+            rst = { nil },
+        },
+        {
+            mes = 'no leader',
+            sto = sto( nil ),
+            rnd = { 1, 'b' },
+            rst = { nil },
+        },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        local mes = i .. ': ' .. case.mes
+
+        local impl = {
+            lease_read = true,
+            load = function( self, p ) return tableutil.dup( case.sto, true ) end,
+            store = function( self, p ) end,
+            time = function( self ) return os.time() end,
+            lock = function( self, p ) return {} end,
+            unlock = function( self, l ) end,
+        }
+
+        local acc, err = paxos.acceptor.new( { cluster_id='cl', ident='c' }, impl )
+        t:eq( nil, err, mes )
+
+        local r, err, errmes = acc:process( { cmd='phase2', cluster_id='cl',
+                                              rnd=case.rnd, ver=2, val={ k=1 } } )
+        t:eqdict( case.rst, { r, err, errmes }, mes )
+    end
+end
+
+function test_write_delta(t)
+
+    local val = {
+        view = { { a=1, b=1, c=1 } },
+        leader = { ident='a', __lease=10 },
+        ec_meta = { ec_name='x', ec_policy={ nr_data=6, nr_parity=3 } },
+    }
+    local committed = { ver=1, val=val, __tag='delta/a/1/1-a' }
+
+    local stores = {
+        a = { committed=committed },
+        b = { committed=committed },
+        -- c has a different committed of the same version
+        c = { committed={ ver=1, val=val, __tag='delta/b/1/1-b' } },
+    }
+
+    local acc_impl = {
+        load = function( self, p ) return tableutil.dup( stores[ p.ident ], true ) end,
+        store = function( self, p ) stores[ p.ident ] = tableutil.dup( p.record, true ) end,
+        lock = function( self, p ) return {} end,
+        unlock = function( self, l ) end,
+        time = function( self ) return os.time() end,
+    }
+
+    local sent = {}
+    local impl = {
+        load = acc_impl.load,
+        time = acc_impl.time,
+        send_req = function( self, p, id, mes )
+            table.insert( sent, { id=id, cmd=mes.cmd, mes=mes } )
+
+            local acc = paxos.acceptor.new( { cluster_id='delta', ident=id }, acc_impl )
+            local r, err, errmes = acc:process( mes )
+            if err then
+                return { err={ Code=err, Message=errmes } }
+            end
+            return r or {}
+        end,
+    }
+
+    local function count( cmd, field )
+        local n = 0
+        for _, s in ipairs( sent ) do
+            if s.cmd == cmd and s.mes[ field ] ~= nil then
+                n = n + 1
+            end
+        end
+        return n
+    end
+
+    local newval = tableutil.dup( val )
+    newval.leader = { ident='b', __lease=10 }
+
+    local x = paxos.proposer.new( { cluster_id='delta', ident='a' }, impl )
+    local c, err = x:write( newval )
+    t:eq( nil, err )
+    t:eq( 2, c.ver )
+
+    -- phase1 tells the proposer that acceptors support delta.
+    t:eq( 3, count( 'phase2', 'val_delta' ), 'phase2 with delta' )
+    t:eq( 1, count( 'phase2', 'val' ), 'full phase2 to c after mismatch' )
+    t:eq( 3, count( 'phase3', 'val_delta' ), 'phase3 with delta' )
+    t:eq( 1, count( 'phase3', 'val' ), 'full phase3 to c after mismatch' )
+
+    for _, s in ipairs( sent ) do
+        if s.mes.val_delta ~= nil then
+            t:eqdict( { leader=newval.leader }, s.mes.val_delta.set )
+            t:eqdict( {}, s.mes.val_delta.del )
+        end
+    end
+
+    for id, sto in pairs( stores ) do
+        local v = sto.committed.val
+        t:eq( 2, sto.committed.ver, id )
+        t:eq( 'b', v.leader.ident, id )
+        t:eqdict( val.ec_meta, v.ec_meta, id )
+        t:eqdict( val.view, v.view, id )
+    end
+
+    -- remote read: acceptors having the same committed respond without val.
+    sent = {}
+    local x = paxos.proposer.new( { cluster_id='delta', ident='a' }, impl )
+    local c, err = x:quorum_read()
+    t:eq( nil, err )
+    t:eq( 2, c.ver )
+    t:eqdict( val.ec_meta, c.val.ec_meta )
+    t:eq( 'b', c.val.leader.ident )
+
+    local base_c = { ver=2, __tag=x.record.committed.__tag }
+    for _, s in ipairs( sent ) do
+        t:eqdict( base_c, s.mes.base )
+    end
+
+    local acc = paxos.acceptor.new( { cluster_id='delta', ident='b' }, acc_impl )
+    local _, err, errmes = acc:process( { cmd='phase3', cluster_id='delta', ver=0, base=base_c } )
+    t:eq( errors.AlreadyCommitted, err )
+    t:eqdict( base_c, errmes, 'no val in response' )
+end
+
+function test_acc_watch_notify(t)
+
+    local cases = {
+        { mes='commit next', ver=3, notified={ 3 } },
+        { mes='commit same', ver=2, notified={ 2 } },
+        { mes='already committed', ver=1, notified={} },
+        { mes='store error', ver=3, notified={}, sto_err='x' },
+    }
+
+    for i, case in ipairs( cases ) do
+
+        local mes = i .. ': ' .. case.mes
+        local x = default_acc( t, acc_store.kcmt )
+
+        local notified = {}
+        x.impl.watch_notify = function( self, p, ver )
+            t:eq( 'cl', p.cluster_id, mes )
+            t:eq( 'a', p.ident, mes )
+            table.insert( notified, ver )
+        end
+
+        if case.sto_err then
+            x.impl.store = function() return nil, case.sto_err end
+        end
+
+        x:process( { cmd='phase3', cluster_id='cl', ver=case.ver,
+                     val=acc_store.kcmt.committed.val } )
+        t:eqdict( case.notified, notified, mes )
+    end
+end
+
+function test_acc_history(t)
+
+    local sto = {}
+    local impl = {
+        history_size = 2,
+        load = function( self, p ) return sto end,
+        store = function( self, p ) sto = p.record end,
+        time = function( self ) return 100 end,
+        lock = function( self, p ) return {} end,
+        unlock = function( self, l ) end,
+    }
+
+    local view = { { a=1 } }
+    for ver = 1, 4 do
+        local acc = paxos.acceptor.new( { cluster_id='cl', ident='a' }, impl )
+        local _, err = acc:process( {
+            cmd='phase3', cluster_id='cl', ver=ver, __tag='t' .. ver,
+            val={ view=view, n=ver, leader={ ident='a', __lease=ver } },
+        } )
+        t:eq( nil, err )
+    end
+
+    t:eq( 2, #sto.history, 'bounded' )
+
+    local x = paxos.proposer.new( { cluster_id='cl', ident='a' }, impl )
+
+    local cases = {
+        { 4, { view=view, n=4, leader={ ident='a', __lease=4 } } },
+        { 3, { view=view, n=3, leader={ ident='a', __lease=3 } } },
+        { 2, { view=view, n=2, leader={ ident='a', __lease=2 } } },
+        { 1, nil, errors.VerNotExist },
+    }
+
+    for i, case in ipairs( cases ) do
+        local c, err = x:read_history( case[ 1 ] )
+        t:eq( case[ 3 ], err, i .. '' )
+        if case[ 2 ] ~= nil then
+            t:eqdict( { ver=case[ 1 ], val=case[ 2 ] }, c, i .. '' )
+        end
+    end
+
+    local changes, err = x:changes_since( 2 )
+    t:eq( nil, err )
+    t:eqdict( {
+        { ver=3, set={ n=3, leader={ ident='a', __lease=3 } }, del={} },
+        { ver=4, set={ n=4, leader={ ident='a', __lease=4 } }, del={} },
+    }, changes )
+
+    -- history dropped if it is disabled
+    impl.history_size = nil
+    local acc = paxos.acceptor.new( { cluster_id='cl', ident='a' }, impl )
+    acc:process( { cmd='phase3', cluster_id='cl', ver=5, val={ view=view } } )
+    t:eq( nil, sto.history )
+end
@@ -0,0 +1,55 @@
+local rtt = require( "acid.rtt" )
+
+function test_update(t)
+
+    local srtt, rttvar = rtt.update( nil, nil, 100 )
+    t:eq( 100, srtt )
+    t:eq( 50, rttvar )
+
+    srtt, rttvar = rtt.update( srtt, rttvar, 100 )
+    t:eq( 100, srtt )
+    t:eq( 37.5, rttvar )
+
+    srtt, rttvar = rtt.update( srtt, rttvar, 900 )
+    t:eq( 200, srtt )
+    t:eq( 37.5 * 0.75 + 800 * 0.25, rttvar )
+
+    for i = 1, 100 do
+        srtt, rttvar = rtt.update( srtt, rttvar, 10 )
+    end
+    t:eq( 10, math.floor( srtt + 0.5 ), 'converge' )
+    t:eq( 0, math.floor( rttvar + 0.5 ), 'converge' )
+end
+
+function test_timeout(t)
+
+    local cases = {
+        { nil, nil, nil, 6000 },
+        { 100, 50,  nil, 300 },
+        { 100, 50,  2,   200 },
+        { 10,  1,   nil, 50 },
+        { 5000, 500, nil, 6000 },
+        { 100.5, 0, nil, 100 },
+    }
+
+    for i, case in ipairs( cases ) do
+        local srtt, rttvar, k, expected = case[1], case[2], case[3], case[4]
+        t:eq( expected, rtt.timeout( srtt, rttvar, 50, 6000, k ), 'case ' .. i )
+    end
+end
+
+function test_encode(t)
+
+    local s = rtt.encode( 1.5, 20 )
+    t:eq( "1.500 20.000", s )
+
+    local srtt, rttvar = rtt.decode( s )
+    t:eq( 1.5, srtt )
+    t:eq( 20, rttvar )
+
+    for _, s in ipairs( { nil, '', '1', 'a b', '1 2 3' } ) do
+        local srtt, rttvar = rtt.decode( s )
+        t:eq( nil, srtt, tostring(s) )
+        t:eq( nil, rttvar, tostring(s) )
+    end
+end
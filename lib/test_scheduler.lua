@@ -0,0 +1,245 @@
+local scheduler = require( "acid.scheduler" )
+
+local function make(opt)
+
+    -- Jobs spawned do not run until finish_all() is called. running()
+    -- returns keys of jobs spawned and not yet finished.
+
+    local clock = { now=100 }
+    local spawned = {}
+
+    opt.now = function() return clock.now end
+    opt.random = opt.random or function() return 0 end
+    opt.run = opt.run or function() end
+    opt.spawn = function( f )
+        if opt.spawn_err ~= nil then
+            return nil, opt.spawn_err
+        end
+        table.insert( spawned, f )
+        return true
+    end
+
+    local s = scheduler.new( opt )
+
+    local function running()
+        local ks = {}
+        for k, j in pairs( s.jobs ) do
+            if j.running then
+                table.insert( ks, k )
+            end
+        end
+        table.sort( ks )
+        return ks
+    end
+
+    local function finish_all()
+        local fs = spawned
+        spawned = {}
+        for _, f in ipairs( fs ) do
+            f()
+        end
+    end
+
+    return s, clock, running, finish_all
+end
+
+function test_heap(t)
+
+    local cases = {
+        {},
+        { 1 },
+        { 3, 1, 2 },
+        { 5, 5, 1, 1, 3 },
+        { 9, 8, 7, 6, 5, 4, 3, 2, 1, 0 },
+        { 1, 2, 3, 4, 5, 6, 7, 8, 9 },
+    }
+
+    for i, case in ipairs( cases ) do
+        local h = {}
+        for _, v in ipairs( case ) do
+            scheduler._heap_push( h, { v } )
+        end
+
+        local got = {}
+        while true do
+            local e = scheduler._heap_pop( h )
+            if e == nil then
+                break
+            end
+            table.insert( got, e[ 1 ] )
+        end
+
+        local expected = { unpack( case ) }
+        table.sort( expected )
+        t:eqdict( expected, got, i .. '' )
+    end
+end
+
+function test_due_order(t)
+
+    local s, clock, running, finish_all = make( { interval=10, concurrency=10 } )
+
+    s:add( 'a', 1 )
+    s:add( 'b', 2 )
+
+    t:eq( nil, s:step(), 'new jobs are due at once without jitter' )
+    t:eqdict( { 'a', 'b' }, running() )
+    t:eq( 2, s:stat().nr_running )
+
+    t:eq( nil, s:step(), 'all running' )
+
+    finish_all()
+    t:eq( 0, s:stat().nr_running )
+
+    t:eq( 10, s:step(), 'due after interval' )
+
+    clock.now = clock.now + 10
+    s:step()
+    t:eqdict( { 'a', 'b' }, running() )
+    finish_all()
+
+    s:remove( 'a' )
+    clock.now = clock.now + 10
+    s:step()
+    t:eqdict( { 'b' }, running() )
+    finish_all()
+
+    t:eq( 1, s:stat().nr_jobs )
+end
+
+function test_concurrency(t)
+
+    local s, clock, running, finish_all = make( { interval=1, concurrency=2 } )
+
+    s:set_jobs( { a=1, b=1, c=1, d=1, e=1 } )
+
+    t:eq( 0, s:step() )
+    t:eq( 2, #running() )
+    t:eq( 2, s:stat().nr_running )
+
+    -- still 2 running
+    t:eq( 0, s:step() )
+    t:eq( 2, #running() )
+
+    clock.now = clock.now + 0.5
+    finish_all()
+    s:step()
+    t:eq( 2, #running() )
+
+    local st = s:stat()
+    t:eq( 4, st.nr_run )
+    t:eq( 0.5, st.lag_max, 'late for 0.5 second' )
+    t:eq( 0.25, st.lag_avg )
+
+    s:reset_stat()
+    t:eq( 0, s:stat().lag_max )
+
+    s:set_jobs( { a=1 } )
+    t:eq( 1, s:stat().nr_jobs )
+end
+
+function test_jitter_and_due(t)
+
+    local s, clock, running, finish_all = make( {
+        interval = 10,
+        jitter = 0.5,
+        random = function() return 1 end,
+        due = function( key, job, t )
+            if key == 'early' then
+                return t - 8
+            end
+            return t + 100
+        end,
+    } )
+
+    s:add( 'early', 1 )
+    s:add( 'late', 1 )
+
+    t:eq( 10, s:step(), 'new jobs spread over interval' )
+
+    clock.now = clock.now + 10
+    s:step()
+    finish_all()
+
+    -- early: 2 + 5 jitter, late: never later than interval, 10 + 5 jitter
+    t:eq( 7, s:step() )
+    clock.now = clock.now + 7
+    t:eq( 8, s:step(), 'late is due' )
+    t:eqdict( { 'early' }, running() )
+    finish_all()
+
+    t:eq( 7, s:step(), 'early is due before late' )
+end
+
+function test_due_passed(t)
+
+    local s, clock, running, finish_all = make( {
+        interval = 10,
+        due = function( key, job, t )
+            return 50
+        end,
+    } )
+
+    s:add( 'a', 1 )
+    s:step()
+    finish_all()
+
+    t:eq( 10, s:step(), 'passed due time is ignored' )
+end
+
+function test_spawn_error(t)
+
+    local s, clock, running, finish_all = make( {
+        interval = 10,
+        spawn_err = 'too many timers',
+    } )
+
+    s:add( 'a', 1 )
+    t:eq( 10, s:step(), 'rescheduled' )
+    t:eq( 1, s:stat().nr_err )
+    t:eq( 0, s:stat().nr_running )
+    t:eqdict( {}, running() )
+end
+
+function test_error(t)
+
+    local s, clock, running, finish_all = make( {
+        run = function( key ) error( 'x' ) end,
+    } )
+
+    s:add( 'a', 1 )
+    s:step()
+    finish_all()
+
+    t:eq( 1, s:stat().nr_err )
+    t:eq( 0, s:stat().nr_running )
+    t:eq( 1, s:step(), 'rescheduled after error' )
+end
+
+function test_loop(t)
+
+    local s, clock, running, finish_all
+    local nr_refresh = 0
+    local nr_sleep = 0
+
+    s, clock, running, finish_all = make( {
+        interval = 1,
+        refresh_interval = 2,
+        tick = 0.5,
+    } )
+    s.sleep = function( n )
+        nr_sleep = nr_sleep + 1
+        clock.now = clock.now + n
+        finish_all()
+    end
+    s.exiting = function() return nr_sleep >= 10 end
+
+    s:loop( function()
+        nr_refresh = nr_refresh + 1
+        return { a=1 }
+    end )
+
+    t:eq( 3, nr_refresh )
+    t:eq( 1, s:stat().nr_jobs )
+    t:eq( true, s:stat().nr_run >= 4 )
+end
@@ -0,0 +1,136 @@
+local wal = require( "acid.paxos.wal" )
+local tableutil = require( "acid.tableutil" )
+
+local function chksum(cont)
+    local s = 0
+    for i = 1, #cont do
+        s = ( s * 31 + cont:byte( i ) ) % 4294967291
+    end
+    return tostring( s )
+end
+
+local function rec_committed(ver, val)
+    return { committed={ ver=ver, val=val } }
+end
+
+local function rec_round(base, rnd, vrnd, val)
+    local r = tableutil.dup( base, true )
+    r.paxos_round = { rnd=rnd, vrnd=vrnd, val=val }
+    return r
+end
+
+function test_make_entries(t)
+
+    local c1 = rec_committed( 1, 'x' )
+    local p1 = rec_round( c1, { 1, 'a' } )
+    local a1 = rec_round( c1, { 1, 'a' }, { 1, 'a' }, 'y' )
+
+    local cases = {
+        { nil, c1, { 'commit' }, 'new record' },
+        { c1, nil, { 'delete' }, 'delete' },
+        { c1, c1, {}, 'unchanged' },
+        { c1, p1, { 'promise' }, 'promise' },
+        { p1, a1, { 'accept' }, 'accept' },
+        { c1, a1, { 'promise', 'accept' }, 'promise and accept' },
+        { a1, rec_committed( 2, 'y' ), { 'commit' }, 'commit' },
+    }
+
+    for i, case in ipairs( cases ) do
+        local prev, rec, expected, mes = unpack( case )
+        mes = i .. ': ' .. mes
+
+        local types = {}
+        for _, e in ipairs( wal.make_entries( prev, rec ) ) do
+            table.insert( types, e.t )
+        end
+        t:eqdict( expected, types, mes )
+    end
+end
+
+function test_replay(t)
+
+    local c1 = rec_committed( 1, 'x' )
+    local states = {
+        c1,
+        rec_round( c1, { 1, 'a' } ),
+        rec_round( c1, { 1, 'a' }, { 1, 'a' }, 'y' ),
+        rec_round( c1, { 2, 'b' }, { 1, 'a' }, 'y' ),
+        rec_committed( 2, 'y' ),
+    }
+
+    local prev = nil
+    local rec = nil
+    for i, st in ipairs( states ) do
+        local entries = wal.make_entries( prev, st )
+        local cont = wal.encode( entries, chksum )
+
+        local decoded, valid = wal.decode( cont, chksum )
+        t:eq( #cont, valid, i .. ': valid length' )
+
+        rec = wal.replay( rec, decoded )
+        t:eqdict( st, rec, i .. ': replayed' )
+
+        prev = st
+    end
+end
+
+function test_torn_tail(t)
+
+    local c1 = rec_committed( 1, 'x' )
+    local states = {
+        c1,
+        rec_round( c1, { 1, 'a' } ),
+        rec_round( c1, { 1, 'a' }, { 1, 'a' }, 'y' ),
+    }
+
+    -- conts[ i ] is the log after states[ i ] is appended
+    local conts = {}
+    local cont = ''
+    local prev = nil
+    for _, st in ipairs( states ) do
+        cont = cont .. wal.encode( wal.make_entries( prev, st ), chksum )
+        table.insert( conts, cont )
+        prev = st
+    end
+
+    -- crash at every offset while appending the last state
+    for n = #conts[ 2 ], #conts[ 3 ] - 1 do
+
+        local mes = 'torn at ' .. n
+        local torn = cont:sub( 1, n )
+
+        local entries, valid = wal.decode( torn, chksum )
+        t:eq( #conts[ 2 ], valid, mes )
+        t:eqdict( states[ 2 ], wal.replay( nil, entries ), mes )
+    end
+
+    local entries, valid = wal.decode( cont, chksum )
+    t:eq( #cont, valid, 'complete' )
+    t:eqdict( states[ 3 ], wal.replay( nil, entries ), 'complete' )
+end
+
+function test_corrupted(t)
+
+    local c1 = rec_committed( 1, 'x' )
+    local p1 = rec_round( c1, { 1, 'a' } )
+
+    local good = wal.encode( wal.make_entries( nil, c1 ), chksum )
+    local bad = wal.encode( wal.make_entries( c1, p1 ), chksum )
+
+    local cases = {
+        { bad:gsub( '"a"', '"b"' ), 'body changed' },
+        { bad:gsub( '^%d', 'x' ), 'checksum changed' },
+        { bad:gsub( ' ', '', 1 ), 'no separator' },
+        { chksum( '[' ) .. ' [\n', 'invalid json' },
+    }
+
+    for i, case in ipairs( cases ) do
+        local cont, mes = case[ 1 ], case[ 2 ]
+        mes = i .. ': ' .. mes
+
+        local entries, valid = wal.decode( good .. cont .. good, chksum )
+        t:eq( #good, valid, mes )
+        t:eq( 1, #entries, mes )
+        t:eqdict( c1, wal.replay( nil, entries ), mes )
+    end
+end
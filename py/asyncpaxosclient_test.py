@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# Python 3 only, as it.asyncpaxosclient.
+
+import asyncio
+import json
+import unittest
+
+from it.asyncpaxosclient import AsyncPaxosClient, query_all, latest, run_many
+from it.paxosclient import PaxosError
+
+class Member( object ):
+
+    # A stub member answering every request with handle( path, reqbody ):
+    #
+    #   a dict:     responded as json body
+    #   'close':    connection closed without response
+    #   'hang':     never responds
+
+    def __init__( self, handle, delay=0, close_after=None ):
+        self.handle = handle
+        self.delay = delay
+        self.close_after = close_after
+
+        self.nr_conn = 0
+        self.nr_req = 0
+        self.running = 0
+        self.max_running = 0
+
+        # connections being served
+        self.tasks = set()
+
+    async def start( self ):
+        self.server = await asyncio.start_server( self._serve, '127.0.0.1', 0 )
+        self.port = self.server.sockets[ 0 ].getsockname()[ 1 ]
+        return self
+
+    async def stop( self ):
+
+        self.server.close()
+
+        for t in self.tasks:
+            t.cancel()
+        await asyncio.gather( *self.tasks, return_exceptions=True )
+
+    async def _serve( self, reader, writer ):
+
+        self.nr_conn += 1
+        nr = 0
+
+        task = asyncio.current_task()
+        self.tasks.add( task )
+
+        try:
+            while True:
+
+                line = await reader.readline()
+                if line == b'':
+                    return
+                path = line.decode( 'latin-1' ).split()[ 1 ]
+
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in ( b'\r\n', b'' ):
+                        break
+                    k, v = line.decode( 'latin-1' ).split( ':', 1 )
+                    if k.strip().lower() == 'content-length':
+                        length = int( v )
+                body = await reader.readexactly( length )
+                reqbody = json.loads( body.decode( 'utf-8' ) ) if body else None
+
+                self.nr_req += 1
+                self.running += 1
+                self.max_running = max( self.max_running, self.running )
+                try:
+                    await asyncio.sleep( self.delay )
+                    rst = self.handle( path, reqbody )
+                    if rst == 'hang':
+                        await asyncio.sleep( 3600 )
+                finally:
+                    self.running -= 1
+
+                if rst == 'close':
+                    return
+
+                body = json.dumps( rst ).encode( 'utf-8' )
+                writer.write( ( 'HTTP/1.1 200 OK\r\n'
+                                'Content-Length: %d\r\n'
+                                '\r\n' % len( body ) ).encode( 'utf-8' ) + body )
+                await writer.drain()
+
+                nr += 1
+                if self.close_after is not None and nr >= self.close_after:
+                    return
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.tasks.discard( task )
+            writer.close()
+
+def got( key, ver ):
+    return lambda path, reqbody: { 'ver': ver, 'key': key, 'val': ver }
+
+def err( code ):
+    return lambda path, reqbody: { 'err': { 'Code': code } }
+
+class TestAsyncPaxosClient( unittest.TestCase ):
+
+    def _run( self, handles, f, **kwargs ):
+
+        # start a member for each of handles and run f( clients, members )
+
+        async def _main():
+
+            members = [ await Member( h, **kwargs ).start() for h in handles ]
+            clis = [ AsyncPaxosClient( '127.0.0.1', m.port, 'x', str( i ), timeout=0.5 )
+                     for i, m in enumerate( members ) ]
+            try:
+                return await f( clis, members )
+            finally:
+                for c in clis:
+                    c.close()
+                for m in members:
+                    await m.stop()
+
+        return asyncio.run( _main() )
+
+    def test_reuse_connection( self ):
+
+        async def f( clis, members ):
+            for ii in range( 3 ):
+                b = await clis[ 0 ].get( 'foo' )
+                self.assertEqual( { 'ver': 1, 'key': 'foo', 'val': 1 }, b )
+
+            self.assertEqual( 3, members[ 0 ].nr_req )
+            self.assertEqual( 1, members[ 0 ].nr_conn )
+
+        self._run( [ got( 'foo', 1 ) ], f )
+
+    def test_retry_closed_pooled_connection( self ):
+
+        async def f( clis, members ):
+            await clis[ 0 ].get( 'foo' )
+            # let the member close the idle connection
+            await asyncio.sleep( 0.05 )
+
+            b = await clis[ 0 ].get( 'foo' )
+            self.assertEqual( 1, b[ 'ver' ] )
+            self.assertEqual( 2, members[ 0 ].nr_conn )
+
+        self._run( [ got( 'foo', 1 ) ], f, close_after=1 )
+
+    def test_error_body( self ):
+
+        async def f( clis, members ):
+            with self.assertRaises( PaxosError ) as ctx:
+                await clis[ 0 ].get( 'foo' )
+            self.assertEqual( 'QuorumFailure', ctx.exception.Code )
+
+        self._run( [ err( 'QuorumFailure' ) ], f )
+
+    def test_query_all( self ):
+
+        async def f( clis, members ):
+
+            rsts = await query_all( clis, 'get', { 'key': 'foo' } )
+            self.assertEqual( [ '0', '1', '2' ], sorted( rsts.keys() ) )
+            self.assertEqual( 1, rsts[ '0' ][ 'ver' ] )
+            self.assertEqual( 3, rsts[ '1' ][ 'ver' ] )
+            self.assertEqual( 2, rsts[ '2' ][ 'ver' ] )
+
+            b = await latest( clis, 'foo' )
+            self.assertEqual( { 'ver': 3, 'key': 'foo', 'val': 3 }, b )
+
+        self._run( [ got( 'foo', 1 ), got( 'foo', 3 ), got( 'foo', 2 ) ], f )
+
+    def test_partial_failure( self ):
+
+        async def f( clis, members ):
+
+            rsts = await query_all( clis, 'get', { 'key': 'foo' } )
+
+            self.assertEqual( 1, rsts[ '0' ][ 'ver' ] )
+            self.assertIsInstance( rsts[ '1' ], PaxosError )
+            self.assertIsInstance( rsts[ '2' ], ConnectionError )
+            self.assertIsInstance( rsts[ '3' ], asyncio.TimeoutError )
+
+            b = await latest( clis, 'foo' )
+            self.assertEqual( 1, b[ 'ver' ] )
+
+        self._run( [ got( 'foo', 1 ),
+                     err( 'QuorumFailure' ),
+                     lambda path, reqbody: 'close',
+                     lambda path, reqbody: 'hang' ], f )
+
+    def test_all_failed( self ):
+
+        async def f( clis, members ):
+            b = await latest( clis, 'foo', timeout=0.1 )
+            self.assertIsNone( b )
+
+        self._run( [ lambda path, reqbody: 'hang', lambda path, reqbody: 'close' ], f )
+
+    def test_run_many( self ):
+
+        async def f( clis, members ):
+
+            cli = clis[ 0 ]
+            coros = [ cli.get( 'bad' if ii == 4 else 'foo' ) for ii in range( 10 ) ]
+
+            rsts = await run_many( coros, concurrency=3 )
+
+            self.assertEqual( 10, len( rsts ) )
+            for i, r in enumerate( rsts ):
+                if i == 4:
+                    self.assertIsInstance( r, PaxosError )
+                else:
+                    self.assertEqual( 1, r[ 'ver' ] )
+
+            self.assertEqual( 10, members[ 0 ].nr_req )
+            self.assertEqual( 3, members[ 0 ].max_running )
+
+        def handle( path, reqbody ):
+            if reqbody[ 'key' ] == 'bad':
+                return { 'err': { 'Code': 'InvalidArgument' } }
+            return { 'ver': 1, 'key': 'foo', 'val': 1 }
+
+        self._run( [ handle ], f, delay=0.05 )
+
+if __name__ == "__main__":
+    unittest.main()
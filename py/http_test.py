@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import socket
+import threading
+import time
+import unittest
+
+from it.http import Http, ConnectionPool, ResponseNotReady, _close
+
+# what serve_conns() does instead of responding
+CLOSE = 'close'
+HANG = 'hang'
+
+def serve_conns( scripts ):
+
+    # Serve connection i with scripts[ i ], a list of responses, one for each
+    # request received. A response is a str, a function of the request uri
+    # returning a str, CLOSE to close the connection without response, or
+    # HANG to never respond. A connection is closed after its last response.
+    #
+    # Returns the port and the list of uris received on each connection.
+
+    ls = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+    ls.bind( ( '127.0.0.1', 0 ) )
+    ls.listen( 5 )
+
+    conns = []
+
+    def run():
+        for resps in scripts:
+            c, _ = ls.accept()
+            uris = []
+            conns.append( uris )
+            _serve_conn( c, resps, uris )
+        ls.close()
+
+    th = threading.Thread( target=run )
+    th.daemon = True
+    th.start()
+
+    return ls.getsockname()[ 1 ], conns
+
+def _serve_conn( c, resps, uris ):
+
+    buf = ''
+    for r in resps:
+
+        # requests might be pipelined: there might be more than one in buf
+        while '\r\n\r\n' not in buf:
+            d = c.recv( 4096 )
+            if d == '':
+                c.close()
+                return
+            buf += d
+
+        head, buf = buf.split( '\r\n\r\n', 1 )
+        lines = head.split( '\r\n' )
+        uris.append( lines[ 0 ].split()[ 1 ] )
+
+        size = 0
+        for l in lines[ 1: ]:
+            k, v = l.split( ':', 1 )
+            if k.strip().lower() == 'content-length':
+                size = int( v )
+        while len( buf ) < size:
+            buf += c.recv( 4096 )
+        buf = buf[ size: ]
+
+        if r == CLOSE:
+            break
+        if r == HANG:
+            time.sleep( 60 )
+            break
+        if callable( r ):
+            r = r( uris[ -1 ] )
+        c.sendall( r )
+
+    c.close()
+
+def serve( resps ):
+
+    # serve resps, one for each request, on one connection.
+
+    return serve_conns( [ resps ] )[ 0 ]
+
+def plain( body ):
+    return 'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s' % ( len( body ), body )
+
+def chunked( body, n ):
+    r = 'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+    for i in range( 0, len( body ), n ):
+        r += '%x\r\n%s\r\n' % ( len( body[ i:i+n ] ), body[ i:i+n ] )
+    return r + '0\r\n\r\n'
+
+class TestConnectionPool( unittest.TestCase ):
+
+    def test_reuse( self ):
+
+        port, conns = serve_conns( [ [ plain( 'a' ), plain( 'b' ), plain( 'c' ) ] ] )
+        pool = ConnectionPool()
+
+        for body, reused in ( ( 'a', False ), ( 'b', True ), ( 'c', True ) ):
+            h = Http( '127.0.0.1', port, timeout=3, pool=pool )
+            h.request( '/' + body )
+            self.assertEqual( reused, h.reused )
+            self.assertEqual( body, h.read_body( 10 ) )
+
+        self.assertEqual( [ [ '/a', '/b', '/c' ] ], conns )
+        pool.clear()
+
+    def test_not_pooled_before_body_read( self ):
+
+        port, conns = serve_conns( [ [ plain( 'abc' ) ], [ plain( 'abc' ) ] ] )
+        pool = ConnectionPool()
+
+        h = Http( '127.0.0.1', port, timeout=3, pool=pool )
+        h.request( '/' )
+        h.read_body( 1 )
+        h.close()
+
+        h = Http( '127.0.0.1', port, timeout=3, pool=pool )
+        h.request( '/' )
+        self.assertEqual( False, h.reused )
+        self.assertEqual( 'abc', h.read_body( 10 ) )
+
+        pool.clear()
+
+    def test_connection_close( self ):
+
+        resp = 'HTTP/1.1 200 OK\r\nContent-Length: 1\r\nConnection: close\r\n\r\na'
+        port, conns = serve_conns( [ [ resp ], [ plain( 'b' ) ] ] )
+        pool = ConnectionPool()
+
+        h = Http( '127.0.0.1', port, timeout=3, pool=pool )
+        h.request( '/' )
+        h.read_body( 10 )
+        self.assertEqual( {}, dict( [ ( k, v ) for k, v in pool.conns.items() if v ] ) )
+
+        h = Http( '127.0.0.1', port, timeout=3, pool=pool )
+        h.request( '/' )
+        self.assertEqual( False, h.reused )
+        self.assertEqual( 'b', h.read_body( 10 ) )
+
+        pool.clear()
+
+    def test_closed_by_peer_while_idle( self ):
+
+        port, conns = serve_conns( [ [ plain( 'a' ) ], [ plain( 'b' ) ] ] )
+        pool = ConnectionPool()
+
+        h = Http( '127.0.0.1', port, timeout=3, pool=pool )
+        h.request( '/' )
+        h.read_body( 10 )
+        self.assertEqual( 1, len( pool.conns[ ( '127.0.0.1', port ) ] ) )
+
+        # the connection is closed after one response
+        time.sleep( 0.1 )
+
+        h = Http( '127.0.0.1', port, timeout=3, pool=pool )
+        h.request( '/' )
+        self.assertEqual( False, h.reused )
+        self.assertEqual( 'b', h.read_body( 10 ) )
+
+        pool.clear()
+
+    def test_max_size_and_idle( self ):
+
+        ls = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+        ls.bind( ( '127.0.0.1', 0 ) )
+        ls.listen( 5 )
+        port = ls.getsockname()[ 1 ]
+
+        pool = ConnectionPool( max_size=2, max_idle=0.2 )
+        key = ( '127.0.0.1', port )
+
+        socks = [ pool.get( '127.0.0.1', port, 3 )[ 0 ] for ii in range( 3 ) ]
+        for s in socks:
+            pool.put( '127.0.0.1', port, s )
+
+        self.assertEqual( socks[ :2 ], [ s for s, ts in pool.conns[ key ] ] )
+
+        # the latest put is got first
+        s, reused = pool.get( '127.0.0.1', port, 3 )
+        self.assertEqual( ( socks[ 1 ], True ), ( s, reused ) )
+        pool.put( '127.0.0.1', port, s )
+
+        time.sleep( 0.3 )
+
+        s, reused = pool.get( '127.0.0.1', port, 3 )
+        self.assertEqual( False, reused )
+        self.assertEqual( [], pool.conns[ key ] )
+
+        _close( s )
+        pool.clear()
+        ls.close()
+
+class TestPipeline( unittest.TestCase ):
+
+    def test_in_order( self ):
+
+        def echo( uri ):
+            return plain( uri )
+
+        port, conns = serve_conns( [ [ echo ] * 3 ] )
+        pool = ConnectionPool()
+
+        h = Http( '127.0.0.1', port, timeout=3, pool=pool )
+        for uri in ( '/a', '/b', '/c' ):
+            h.pipeline_request( uri, body=uri )
+
+        for uri in ( '/a', '/b' ):
+            h.finish_request()
+            self.assertEqual( uri, h.read_body( 10 ) )
+
+            # not pooled while there are responses to read
+            self.assertEqual( [], pool.conns.get( ( '127.0.0.1', port ), [] ) )
+
+        h.finish_request()
+        self.assertEqual( '/c', h.read_body( 10 ) )
+
+        self.assertRaises( ResponseNotReady, h.finish_request )
+        self.assertEqual( [ [ '/a', '/b', '/c' ] ], conns )
+        self.assertEqual( 1, len( pool.conns[ ( '127.0.0.1', port ) ] ) )
+
+        pool.clear()
+
+    def test_body_not_read( self ):
+
+        port, conns = serve_conns( [ [ plain( 'abc' ), plain( 'd' ) ] ] )
+
+        h = Http( '127.0.0.1', port, timeout=3 )
+        h.pipeline_request( '/a' )
+        h.pipeline_request( '/b' )
+
+        h.finish_request()
+        self.assertEqual( 'a', h.read_body( 1 ) )
+        self.assertRaises( ResponseNotReady, h.finish_request )
+
+        self.assertEqual( 'bc', h.read_body( 10 ) )
+        h.finish_request()
+        self.assertEqual( 'd', h.read_body( 10 ) )
+
+        h.close()
+
+class TestPooledBody( unittest.TestCase ):
+
+    def _http( self, resps ):
+        port = serve( resps )
+        pool = ConnectionPool()
+        return Http( '127.0.0.1', port, timeout=3, pool=pool ), pool
+
+    def test_iter_body_to_eof( self ):
+
+        body = 'x' * 100000
+
+        for resp in ( plain( body ), chunked( body, 3000 ) ):
+
+            h, pool = self._http( [ resp ] )
+            h.request( '/' )
+
+            got = ''.join( [ b.tobytes() for b in h.iter_body( 4096 ) ] )
+            self.assertEqual( body, got )
+
+            # connection is in pool now
+            self.assertEqual( None, h.sock )
+            self.assertEqual( 1, len( pool.conns.values()[ 0 ] ) )
+
+            self.assertEqual( 0, h.read_body_into( bytearray( 10 ) ) )
+            self.assertEqual( '', h.read_body( 10 ) )
+            self.assertEqual( [], list( h.iter_body() ) )
+
+            pool.clear()
+
+    def test_read_body_into_to_eof( self ):
+
+        h, pool = self._http( [ plain( 'abc' ), plain( '' ) ] )
+
+        h.request( '/' )
+        buf = bytearray( 10 )
+        self.assertEqual( 3, h.read_body_into( buf ) )
+        self.assertEqual( 'abc', str( buf[ :3 ] ) )
+        self.assertEqual( 0, h.read_body_into( buf ) )
+
+        # the pooled connection is reused
+        h.request( '/' )
+        self.assertEqual( True, h.reused )
+        self.assertEqual( 0, h.read_body_into( buf ) )
+
+        pool.clear()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import json
+import socket
+import unittest
+
+from it.http import ConnectionPool
+from it.paxosclient import PaxosClient
+
+from http_test import serve_conns, plain, CLOSE, HANG
+
+def resp( ver ):
+    return plain( json.dumps( { 'ver': ver } ) )
+
+class TestHttp( unittest.TestCase ):
+
+    def setUp( self ):
+        self.pool = ConnectionPool()
+
+    def tearDown( self ):
+        self.pool.clear()
+
+    def _cli( self, port, timeout=3 ):
+        return PaxosClient( '127.0.0.1', port, 'x', '1', timeout=timeout, pool=self.pool )
+
+    def _get( self, cli ):
+        return cli.send_cmd( 'get', { 'key': 'foo' } )[ 'body' ]
+
+    def test_reuse( self ):
+
+        port, conns = serve_conns( [ [ resp( 1 ), resp( 2 ), resp( 3 ) ] ] )
+
+        for ver in ( 1, 2, 3 ):
+            # a new client uses the pooled connection too
+            self.assertEqual( { 'ver': ver }, self._get( self._cli( port ) ) )
+
+        self.assertEqual( 1, len( conns ) )
+        self.assertEqual( 3, len( conns[ 0 ] ) )
+
+    def test_retry_closed_pooled_connection( self ):
+
+        # the pooled connection is closed once the second request is received
+        port, conns = serve_conns( [ [ resp( 1 ), CLOSE ], [ resp( 2 ) ] ] )
+        cli = self._cli( port )
+
+        self.assertEqual( { 'ver': 1 }, self._get( cli ) )
+        self.assertEqual( { 'ver': 2 }, self._get( cli ) )
+        self.assertEqual( 2, len( conns ) )
+
+    def test_retry_once( self ):
+
+        port, conns = serve_conns( [ [ resp( 1 ), CLOSE ], [ CLOSE ], [ resp( 2 ) ] ] )
+        cli = self._cli( port )
+
+        self._get( cli )
+        self.assertRaises( socket.error, self._get, cli )
+        self.assertEqual( 2, len( conns ) )
+
+    def test_no_retry_on_new_connection( self ):
+
+        port, conns = serve_conns( [ [ CLOSE ], [ resp( 1 ) ] ] )
+
+        self.assertRaises( socket.error, self._get, self._cli( port ) )
+        self.assertEqual( 1, len( conns ) )
+
+    def test_no_retry_on_timeout( self ):
+
+        port, conns = serve_conns( [ [ resp( 1 ), HANG ], [ resp( 2 ) ] ] )
+        cli = self._cli( port, timeout=0.2 )
+
+        self._get( cli )
+        self.assertRaises( socket.timeout, self._get, cli )
+        self.assertEqual( 1, len( conns ) )
+
+def echo_ver( uri ):
+    # respond with ver in query
+    return resp( int( uri.split( 'ver=' )[ 1 ] ) )
+
+class TestSendMany( unittest.TestCase ):
+
+    def setUp( self ):
+        self.pool = ConnectionPool()
+
+    def tearDown( self ):
+        self.pool.clear()
+
+    def _cli( self, port ):
+        return PaxosClient( '127.0.0.1', port, 'x', '1', timeout=3, pool=self.pool )
+
+    def _cmds( self, n ):
+        return [ ( 'get', { 'key': 'foo', 'ver': i } ) for i in range( 1, n+1 ) ]
+
+    def test_in_order( self ):
+
+        for window in ( 1, 2, 64 ):
+
+            port, conns = serve_conns( [ [ echo_ver ] * 5 ] )
+
+            rsts = self._cli( port ).send_many( self._cmds( 5 ), window=window )
+            self.assertEqual( [ 1, 2, 3, 4, 5 ], [ r[ 'body' ][ 'ver' ] for r in rsts ],
+                              'window: %d' % window )
+            self.assertEqual( 1, len( conns ) )
+
+    def test_failure_after_yielded( self ):
+
+        # the pooled connection is closed at the 3rd request
+        port, conns = serve_conns( [ [ resp( 0 ), echo_ver, echo_ver, CLOSE ],
+                                     [ echo_ver ] * 4 ] )
+        cli = self._cli( port )
+        cli.send_cmd( 'get', { 'key': 'foo' } )
+
+        got = []
+        try:
+            for r in cli.send_many( self._cmds( 4 ) ):
+                got.append( r[ 'body' ][ 'ver' ] )
+            self.fail( 'expect socket.error' )
+        except socket.error:
+            pass
+
+        # results already yielded are not sent again
+        self.assertEqual( [ 1, 2 ], got )
+        self.assertEqual( 1, len( conns ) )
+
+    def test_retry_before_yielded( self ):
+
+        # the pooled connection is closed at the 1st request
+        port, conns = serve_conns( [ [ resp( 0 ), CLOSE ],
+                                     [ echo_ver ] * 3 ] )
+        cli = self._cli( port )
+        cli.send_cmd( 'get', { 'key': 'foo' } )
+
+        rsts = cli.send_many( self._cmds( 3 ) )
+        self.assertEqual( [ 1, 2, 3 ], [ r[ 'body' ][ 'ver' ] for r in rsts ] )
+        self.assertEqual( 2, len( conns ) )
+
+if __name__ == "__main__":
+    unittest.main()
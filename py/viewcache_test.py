@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+
+from it.paxosclient import ViewCache
+
+def leader_body( ver ):
+    return { 'ver': ver, 'key': 'leader', 'val': { 'ident': '1', '__lease': 10 } }
+
+class TestViewCache( unittest.TestCase ):
+
+    def _cached( self, cache ):
+        return cache.get_rst( 'x', 'get', { 'key': 'leader' } )
+
+    def test_set_evicts_leader( self ):
+
+        cache = ViewCache()
+        cache.update( 'x', 'get', { 'key': 'leader' }, leader_body( 3 ) )
+        self.assertEqual( 3, self._cached( cache )[ 'body' ][ 'ver' ] )
+
+        cache.update( 'x', 'set', { 'key': 'foo', 'val': 1 },
+                      { 'ver': 3, 'key': 'foo', 'val': 1 } )
+        self.assertIsNotNone( self._cached( cache ) )
+
+        cache.update( 'x', 'set', { 'key': 'foo', 'val': 1 },
+                      { 'ver': 4, 'key': 'foo', 'val': 1 } )
+        self.assertIsNone( self._cached( cache ) )
+
+    def test_mset_evicts_leader( self ):
+
+        cache = ViewCache()
+        cache.update( 'x', 'get', { 'key': 'leader' }, leader_body( 3 ) )
+
+        cache.update( 'x', 'mset', { 'fields': { 'foo': 1 } },
+                      { 'ver': 4, 'val': { 'foo': 1 } } )
+        self.assertIsNone( self._cached( cache ) )
+
+    def test_other_inst( self ):
+
+        def inst_of( key ):
+            if key.startswith( 'i/' ):
+                return 'i'
+            return None
+
+        cache = ViewCache( inst_of=inst_of )
+        cache.update( 'x', 'get', { 'key': 'leader' }, leader_body( 3 ) )
+
+        cache.update( 'x', 'set', { 'key': 'i/foo', 'val': 1 },
+                      { 'ver': 4, 'key': 'i/foo', 'val': 1 } )
+        cache.update( 'x', 'mset', { 'fields': { 'i/foo': 1, 'i/bar': 2 } },
+                      { 'ver': 5, 'val': {} } )
+        self.assertIsNotNone( self._cached( cache ), 'ver of another instance' )
+
+        cache.update( 'x', 'set', { 'key': 'foo', 'val': 1 },
+                      { 'ver': 4, 'key': 'foo', 'val': 1 } )
+        self.assertIsNone( self._cached( cache ) )
+
+    def test_invalidate( self ):
+
+        cache = ViewCache()
+        for cluster_id in ( 'x', 'y' ):
+            cache.update( cluster_id, 'get', { 'key': 'leader' }, leader_body( 4 ) )
+            cache.update( cluster_id, 'get', { 'key': 'view' },
+                          { 'ver': 4, 'key': 'view', 'val': [ { 'a': 1 } ] } )
+
+        def cached( cluster_id, key ):
+            return cache.get_rst( cluster_id, 'get', { 'key': key } )
+
+        cache.invalidate( 'x', 4 )
+        self.assertIsNotNone( cached( 'x', 'leader' ) )
+        self.assertIsNotNone( cached( 'x', 'view' ) )
+
+        # more than one entry removed at a time
+        cache.invalidate( 'x', 5 )
+        self.assertIsNone( cached( 'x', 'leader' ) )
+        self.assertIsNone( cached( 'x', 'view' ) )
+
+        cache.invalidate( 'y' )
+        self.assertIsNone( cached( 'y', 'leader' ) )
+        self.assertIsNone( cached( 'y', 'view' ) )
+
+if __name__ == '__main__':
+    unittest.main()